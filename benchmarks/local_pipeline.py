@@ -0,0 +1,433 @@
+"""Time the local, pure Python stages of a sync against synthetic vaults and remotes.
+
+    python benchmarks/local_pipeline.py --sizes 1000 10000 100000
+    python benchmarks/local_pipeline.py --compare <commit or results file>
+
+Results are saved to benchmarks/results/<commit>.json. Nothing is sent over the network,
+the remote model is built from synthetic list and detail JSON.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+RESULTS = os.path.join(ROOT, "benchmarks", "results")
+
+SHELVES = 10
+PAGES_PER_BOOK = 50
+CHAPTERS_PER_BOOK = 2
+# share of local pages which already exist remotely
+REMOTE_SHARE = 0.9
+# a ratio this much worse than the compared run is flagged
+REGRESSION = 1.2
+
+
+def git(*args: str) -> str:
+    try:
+        return subprocess.check_output(["git", *args], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def layout(pages: int) -> List[tuple]:
+    """(shelf, book, chapter or None, page) of every synthetic page"""
+    items = []
+
+    for i in range(pages):
+        book = i // PAGES_PER_BOOK
+        slot = i % PAGES_PER_BOOK
+        # half of every book's pages are spread over its chapters
+        chapter = slot % CHAPTERS_PER_BOOK if slot % 2 else None
+
+        items.append(
+            (
+                f"Shelf {book % SHELVES}",
+                f"Book {book}",
+                f"Chapter {chapter}" if chapter is not None else None,
+                f"Page {i}",
+            )
+        )
+
+    return items
+
+
+def body(i: int) -> str:
+    return (
+        f"Synthetic page {i}.\n\nSee [[Page {i + 1}]] and [[Page {max(i - 1, 0)}]].\n\n"
+        + "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 16
+        + "\n"
+    )
+
+
+def write_vault(path: str, pages: int):
+    """Write a synthetic vault once, it is reused by later runs"""
+    marker = os.path.join(path, ".complete")
+    if os.path.exists(marker):
+        return
+
+    for i, (shelf, book, chapter, page) in enumerate(layout(pages)):
+        folder = os.path.join(path, shelf, book, *([chapter] if chapter else []))
+        os.makedirs(folder, exist_ok=True)
+
+        with open(os.path.join(folder, page + ".md"), "w") as f:
+            f.write(body(i))
+
+    open(marker, "w").close()
+
+
+def remote_json(pages: int) -> Dict[str, List[Dict]]:
+    """Crawled entries of a synthetic remote, holding most of the vault's pages"""
+    stamp = "2024-01-01T00:00:00.000000Z"
+    shelves: Dict[str, Dict] = {}
+    books: Dict[str, Dict] = {}
+    chapters: Dict[tuple, Dict] = {}
+    entries: Dict[str, List[Dict]] = {
+        "shelf": [],
+        "book": [],
+        "chapter": [],
+        "page": [],
+    }
+    ids = iter(range(1, 10 * pages))
+
+    def entry(kind: str, name: str, fields: Dict) -> Dict:
+        slug = name.lower().replace(" ", "-")
+        item = {"id": next(ids), "name": name, "slug": slug, "updated_at": stamp}
+        item.update(fields)
+        entries[kind].append(item)
+        return item
+
+    for i, (shelf, book, chapter, page) in enumerate(layout(int(pages * REMOTE_SHARE))):
+        if shelf not in shelves:
+            shelves[shelf] = entry("shelf", shelf, {"books": []})
+
+        if book not in books:
+            books[book] = entry("book", book, {"contents": []})
+            shelves[shelf]["books"].append(
+                {"id": books[book]["id"], "name": book}
+            )
+
+        book_id = books[book]["id"]
+        fields = {"book_id": book_id, "chapter_id": 0}
+
+        if chapter:
+            key = (book, chapter)
+            if key not in chapters:
+                chapters[key] = entry(
+                    "chapter", chapter, {"book_id": book_id, "pages": []}
+                )
+                books[book]["contents"].append(
+                    {"type": "chapter", "name": chapter, "pages": []}
+                )
+            fields["chapter_id"] = chapters[key]["id"]
+
+        item = entry("page", page, fields)
+        summary = {"id": item["id"], "name": page}
+
+        if chapter:
+            chapters[(book, chapter)]["pages"].append(summary)
+            next(
+                c
+                for c in books[book]["contents"]
+                if c["type"] == "chapter" and c["name"] == chapter
+            )["pages"].append(summary)
+        else:
+            books[book]["contents"].append({"type": "page", **summary})
+
+    return entries
+
+
+def export_of(book) -> bytes:
+    """A book's markdown export, laid out like Bookstack's"""
+    from obsidian_to_bookstack.bookstack.export import book_sequence
+
+    content = f"# {book.name}\n\n".encode()
+
+    for name, id, separator in book_sequence(book) or []:
+        content += f"# {name}\n\n".encode()
+        if id is not None:
+            content += f"Page {id} body\n".encode() + b"\n" * separator
+
+    return content
+
+
+def measure(run: Callable, memory: bool) -> Dict:
+    gc.collect()
+
+    if memory:
+        tracemalloc.start()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {"peak_bytes": peak}
+
+    start = time.perf_counter()
+    run()
+    return {"seconds": time.perf_counter() - start}
+
+
+def bench(size: int, data: str, repeat: int) -> Dict[str, Dict]:
+    """Time every stage at one size, then measure its peak memory on a separate pass"""
+    from obsidian_to_bookstack.bookstack.bookstack import Bookstack
+    from obsidian_to_bookstack.bookstack.constants import BookstackItems
+    from obsidian_to_bookstack.bookstack.export import (book_sequence, split_export,
+                                                        strip_header)
+    from obsidian_to_bookstack.bookstack.links import LinkIndex
+    from obsidian_to_bookstack.bookstack.merkle import Diff, local_tree, remote_tree
+    from obsidian_to_bookstack.bookstack.moves import PageLinks, detect_moves, page_path
+    from obsidian_to_bookstack.obsidian import Vault
+    from obsidian_to_bookstack.utils import con_hash
+
+    path = os.path.join(data, f"vault-{size}")
+    write_vault(path, size)
+
+    b = Bookstack(path, [], verbose=False, scan_vault=False, crawl=False)
+    client = b.client
+    collector = b.page_collector
+    entries = remote_json(size)
+    payloads = [
+        json.dumps({"data": items[i : i + 500], "total": len(items)}).encode()
+        for items in entries.values()
+        for i in range(0, len(items), 500)
+    ]
+    state: Dict = {}
+
+    def scan_cold():
+        state["vault"] = Vault(path)
+        state["vault"].scan()
+
+    def scan_warm():
+        state["vault"].scan()
+
+    def vault_save_load():
+        b.vault = state["vault"]
+        b.vault._dirty = set(b.vault.entries)
+        b.vault.save()
+        Vault(path).load()
+
+    def local_artifacts():
+        b._refresh()
+        b.pages
+
+    def parse_remote():
+        for payload in payloads:
+            json.loads(payload)
+
+    def remote_artifacts():
+        for item in BookstackItems:
+            client.cache.items[item] = {}
+            client.cache.merge(item, entries[item.value])
+            client.cache.fresh.add(item)
+
+        client.shelves = client.shelf_collector.get_shelves()
+        client.books = client.book_collector.get_books(client.shelves)
+        client.pages = client.page_collector.get_pages(client.books)
+        client.chapters = client.chapter_collector.get_chapters(client.books)
+
+    def build_maps():
+        client.shelf_map = client._build_shelf_map()
+        client.book_map = client._build_book_map()
+        client.page_map = client._build_page_map()
+        client.chapter_map = client._build_chapter_map()
+
+    def map_lookups():
+        for page in b.pages:
+            try:
+                client._retrieve_from_client_map(page)
+            except KeyError:
+                pass
+
+    def merkle_diff():
+        diff = Diff(local_tree(b.vault, []), remote_tree(client, []))
+        for book in b.books:
+            diff.same(book.shelf.name, book.name)
+
+    def missing_diff():
+        for book in b.books:
+            client_book = client.book_map.get(con_hash(book.name + book.shelf.name))
+            b.chapter_collector.get_remote_missing_chapters(book, client_book)
+            collector.get_remote_missing_pages(book, client_book)
+
+    def detect():
+        links = PageLinks("", path)
+        remote = {page.details["id"]: page_path(page) for page in client.pages}
+        notes = [entry.path for entry in b.vault.notes()]
+        detect_moves(links, b.vault, remote, notes)
+
+    exports = []
+
+    def split_exports():
+        for book, content in exports:
+            split_export(content, book_sequence(book))
+
+    def strip_headers():
+        for content, name in state["pages"]:
+            strip_header(content, name)
+
+    def link_index():
+        notes = (entry.path[: -len(".md")] for entry in b.vault.notes())
+        state["index"] = LinkIndex.build(client.base_url, notes, client.pages)
+
+    def rewrite_links():
+        for content in state["contents"]:
+            state["index"].to_remote(content)
+
+    def prepare():
+        exports[:] = [(book, export_of(book)) for book in client.books]
+        names = {page.details["id"]: page.name for page in client.pages}
+        state["pages"] = [
+            (content, names[id])
+            for book, export in exports
+            for id, content in split_export(export, book_sequence(book)).items()
+        ]
+        state["contents"] = [page.content for page in b.pages[: max(size // 10, 1)]]
+
+    stages = [
+        ("vault scan, cold", scan_cold),
+        ("vault scan, warm", scan_warm),
+        ("vault index save and load", vault_save_load),
+        ("local artifacts", local_artifacts),
+        ("remote JSON parse", parse_remote),
+        ("remote artifacts", remote_artifacts),
+        ("build maps (con_hash)", build_maps),
+        ("map lookups", map_lookups),
+        ("merkle diff", merkle_diff),
+        ("missing diff", missing_diff),
+        ("move detection", detect),
+        (None, prepare),
+        ("split book exports", split_exports),
+        ("strip page headers", strip_headers),
+        ("link index build", link_index),
+        ("link rewriting, 10% of pages", rewrite_links),
+    ]
+    results: Dict[str, Dict] = {}
+
+    for memory in (False, True):
+        for name, run in stages:
+            if name is None:
+                run()
+                continue
+
+            runs = [measure(run, memory) for _ in range(1 if memory else repeat)]
+            result = results.setdefault(name, {})
+
+            if memory:
+                result.update(runs[0])
+            else:
+                result["seconds"] = min(r["seconds"] for r in runs)
+
+    return results
+
+
+def load_results(ref: str) -> Dict | None:
+    if os.path.exists(ref):
+        path = ref
+    else:
+        path = os.path.join(RESULTS, f"{git('rev-parse', '--short', ref) or ref}.json")
+
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def report(results: Dict, baseline: Dict | None) -> int:
+    """Print a table per size, returns the number of regressions"""
+    from rich.console import Console
+    from rich.table import Table
+
+    console = Console()
+    regressions = 0
+
+    for size, stages in results["sizes"].items():
+        before = (baseline or {}).get("sizes", {}).get(size, {})
+        title = f"{int(size):,} pages"
+        if baseline:
+            title += f", against {baseline['commit']}"
+
+        table = Table("Stage", "Time", "Peak memory", "Time ratio", title=title)
+
+        for name, result in stages.items():
+            ratio = ""
+            if name in before and before[name]["seconds"] > 0:
+                value = result["seconds"] / before[name]["seconds"]
+                ratio = f"{value:.2f}x"
+
+                if value >= REGRESSION:
+                    ratio = f"[bold red]{ratio}[/bold red]"
+                    regressions += 1
+                elif value <= 1 / REGRESSION:
+                    ratio = f"[green]{ratio}[/green]"
+
+            table.add_row(
+                name,
+                f"{result['seconds'] * 1000:.1f} ms",
+                f"{result['peak_bytes'] / 2**20:.1f} MiB",
+                ratio,
+            )
+
+        console.print(table)
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per stage")
+    parser.add_argument(
+        "--data",
+        default=os.path.join(tempfile.gettempdir(), "obsidian_to_bookstack_bench"),
+        help="Where synthetic vaults and the benchmark database are kept",
+    )
+    parser.add_argument("--compare", help="Commit or results file to compare against")
+    parser.add_argument("--no-save", action="store_true", help="Don't save the results")
+    args = parser.parse_args()
+
+    os.makedirs(args.data, exist_ok=True)
+    # a database of its own, the real one is left alone
+    from obsidian_to_bookstack.sqllite import DatabaseFunctions as dbf
+
+    dbf.DATA_PATH = args.data
+    os.environ["BOOKSTACK_BASE_URL"] = "http://bookstack.invalid"
+
+    baseline = load_results(args.compare) if args.compare else None
+    if args.compare and baseline is None:
+        parser.error(f"No saved results for {args.compare}")
+
+    commit = git("rev-parse", "--short", "HEAD") or "unknown"
+    if git("status", "--porcelain", "--", "obsidian_to_bookstack"):
+        commit += "-dirty"
+
+    results = {
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "sizes": {},
+    }
+
+    for size in args.sizes:
+        print(f"Benchmarking {size:,} pages...", file=sys.stderr)
+        results["sizes"][str(size)] = bench(size, args.data, args.repeat)
+
+    if not args.no_save:
+        os.makedirs(RESULTS, exist_ok=True)
+        with open(os.path.join(RESULTS, f"{results['commit']}.json"), "w") as f:
+            json.dump(results, f, indent=2)
+
+    sys.exit(1 if report(results, baseline) else 0)
+
+
+if __name__ == "__main__":
+    main()
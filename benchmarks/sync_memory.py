@@ -0,0 +1,363 @@
+"""Sync a synthetic vault into an empty Bookstack under a fixed memory cap.
+
+    python benchmarks/sync_memory.py --notes 200000 --cap 1024
+
+The vault is synced twice, each time in a process whose address space is capped with
+RLIMIT_AS: the first run creates every shelf, book, chapter and page, the second must
+find nothing left to do. The remote is an in-memory stand-in for Bookstack's API,
+served from a process of its own so it isn't counted against the cap. Exits non-zero
+if either run fails or leaves the remote out of step with the vault.
+"""
+
+import argparse
+import email
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import resource
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qsl, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from local_pipeline import write_vault  # noqa: E402
+
+FILTER = re.compile(r"filter\[(\w+)(?::(\w+))?\]")
+OPERATORS = {
+    "eq": lambda a, b: a == b,
+    "gt": lambda a, b: a > b,
+    "gte": lambda a, b: a >= b,
+    "lt": lambda a, b: a < b,
+    "lte": lambda a, b: a <= b,
+}
+
+
+class Remote:
+    """Shelves, books, chapters and pages as Bookstack's API reports them, without
+    page content, which the benchmark never reads back"""
+
+    def __init__(self) -> None:
+        self.items: Dict[str, Dict[int, Dict]] = {
+            "shelves": {},
+            "books": {},
+            "chapters": {},
+            "pages": {},
+        }
+        self.shelf_books: Dict[int, List[int]] = {}
+        self.book_contents: Dict[int, List[Dict]] = {}
+        self.chapter_pages: Dict[int, List[Dict]] = {}
+        self.ids = itertools.count(1)
+        self.writes = 0
+        self.lock = threading.Lock()
+
+    def stamp(self) -> str:
+        return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+    def listing(self, kind: str, params: List[tuple]) -> Dict:
+        items = self.items[kind].values()
+
+        for name, value in params:
+            if match := FILTER.fullmatch(name):
+                field, operator = match.group(1), OPERATORS[match.group(2) or "eq"]
+                items = [
+                    item
+                    for item in items
+                    if operator(item[field], type(item[field])(value))
+                ]
+
+        options = dict(params)
+        if "sort" in options:
+            field = options["sort"].lstrip("+-")
+            items = sorted(
+                items, key=lambda item: item[field], reverse=options["sort"][0] == "-"
+            )
+
+        offset = int(options.get("offset", 0))
+        count = min(int(options.get("count", 100)), 500)
+        data = list(itertools.islice(items, offset, offset + count))
+
+        return {"data": data, "total": len(items)}
+
+    def create(self, kind: str, data: Dict) -> Dict:
+        stamp = self.stamp()
+        name = data["name"]
+        item = {
+            "id": next(self.ids),
+            "name": name,
+            "slug": re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-"),
+            "created_at": stamp,
+            "updated_at": stamp,
+        }
+
+        if kind == "shelves":
+            self.shelf_books[item["id"]] = [int(id) for id in data.get("books", [])]
+        if kind == "books":
+            item["description"] = ""
+            self.book_contents[item["id"]] = []
+        if kind == "chapters":
+            item["book_id"] = int(data["book_id"])
+            self.chapter_pages[item["id"]] = []
+            entry = {"id": item["id"], "name": name, "slug": item["slug"]}
+            self.book_contents[item["book_id"]].append({**entry, "type": "chapter"})
+        if kind == "pages":
+            chapter = int(data.get("chapter_id") or 0)
+            book = self.items["chapters"][chapter]["book_id"] if chapter else None
+            item.update(
+                book_id=book or int(data["book_id"]),
+                chapter_id=chapter,
+                draft=False,
+                revision_count=1,
+            )
+            summary = {"id": item["id"], "name": name, "slug": item["slug"]}
+
+            if chapter:
+                self.chapter_pages[chapter].append(summary)
+            else:
+                self.book_contents[item["book_id"]].append({**summary, "type": "page"})
+
+        self.items[kind][item["id"]] = item
+        return item
+
+    def details(self, kind: str, id: int) -> Dict:
+        details = dict(self.items[kind][id])
+
+        if kind == "shelves":
+            books = self.items["books"]
+            details["books"] = [
+                {"id": book, "name": books[book]["name"], "slug": books[book]["slug"]}
+                for book in self.shelf_books[id]
+                if book in books
+            ]
+        if kind == "books":
+            details["contents"] = [
+                {**entry, "pages": self.chapter_pages[entry["id"]]}
+                if entry["type"] == "chapter"
+                else entry
+                for entry in self.book_contents[id]
+            ]
+        if kind == "chapters":
+            details["pages"] = self.chapter_pages[id]
+
+        return details
+
+    def update(self, kind: str, id: int, data: Dict) -> Dict:
+        item = self.items[kind][id]
+
+        if kind == "shelves" and "books" in data:
+            self.shelf_books[id] = [int(book) for book in data["books"]]
+
+        for field in ("name", "description"):
+            if field in data:
+                item[field] = data[field]
+
+        item["updated_at"] = self.stamp()
+        return item
+
+
+def parse_body(headers, body: bytes) -> Dict:
+    """Fields of a JSON or multipart form request"""
+    content_type = headers.get("Content-Type", "")
+
+    if not content_type.startswith("multipart/"):
+        return json.loads(body) if body else {}
+
+    form = email.message_from_bytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + body
+    )
+    fields: Dict = {}
+
+    for part in form.get_payload():
+        name = part.get_param("name", header="content-disposition")
+        value = part.get_payload(decode=True).decode()
+
+        # repeated fields, like a shelf's `books[]`, become lists
+        if name.endswith("[]"):
+            fields.setdefault(name[:-2], []).append(value)
+        else:
+            fields[name] = value
+
+    return fields
+
+
+def serve(port: int, ready):
+    remote = Remote()
+
+    class Handler(BaseHTTPRequestHandler):
+        def respond(self, status: int, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def handle_method(self, method: str):
+            url = urlsplit(self.path)
+            parts = url.path.strip("/").split("/")
+            length = int(self.headers.get("Content-Length") or 0)
+            data = parse_body(self.headers, self.rfile.read(length))
+
+            with remote.lock:
+                if parts == ["stats"]:
+                    counts = {kind: len(items) for kind, items in remote.items.items()}
+                    return self.respond(200, {"writes": remote.writes, **counts})
+
+                kind = parts[1]
+                if method != "GET":
+                    remote.writes += 1
+
+                if len(parts) == 2 and method == "GET":
+                    return self.respond(200, remote.listing(kind, parse_qsl(url.query)))
+                if len(parts) == 2 and method == "POST":
+                    return self.respond(200, remote.create(kind, data))
+
+                id = int(parts[2])
+                if id not in remote.items[kind]:
+                    return self.respond(404, {"error": {"message": "Not found"}})
+                if method == "GET":
+                    return self.respond(200, remote.details(kind, id))
+                if method == "PUT":
+                    return self.respond(200, remote.update(kind, id, data))
+
+                self.respond(405, {"error": {"message": "Not supported"}})
+
+        def do_GET(self):
+            self.handle_method("GET")
+
+        def do_POST(self):
+            self.handle_method("POST")
+
+        def do_PUT(self):
+            self.handle_method("PUT")
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    ready.set()
+    server.serve_forever()
+
+
+def sync(data: str, cap: int, results):
+    """One `sync` in this process, with its address space capped at `cap` bytes"""
+    resource.setrlimit(resource.RLIMIT_AS, (cap, cap))
+
+    # a database of its own, the real one is left alone
+    from obsidian_to_bookstack.sqllite import DatabaseFunctions as dbf
+
+    dbf.DATA_PATH = data
+
+    from obsidian_to_bookstack.__main__ import cli
+
+    config = os.path.join(data, "config.toml")
+    start = time.perf_counter()
+
+    try:
+        cli.main(["-c", config, "--no-daemon", "sync"], standalone_mode=False)
+    except BaseException as e:
+        results.put({"ok": False, "error": repr(e)})
+        raise
+
+    results.put(
+        {
+            "ok": True,
+            "seconds": time.perf_counter() - start,
+            # kilobytes on Linux
+            "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        }
+    )
+
+
+def stats(port: int) -> Dict:
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/stats") as resp:
+        return json.loads(resp.read())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=200000)
+    parser.add_argument("--cap", type=int, default=1024, help="Memory cap in MiB")
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument(
+        "--data",
+        default=os.path.join(tempfile.gettempdir(), "obsidian_to_bookstack_bench"),
+        help="Where synthetic vaults are kept",
+    )
+    args = parser.parse_args()
+
+    os.makedirs(args.data, exist_ok=True)
+    vault = os.path.join(args.data, f"vault-{args.notes}")
+    run_data = tempfile.mkdtemp(prefix="sync-memory-", dir=args.data)
+    print(f"Writing a vault of {args.notes:,} notes...", file=sys.stderr)
+    write_vault(vault, args.notes)
+
+    with open(os.path.join(run_data, "config.toml"), "w") as f:
+        f.write(f'[wiki]\npath = "{vault}"\n[wiki.excluded]\nshelves = []\n')
+
+    os.environ.update(
+        BOOKSTACK_BASE_URL=f"http://127.0.0.1:{args.port}",
+        BOOKSTACK_TOKEN_ID="benchmark",
+        BOOKSTACK_TOKEN_SECRET="benchmark",
+        # an arena per thread reserves address space it mostly never uses
+        MALLOC_ARENA_MAX="2",
+    )
+
+    context = multiprocessing.get_context("spawn")
+    ready = context.Event()
+    server = context.Process(target=serve, args=(args.port, ready), daemon=True)
+    server.start()
+    ready.wait()
+
+    cap = args.cap * 2**20
+    failures = []
+
+    runs = (("first sync", "every note created"), ("second sync", "no writes"))
+
+    for run, expect in runs:
+        results = context.Queue()
+        process = context.Process(target=sync, args=(run_data, cap, results))
+        writes = stats(args.port)["writes"]
+
+        print(f"Running the {run} under {args.cap} MiB...", file=sys.stderr)
+        process.start()
+        process.join()
+
+        result = results.get() if not results.empty() else {"ok": False}
+        remote = stats(args.port)
+
+        if not result["ok"] or process.exitcode:
+            failures.append(f"{run} failed: {result.get('error', process.exitcode)}")
+            break
+
+        made = remote["writes"] - writes
+        print(
+            f"{run}: {result['seconds']:.1f} s, peak RSS "
+            f"{result['peak_rss'] / 2**20:.0f} MiB, {made:,} writes"
+        )
+
+        if expect == "every note created" and remote["pages"] != args.notes:
+            created = f"{remote['pages']:,} of {args.notes:,}"
+            failures.append(f"{run} created {created} pages")
+        if expect == "no writes" and made:
+            failures.append(f"{run} made {made:,} writes")
+
+    server.terminate()
+
+    for failure in failures:
+        print(failure, file=sys.stderr)
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,62 +1,362 @@
 import click
 
-from .bookstack.bookstack import Bookstack, BookstackItems
-from .config import load_env, load_toml
-from .console import console
-from .sqllite import DatabaseFunctions as dbf
+# Heavier modules (rich, urllib3, the collectors) are imported inside the
+# commands, so `--help` and usage errors return without loading them.
 
 
-@click.group()
-@click.option("-v", "--verbose", is_flag=True, help="Show verbose logs")
-@click.option("-c", "--config", required=False, help="Specify config file to load from")
-@click.option("-e", "--env", required=False, help="Specify env file to load from")
-@click.pass_context
-def cli(ctx, verbose, config="", env=""):
-    dbf.init_db()
-    load_env(env)
-    toml = load_toml(config)
+def load_settings(ctx):
+    """Load the env and config files, returns the vault path, excluded shelves and
+    ignore rules"""
+    from .config import load_env, load_ignore, load_toml
+    from .console import console
+    from .targets import load_target_env
+
+    options = ctx.find_root().obj
+
+    load_env(options["env"])
+    toml = load_toml(options["config"])
 
     assert toml is not None
 
     path = toml["wiki"]["path"]
     excluded = toml["wiki"]["excluded"]["shelves"]
+    ignore = load_ignore(toml["wiki"]["excluded"])
+
+    if targets := get_targets(ctx, toml):
+        if len(targets) > 1:
+            raise click.UsageError(
+                "Only sync, remote, local and update run against several targets"
+            )
+
+        target = targets[0]
+        load_target_env(target)
+        path, excluded, ignore = target["path"], target["excluded"], target["ignore"]
 
     console.log(f"Looking at Obsidian Vault at: [bold blue]{path}[/bold blue]")
 
     if excluded:
         console.log(f"Excluding shelves: [bold blue]{excluded}[/bold blue]")
 
-    with console.status("Building client..."):
-        b = Bookstack(path, excluded, verbose=verbose)
-        ctx.obj = {"bookstack": b}
+    if ignore["patterns"]:
+        console.log(f"Ignoring: [bold blue]{ignore['patterns']}[/bold blue]")
+
+    return path, excluded, ignore
+
+
+def get_targets(ctx, toml):
+    """The configured targets picked with `--target` or `--all-targets`"""
+    from .targets import load_targets
+
+    options = ctx.find_root().obj
+    targets = load_targets(toml)
+
+    if options["all_targets"]:
+        if not targets:
+            raise click.UsageError("No targets are configured under [targets]")
+
+        return list(targets.values())
+
+    for name in options["targets"]:
+        if name not in targets:
+            raise click.UsageError(f"No target named {name!r} under [targets]")
+
+    return [targets[name] for name in options["targets"]]
+
+
+def fan_out(ctx, command: str) -> bool:
+    """Run a command against several targets at once, returns whether it did"""
+    from rich.table import Table
+
+    from .config import load_env, load_toml
+    from .console import console
+    from .events import events
+    from .targets import fan_out as run_targets
+
+    options = ctx.find_root().obj
+
+    if not options["all_targets"] and len(options["targets"]) < 2:
+        return False
+
+    load_env(options["env"])
+    toml = load_toml(options["config"])
+    assert toml is not None
+
+    targets = get_targets(ctx, toml)
+    if len(targets) < 2:
+        return False
+
+    label = f"Running {command} against {len(targets)} targets..."
+
+    with events.phase(command, label):
+        summaries = run_targets(targets, command, options)
+
+    table = Table("Target", "Instance", "Result", "Created", "Updated", "Requests", "Time")
+    for summary in summaries:
+        requests = summary["requests"]
+        table.add_row(
+            summary["target"],
+            summary["instance"],
+            "[green]ok[/green]" if summary["ok"] else "[red]failed[/red]",
+            str(requests.get("POST", 0)),
+            str(requests.get("PUT", 0)),
+            str(sum(requests.values())),
+            f"{summary['seconds']:.1f}s",
+        )
+
+    console.print(table)
+
+    for summary in summaries:
+        if not summary["ok"]:
+            console.print(f"[red]{summary['target']}[/red]: {summary['error']}")
+
+    if not all(summary["ok"] for summary in summaries):
+        ctx.exit(1)
+
+    return True
+
+
+def settings_files(options) -> dict:
+    """The config and env files a command loads, as absolute paths"""
+    import os
+
+    from .config import config_path, env_path
+
+    return {
+        "config": os.path.abspath(config_path(options["config"])),
+        "env": os.path.abspath(env_path(options["env"])),
+    }
+
+
+def forward(ctx, command: str, **args) -> bool:
+    """Hand a command to a running `serve` daemon, returns whether it ran it"""
+    import sys
+
+    from .daemon import request
+
+    options = ctx.find_root().obj
+
+    # anything the daemon wasn't started with runs in this process
+    if any(
+        options[option]
+        for option in (
+            "no_daemon",
+            "targets",
+            "all_targets",
+            "full_crawl",
+            "audit_log",
+            "events",
+            "trace",
+            "profile",
+            "profile_memory",
+        )
+    ):
+        return False
+
+    if options["jobs"] > 1:
+        return False
+
+    response = request({"command": command, "args": args, **settings_files(options)})
+
+    if not response or not response["served"]:
+        return False
+
+    sys.stdout.write(response["output"])
+
+    if not response["ok"]:
+        raise click.ClickException(response["error"])
+
+    return True
+
+
+def get_bookstack(ctx, scan_vault: bool = True, crawl: bool = True):
+    """Build the client the first time a command asks for it"""
+    from .bookstack.bookstack import Bookstack
+    from .events import events
+
+    options = ctx.find_root().obj
+
+    if options.get("bookstack"):
+        return options["bookstack"]
+
+    path, excluded, ignore = load_settings(ctx)
+
+    with events.phase("client", "Building client..."):
+        b = Bookstack(
+            path,
+            excluded,
+            verbose=options["verbose"],
+            full_crawl=options["full_crawl"],
+            audit_log=options["audit_log"],
+            scan_vault=scan_vault,
+            crawl=crawl,
+            ignore=ignore,
+        )
+        options["bookstack"] = b
+
+    return b
+
+
+def get_shards(ctx):
+    """Processes which sync a share of the shelves each, if `--jobs` asks for them"""
+    from .bookstack.shards import Shards
+
+    options = ctx.find_root().obj
+
+    if options["jobs"] < 2:
+        return None
+
+    # the vault is scanned a shard at a time as well
+    b = get_bookstack(ctx, scan_vault=False)
+    shards = ctx.with_resource(Shards(b, options["jobs"]))
+    shards.scan()
+    return shards
+
+
+@click.group()
+@click.option("-v", "--verbose", is_flag=True, help="Show verbose logs")
+@click.option("-c", "--config", required=False, help="Specify config file to load from")
+@click.option("-e", "--env", required=False, help="Specify env file to load from")
+@click.option(
+    "--full-crawl",
+    is_flag=True,
+    help="Ignore the cached remote model and crawl every remote item",
+)
+@click.option(
+    "--audit-log",
+    is_flag=True,
+    help="Follow Bookstack's audit log for remote changes instead of listing them",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Sync shelves across this many processes",
+)
+@click.option(
+    "-t",
+    "--target",
+    "targets",
+    multiple=True,
+    help="Run against a target configured under [targets], can be repeated",
+)
+@click.option(
+    "--all-targets", is_flag=True, help="Run against every configured target at once"
+)
+@click.option(
+    "--no-daemon", is_flag=True, help="Run in this process even if `serve` is running"
+)
+@click.option(
+    "--events",
+    "events_path",
+    required=False,
+    help="Write progress events as JSON lines to this file",
+)
+@click.option(
+    "--events-fd",
+    type=int,
+    required=False,
+    help="Write progress events as JSON lines to this open file descriptor",
+)
+@click.option(
+    "--trace",
+    required=False,
+    help="Write a timeline of phases and requests to this file, for Perfetto",
+)
+@click.option("--profile", is_flag=True, help="Print the slowest functions at exit")
+@click.option(
+    "--profile-memory",
+    is_flag=True,
+    help="Print what allocated the most memory during each phase",
+)
+@click.pass_context
+def cli(
+    ctx,
+    verbose,
+    config="",
+    env="",
+    full_crawl=False,
+    audit_log=False,
+    jobs=1,
+    targets=(),
+    all_targets=False,
+    no_daemon=False,
+    events_path=None,
+    events_fd=None,
+    trace=None,
+    profile=False,
+    profile_memory=False,
+):
+    from .events import events
+    from .trace import print_profile, tracer
+
+    file = None
+    if events_path:
+        file = ctx.with_resource(open(events_path, "w"))
+    elif events_fd is not None:
+        file = ctx.with_resource(open(events_fd, "w", closefd=False))
+
+    events.open(file, verbose)
+    ctx.call_on_close(events.close)
+
+    tracer.open(trace, memory=profile_memory)
+    ctx.call_on_close(tracer.close)
+
+    if profile:
+        import cProfile
+
+        # only this thread is profiled, worker threads' requests show up as waits
+        profiler = cProfile.Profile()
+        profiler.enable()
+        ctx.call_on_close(lambda: print_profile(profiler))
+
+    # the client is built lazily by the commands which need it
+    ctx.obj = {
+        "verbose": verbose,
+        "config": config,
+        "env": env,
+        "full_crawl": full_crawl,
+        "audit_log": audit_log,
+        "jobs": jobs,
+        "targets": targets,
+        "all_targets": all_targets,
+        "no_daemon": no_daemon,
+        "events": file,
+        "trace": trace,
+        "profile": profile,
+        "profile_memory": profile_memory,
+    }
 
 
 @cli.command(help="Call `local` and `remote`")
 @click.pass_context
 def sync(ctx):
-    b = ctx.obj.get("bookstack")
+    if fan_out(ctx, "sync") or forward(ctx, "sync"):
+        return
 
-    with console.status("Downloading any missing files..."):
-        b.sync_local()
-
-    with console.status("Uploading missing files to remote..."):
-        b.sync_remote()
+    b = get_shards(ctx) or get_bookstack(ctx)
+    b.sync_local()
+    b.sync_remote()
 
 
 @cli.command(help="Upload any missing files to Bookstack")
 @click.pass_context
 def remote(ctx):
-    with console.status("Uploading missing files to remote..."):
-        b: Bookstack = ctx.obj.get("bookstack")
-        b.sync_remote()
+    if fan_out(ctx, "remote") or forward(ctx, "remote"):
+        return
+
+    b = get_shards(ctx) or get_bookstack(ctx)
+    b.sync_remote()
 
 
 @cli.command(help="Download any missing files into the Obsidian Vault")
 @click.pass_context
 def local(ctx):
-    b = ctx.obj.get("bookstack")
-    with console.status("Downloading any missing files..."):
-        b.sync_local()
+    if fan_out(ctx, "local") or forward(ctx, "local"):
+        return
+
+    b = get_shards(ctx) or get_bookstack(ctx)
+    b.sync_local()
 
 
 @cli.command(help="Update files in Bookstack or Obsidian")
@@ -75,44 +375,204 @@ def local(ctx):
     is_flag=True,
     help="Update local pages from from copies",
 )
-def update(ctx, remote, local):
-    b = ctx.obj.get("bookstack")
-    if not any([remote, local]):
-        raise click.UsageError("Please provide at least one of --remote or --local")
-    if remote:
-        with console.status("Updating remote files..."):
-            b.update_remote(remote=True, local=False)
-    elif local:
-        with console.status("Updating local files..."):
-            b.update_remote(remote=False, local=True)
+@click.option(
+    "-b",
+    "--both",
+    is_flag=True,
+    help="Update whichever side of each page is older, in one pass",
+)
+@click.option(
+    "--conflicts",
+    type=click.Choice(["keep-both", "local", "remote", "skip"]),
+    default="keep-both",
+    show_default=True,
+    help="With --both, what to do with pages changed on both sides",
+)
+def update(ctx, remote, local, both, conflicts):
+    if not any([remote, local, both]):
+        raise click.UsageError("Please provide one of --remote, --local or --both")
+
+    # --both wins, then --remote, when several are given
+    if both:
+        remote, local = True, True
+    else:
+        remote, local = bool(remote), not remote
+
+    ctx.find_root().obj["conflicts"] = conflicts
+    command = "update-both" if both else "update-remote" if remote else "update-local"
 
+    if fan_out(ctx, command):
+        return
 
-@cli.command(help="Delete Bookstack and Obsidian object")
+    if forward(ctx, "update", remote=remote, local=local, conflicts=conflicts):
+        return
+
+    from .bookstack.constants import ConflictPolicy
+
+    b = get_bookstack(ctx)
+    b.update_remote(remote=remote, local=local, conflicts=ConflictPolicy(conflicts))
+
+
+@cli.command(help="Delete Bookstack and Obsidian objects")
 @click.pass_context
-@click.argument("path", required=True)
-@click.option("--shelf", is_flag=True, help="Delete a shelf")
-@click.option("--book", is_flag=True, help="Delete a book")
-@click.option("--chapter", is_flag=True, help="Delete a chapter")
-@click.option("--page", is_flag=True, help="Delete a page")
-def delete(ctx, path, shelf, book, chapter, page):
-    b = ctx.obj.get("bookstack")
+@click.argument("paths", nargs=-1, required=True)
+@click.option("--shelf", is_flag=True, help="Delete shelves")
+@click.option("--book", is_flag=True, help="Delete books")
+@click.option("--chapter", is_flag=True, help="Delete chapters")
+@click.option("--page", is_flag=True, help="Delete pages")
+def delete(ctx, paths, shelf, book, chapter, page):
+    from .bookstack.constants import BookstackItems
+    from .events import events
+
     if not any([shelf, book, chapter, page]):
         raise click.UsageError(
             "Please provide at least one of --shelf, --book, --chapter, or --page"
         )
 
     if shelf:
-        with console.status(f"Deleting shelf at {path}"):
-            b.delete(BookstackItems.SHELF, path)
+        arg = BookstackItems.SHELF
     elif book:
-        with console.status(f"Deleting book at {path}"):
-            b.delete(BookstackItems.BOOK, path)
+        arg = BookstackItems.BOOK
     elif chapter:
-        with console.status(f"Deleting chapter at {path}"):
-            b.delete(BookstackItems.CHAPTER, path)
-    elif page:
-        with console.status(f"Deleting page at {path}"):
-            b.delete(BookstackItems.PAGE, path)
+        arg = BookstackItems.CHAPTER
+    else:
+        arg = BookstackItems.PAGE
+
+    if forward(ctx, "delete", item=arg.value, paths=list(paths)):
+        return
+
+    # deleting only looks up its targets, it needs neither a crawl nor the vault's contents
+    b = get_bookstack(ctx, scan_vault=False, crawl=False)
+
+    with events.phase("delete", f"Deleting {arg.value} at {', '.join(paths)}"):
+        b.delete(arg, list(paths))
+
+
+@cli.command(help="Upload notes, given relative to the vault, to their Bookstack pages")
+@click.pass_context
+@click.argument("paths", nargs=-1, required=True)
+def push(ctx, paths):
+    from .events import events
+
+    if forward(ctx, "push", paths=list(paths)):
+        return
+
+    b = get_bookstack(ctx, scan_vault=False)
+
+    with events.phase("push", "Uploading notes...", total=len(paths), kind="page"):
+        b.push(list(paths))
+
+
+@cli.command(help="Keep the models warm and serve commands over a local socket")
+@click.pass_context
+def serve(ctx):
+    from .console import console
+    from .daemon import SOCKET_PATH, Daemon
+    from .events import events
+
+    options = ctx.find_root().obj
+    b = get_bookstack(ctx)
+
+    # requests' output is captured and sent back, a spinner would garble it
+    events.open(options["events"], options["verbose"], status=False)
+
+    console.log(f"Serving on [bold blue]{SOCKET_PATH}[/bold blue]")
+
+    try:
+        Daemon(b, settings_files(options)).serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+@cli.command(help="Pull remote changes as Bookstack's webhooks report them")
+@click.pass_context
+@click.option("--host", default="127.0.0.1", show_default=True, help="Address to bind")
+@click.option("--port", default=8766, show_default=True, help="Port to listen on")
+@click.option(
+    "--token",
+    help="Token webhook URLs must carry. Defaults to $BOOKSTACK_WEBHOOK_TOKEN, or a new one each start",
+)
+def listen(ctx, host, port, token):
+    from .console import console
+    from .events import events
+    from .listen import WEBHOOK_PATH, Listener, webhook_token
+
+    options = ctx.find_root().obj
+    b = get_bookstack(ctx)
+    token = webhook_token(token)
+
+    # bursts are applied in the background, a spinner would sit over the log
+    events.open(options["events"], options["verbose"], status=False)
+
+    console.log(
+        f"Listening on [bold blue]http://{host}:{port}{WEBHOOK_PATH}?token={token}[/bold blue]"
+    )
+
+    try:
+        Listener(b, token).serve_forever(host, port)
+    except KeyboardInterrupt:
+        pass
+
+
+@cli.command(help="Search the vault and the last crawled remote pages")
+@click.pass_context
+@click.argument("query", nargs=-1, required=True)
+@click.option(
+    "-n", "--limit", default=20, show_default=True, help="Maximum number of results"
+)
+def search(ctx, query, limit):
+    import os
+
+    import urllib3
+    from rich.markup import escape
+
+    from .console import console
+    from .obsidian import Vault
+    from .search import SearchIndex
+
+    path, _, ignore = load_settings(ctx)
+    index = SearchIndex()
+
+    with console.status("Updating search index..."):
+        vault = Vault(path, ignore)
+        vault.load()
+        vault.scan()
+        vault.save()
+
+        written = index.update_local(vault)
+
+        if base_url := os.getenv("BOOKSTACK_BASE_URL"):
+            from .bookstack.bookstack import BookstackClient
+
+            # only pages changed since they were last indexed are fetched
+            client = BookstackClient(verbose=False, crawl=False)
+
+            try:
+                written += index.update_remote(base_url, client._get_book_bodies)
+            except urllib3.exceptions.HTTPError:
+                console.log(
+                    "Couldn't reach Bookstack, changed remote pages weren't reindexed"
+                )
+
+    if ctx.find_root().obj["verbose"]:
+        console.log(f"Reindexed {written} documents")
+
+    hits = index.search(" ".join(query), limit)
+    shown = set()
+
+    for location, source, snippet in hits:
+        # a synced page is in both the vault and the remote, show it once
+        if location in shown:
+            continue
+        shown.add(location)
+
+        snippet = escape(snippet.replace("\n", " "))
+        snippet = snippet.replace("\x02", "[bold]").replace("\x03", "[/bold]")
+        console.print(f"[bold blue]{escape(location)}[/bold blue] [dim]({source})[/dim]")
+        console.print(f"    {snippet}")
+
+    if not hits:
+        console.print("No results")
 
 
 def main():
@@ -1,6 +1,7 @@
 import os
 from typing import Dict, List
 
+from ..obsidian.Vault import FOLDER, NOTE, Vault
 from .client import Client
 
 
@@ -12,10 +13,12 @@ class Shelf:
         from_client: bool = True,
         path: str = "",
         details: Dict = {},
+        vault: Vault | None = None,
     ) -> None:
         self.path = path
         self.name = name
         self.client = client
+        self.vault = vault
         if from_client:
             self.books = []
         else:
@@ -27,17 +30,17 @@ class Shelf:
         return self.name
 
     def _set_books(self):
+        assert self.vault
         books = []
-        for book in os.listdir(self.path):
-            if os.path.isdir(os.path.join(self.path, book)) and not book.startswith(
-                "."
-            ):
+        for entry in self.vault.children(self.path):
+            if entry.kind == FOLDER:
                 b = Book(
-                    path=os.path.join(self.path, book),
-                    name=book,
+                    path=os.path.join(self.path, entry.name),
+                    name=entry.name,
                     client=self.client,
                     shelf=self,
                     from_client=False,
+                    vault=self.vault,
                 )
                 books.append(b)
 
@@ -54,12 +57,14 @@ class Book:
         path: str = "",
         details: Dict = {},
         from_client: bool = True,
+        vault: Vault | None = None,
     ) -> None:
         self.path = path
         self.name = name
         self.client = client
+        self.vault = vault
         self.shelf = shelf
-        self.chapters = chapters
+        self.chapters = chapters or []
         self.details = details
         if from_client:
             self.pages = []
@@ -70,33 +75,33 @@ class Book:
         return self.name
 
     def _set_pages(self):
+        assert self.vault
         pages = []
         chapters = []
 
-        for item in os.listdir(self.path):
-            item_path = os.path.join(self.path, item)
-            if os.path.isdir(item_path):
+        for entry in self.vault.children(self.path):
+            if entry.kind == FOLDER:
                 chapters.append(
                     Chapter(
-                        path=os.path.join(self.path, item),
-                        name=item,
+                        path=os.path.join(self.path, entry.name),
+                        name=entry.name,
                         client=self.client,
                         shelf=self.shelf,
                         book=self,
                         from_client=False,
+                        vault=self.vault,
                     )
                 )
-            else:
-                if os.path.splitext(item)[1] == ".md":
-                    pages.append(
-                        Page(
-                            path=os.path.join(self.path, item),
-                            name=item,
-                            client=self.client,
-                            shelf=self.shelf,
-                            book=self,
-                        )
+            elif entry.kind == NOTE:
+                pages.append(
+                    Page(
+                        path=os.path.join(self.path, entry.name),
+                        name=entry.name,
+                        client=self.client,
+                        shelf=self.shelf,
+                        book=self,
                     )
+                )
 
         self.pages = pages
         self.chapters = chapters
@@ -112,10 +117,12 @@ class Chapter:
         path: str = "",
         details: Dict = {},
         from_client: bool = True,
+        vault: Vault | None = None,
     ) -> None:
         self.path = path
         self.name = name
         self.client = client
+        self.vault = vault
         self.shelf = shelf
         self.book = book
         self.details = details
@@ -128,12 +135,13 @@ class Chapter:
         return self.name
 
     def _set_pages(self):
+        assert self.vault
         pages = []
-        for page in os.listdir(self.path):
-            if os.path.splitext(page)[1] == ".md":
+        for entry in self.vault.children(self.path):
+            if entry.kind == NOTE:
                 p = Page(
-                    path=os.path.join(self.path, page),
-                    name=page,
+                    path=os.path.join(self.path, entry.name),
+                    name=entry.name,
                     client=self.client,
                     book=self.book,
                     chapter=self,
@@ -144,6 +152,18 @@ class Chapter:
 
 
 class Page:
+    # one is made per note and per remote page
+    __slots__ = (
+        "path",
+        "name",
+        "client",
+        "_content",
+        "shelf",
+        "book",
+        "chapter",
+        "details",
+    )
+
     def __init__(
         self,
         name: str,
@@ -157,7 +177,7 @@ class Page:
         self.path = path
         self.name = name
         self.client = client
-        self.content = self._get_content() if self.path else ""
+        self._content = None
         self.shelf = shelf
         self.book = book
         self.chapter = chapter
@@ -166,6 +186,14 @@ class Page:
     def __str__(self) -> str:
         return self.name
 
+    @property
+    def content(self) -> str:
+        """Read the page's file the first time its content is needed"""
+        if self._content is None:
+            self._content = self._get_content() if self.path else ""
+
+        return self._content
+
     def _get_content(self):
         with open(self.path, "r") as f:
             return f.read()
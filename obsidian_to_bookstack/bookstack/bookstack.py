@@ -1,14 +1,27 @@
+import json
 import os
 import shutil
-from datetime import datetime, timedelta
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Set, Tuple
 
 import urllib3
 
 from ..console import console
-from ..utils import con_hash
+from ..events import events
+from ..obsidian import Vault
+from ..obsidian.ignore import IgnoreRules
+from ..obsidian.Vault import FOLDER, NOTE
+from ..trace import tracer
+from ..utils import con_hash, prefetch, write_atomic
 from .artifacts import Book, Chapter, Page, Shelf
+from .cache import RemoteCache
+from .catalog import UPDATE_SLACK, Catalog, changes, newer
 from .client import LocalClient, RemoteClient
+from .export import contents_sequence, split_export, strip_header, worth_exporting
+from .journal import Journal
+from .links import LinkIndex
+from .merkle import Diff, local_tree, remote_tree
+from .moves import PageLinks, detect_moves, page_path
 from .collectors.local import *
 from .collectors.remote import *
 from .constants import *
@@ -17,38 +30,158 @@ from .constants import *
 class BookstackClient(RemoteClient):
     """Represents the remote Bookstack instance"""
 
-    def __init__(self, verbose: bool) -> None:
+    def __init__(
+        self,
+        verbose: bool,
+        full_crawl: bool = False,
+        audit_log: bool = False,
+        crawl: bool = True,
+        fresh: bool = False,
+        ignore: IgnoreRules | None = None,
+    ) -> None:
         # if verbose is set, will issue logs
         super().__init__()
         self.verbose = verbose
+        self.audit_log = audit_log
+        self.fresh = fresh
+        self.ignore = ignore
         if self.verbose:
             console.log("Building remote client...")
 
+        assert self.base_url
+        self.cache = RemoteCache(self.base_url, full_crawl=full_crawl)
+        if fresh:
+            # crawled and saved by another process of the same run
+            self.cache.fresh = set(BookstackItems)
+
         self.__set_collectors()
-        self.__set_artifacts()
-        self.__set_maps()
+        self.shelves, self.books, self.pages, self.chapters = [], [], [], []
+        self.shelf_map, self.book_map, self.page_map, self.chapter_map = {}, {}, {}, {}
+
+        # targeted commands look items up themselves instead
+        if crawl:
+            self.__set_artifacts()
+            self.__set_maps()
 
     def __set_collectors(self):
         self.shelf_collector = RemoteShelfCollector(self.verbose, self)
         self.book_collector = RemoteBookCollector(self.verbose, self)
         self.page_collector = RemotePageCollector(self.verbose, self)
         self.chapter_collector = RemoteChapterCollector(self.verbose, self)
+        self.audit_log_collector = RemoteAuditLogCollector(self.verbose, self)
 
     def __set_artifacts(self):
-        self.shelves: List[Shelf] = self.shelf_collector.get_shelves()
-        self.books: List[Book] = self.book_collector.get_books(self.shelves)
-        self.pages: List[Page] = self.page_collector.get_pages(self.books)
-        self.chapters: List[Chapter] = self.chapter_collector.get_chapters(self.books)
+        if self.audit_log:
+            with tracer.span("crawl audit log"):
+                self.audit_log_collector.apply_changes()
+
+        with tracer.span("crawl shelves"):
+            self.shelves: List[Shelf] = self.shelf_collector.get_shelves()
+        with tracer.span("crawl books"):
+            self.books: List[Book] = self.book_collector.get_books(self.shelves)
+        with tracer.span("crawl pages"):
+            self.pages: List[Page] = self.page_collector.get_pages(self.books)
+        with tracer.span("crawl chapters"):
+            self.chapters: List[Chapter] = self.chapter_collector.get_chapters(
+                self.books
+            )
+        if not self.fresh:
+            with tracer.span("save remote cache"):
+                self.cache.save()  # the crawl succeeded, move the watermark forward
+
+        # the cache holds what the listings and details said, the responses aren't
+        # needed twice
+        self.responses.release()
+
+        if self.audit_log:
+            self.audit_log_collector.save_checkpoint()
+
+        if self.ignore:
+            self.__prune()
+
+    def __prune(self):
+        """Leave out shelved items whose vault paths are ignored. The cache keeps them,
+        so changing the rules doesn't take a full crawl."""
+        assert self.ignore
+        ignored = self.ignore.ignored
+        gone = {shelf for shelf in self.shelves if ignored(shelf.name, True)}
+
+        for book in self.books:
+            if book.shelf and (
+                book.shelf in gone or ignored(f"{book.shelf.name}/{book.name}", True)
+            ):
+                gone.add(book)
+
+        for chapter in self.chapters:
+            book = chapter.book
+            if book and book.shelf and (
+                book in gone
+                or ignored(f"{book.shelf.name}/{book.name}/{chapter.name}", True)
+            ):
+                gone.add(chapter)
+
+        for page in self.pages:
+            if page.book and page.book.shelf and (
+                page.book in gone
+                or page.chapter in gone
+                or ignored(page_path(page), False)
+            ):
+                gone.add(page)
+
+        if not gone:
+            return
+
+        self.shelves = [shelf for shelf in self.shelves if shelf not in gone]
+        self.books = [book for book in self.books if book not in gone]
+        self.chapters = [chapter for chapter in self.chapters if chapter not in gone]
+        self.pages = [page for page in self.pages if page not in gone]
+
+        for shelf in self.shelves:
+            shelf.books = [book for book in shelf.books if book not in gone]
+        for book in self.books:
+            book.chapters = [c for c in book.chapters if c not in gone]
+            book.pages = [page for page in book.pages if page not in gone]
+        for chapter in self.chapters:
+            chapter.pages = [page for page in chapter.pages if page not in gone]
 
+    @tracer.wrap("build remote maps")
     def __set_maps(self):
         self.shelf_map = self._build_shelf_map()
         self.book_map = self._build_book_map()
         self.page_map = self._build_page_map()
         self.chapter_map = self._build_chapter_map()
 
+    def _reload(self):
+        """Rebuild the model from the cache, once changes were applied to it"""
+        self.__set_artifacts()
+        self.__set_maps()
+
+    def _update(self) -> bool:
+        """Bring the model up to date with what changed since the last crawl, rebuilding
+        it only when anything did. Returns whether it was rebuilt."""
+        self.responses.clear()
+
+        probes = (
+            (self.shelf_collector, BookstackAPIEndpoints.SHELVES, BookstackItems.SHELF),
+            (self.book_collector, BookstackAPIEndpoints.BOOKS, BookstackItems.BOOK),
+            (self.page_collector, BookstackAPIEndpoints.PAGES, BookstackItems.PAGE),
+            (
+                self.chapter_collector,
+                BookstackAPIEndpoints.CHAPTERS,
+                BookstackItems.CHAPTER,
+            ),
+        )
+
+        if not any(collector._changed(*probe) for collector, *probe in probes):
+            return False
+
+        self._reload()
+        return True
+
     def _refresh(self):
         """Simply update the client"""
-        self.http = urllib3.PoolManager()
+        self.http = urllib3.PoolManager(maxsize=MAX_CONNECTIONS)
+        self.responses.clear()
         self.__set_collectors()
         self.__set_artifacts()
         self.__set_maps()
@@ -94,10 +227,132 @@ class BookstackClient(RemoteClient):
 
         return page_map
 
-    def _get_temp_book_map(self):
-        """Get books from the client, but don't add to the client"""
-        books = self._get_from_client(BookstackAPIEndpoints.BOOKS)
-        return {book["name"]: book["id"] for book in books}
+    def _find(self, endpoint: BookstackAPIEndpoints, name: str) -> List[Dict]:
+        """List the items of an endpoint with exactly this name"""
+        return self._get_from_client(endpoint, {"filter[name]": name})
+
+    def _find_shelf(self, name: str) -> Tuple[Dict | None, Set[int]]:
+        """Details of a shelf by name, along with the ids of its books"""
+        shelves = self._find(BookstackAPIEndpoints.SHELVES, name)
+
+        if not shelves:
+            return None, set()
+
+        class ShelfLink(DetailedBookstackLink):
+            LINK = f"/api/shelves/{shelves[0]['id']}"
+
+        shelf = json.loads(self._make_request(RequestType.GET, ShelfLink.LINK).data)
+        return shelf, {book["id"] for book in shelf.get("books", [])}
+
+    def _get_body(self, id: int, name: str) -> bytes | None:
+        """Body of a single page without its header, None if it's gone. A body seen
+        in a page's details this run is used as is, otherwise its export is fetched,
+        which unlike the details holds neither html nor JSON escaping."""
+        if (body := self.responses.body(id)) is not None:
+            return body
+
+        if (body := self.__fetch_body(id, name)) is None:
+            return None
+
+        return self.responses.keep_body(id, body)
+
+    def __fetch_body(self, id: int, name: str) -> bytes | None:
+        class PageMarkdownLink(DetailedBookstackLink):
+            LINK = f"/api/pages/{id}/export/markdown"
+
+        resp = self._make_request(RequestType.GET, PageMarkdownLink.LINK)
+
+        if resp.status != 200:
+            return None
+
+        return strip_header(resp.data, name)
+
+    def _get_book_bodies(
+        self, book: Dict, names: Dict[int, str], needed: List[int]
+    ) -> Dict[int, bytes | None]:
+        """Bodies of some pages of a cached book without their header, None for pages
+        which are gone, none of them kept for the run. `names` holds every page of the
+        book, which is exported whole when most of it is needed."""
+        bodies: Dict[int, bytes | None] = {}
+        sequence = None
+
+        if worth_exporting(len(needed), len(names)):
+            sequence = contents_sequence(book.get("contents", []), names)
+
+        if sequence:
+            endpoint = BookstackAPIEndpoints.BOOKS.value
+
+            class BookMarkdownLink(DetailedBookstackLink):
+                LINK = f"{endpoint}/{book['id']}/export/markdown"
+
+            resp = self._make_request(RequestType.GET, BookMarkdownLink.LINK)
+
+            if resp.status == 200:
+                for id, content in split_export(resp.data, sequence).items():
+                    bodies[id] = strip_header(content, names[id])
+
+        # a few pages, or ones a split couldn't find
+        return {
+            id: bodies[id] if id in bodies else self.__fetch_body(id, names[id])
+            for id in needed
+        }
+
+    def _resolve(self, arg: BookstackItems, sections: List[str]) -> Dict | None:
+        """Find a single remote item from its vault path with a few targeted list queries"""
+        if arg == BookstackItems.SHELF:
+            shelf, _ = self._find_shelf(sections[0])
+            return shelf
+
+        in_chapter = arg == BookstackItems.CHAPTER or len(sections) == 4
+
+        # each level is looked up by name at once, then joined on parent ids
+        with ThreadPoolExecutor(MAX_CONNECTIONS) as pool:
+            books = pool.submit(self._find, BookstackAPIEndpoints.BOOKS, sections[1])
+            chapters = (
+                pool.submit(self._find, BookstackAPIEndpoints.CHAPTERS, sections[2])
+                if in_chapter
+                else None
+            )
+            pages = (
+                pool.submit(self._find, BookstackAPIEndpoints.PAGES, sections[-1])
+                if arg == BookstackItems.PAGE
+                else None
+            )
+            on_shelf = (
+                pool.submit(self._find_shelf, sections[0])
+                if arg == BookstackItems.BOOK
+                else None
+            )
+
+            book_ids = [book["id"] for book in books.result()]
+
+            # the shelf is only needed to tell apart books with the same name
+            if on_shelf is None and len(book_ids) > 1:
+                on_shelf = pool.submit(self._find_shelf, sections[0])
+
+            if on_shelf is not None:
+                _, shelf_book_ids = on_shelf.result()
+                book_ids = [id for id in book_ids if id in shelf_book_ids]
+
+        if arg == BookstackItems.BOOK:
+            return next((b for b in books.result() if b["id"] in book_ids), None)
+
+        # a page directly in a book has no chapter
+        chapter_ids = [0, None]
+        if chapters is not None:
+            candidates = [c for c in chapters.result() if c["book_id"] in book_ids]
+
+            if arg == BookstackItems.CHAPTER:
+                return candidates[0] if candidates else None
+
+            chapter_ids = [c["id"] for c in candidates]
+
+        assert pages is not None
+        for page in pages.result():
+            if page["book_id"] in book_ids and page.get("chapter_id") in chapter_ids:
+                return page
+
+        return None
 
     def _retrieve_from_client_map(self, obj: Page | Shelf | Book | Chapter):
         """Retrieve the client version of the local object"""
@@ -130,200 +385,734 @@ class BookstackClient(RemoteClient):
 class Bookstack(LocalClient):
     """Represents the local Bookstack notes instance"""
 
-    def __init__(self, path, excluded, verbose: bool) -> None:
+    def __init__(
+        self,
+        path,
+        excluded,
+        verbose: bool,
+        full_crawl: bool = False,
+        audit_log: bool = False,
+        scan_vault: bool = True,
+        crawl: bool = True,
+        fresh: bool = False,
+        shelves: List[str] | None = None,
+        ignore: Dict | None = None,
+    ) -> None:
         self.verbose = verbose
         if self.verbose:
             console.log("Building local client...")
 
-        self.client = BookstackClient(verbose=self.verbose)
         self.path = path
         self.excluded = excluded
+        self.ignore = ignore
+        self.vault = Vault(path, ignore)
+
+        # the remote is filtered by the same rules as the vault
+        self.client = BookstackClient(
+            verbose=self.verbose,
+            full_crawl=full_crawl,
+            audit_log=audit_log,
+            crawl=crawl,
+            fresh=fresh,
+            ignore=self.vault.ignore,
+        )
+
+        with tracer.span("load vault index"):
+            self.vault.load()
+
+        assert self.client.base_url
+        self.page_links = PageLinks(self.client.base_url, self.vault.path)
+        self.page_links.load()
+        self.journal = Journal(self.client.base_url, self.vault.path, verbose)
+
+        # shelves outside `shelves` are left alone, though links to them still resolve
+        self.skipped = list(excluded)
+        if shelves is not None:
+            names = {e.name for e in self.vault.children() if e.kind == FOLDER}
+            names |= {shelf.name for shelf in self.client.shelves}
+            self.skipped += sorted(names - set(shelves))
+
         self.__set_collectors()
-        self.__set_artifacts()
-        self.missing_books = set()
+        self._link_index: LinkIndex | None = None
+        self._diff: Diff | None = None
+        # built the first time they're used, syncing streams books instead
+        self._artifacts: Tuple | None = None
+        if scan_vault:
+            with tracer.span("scan vault"):
+                changes = self.vault.scan()
+                self.vault.save()
+
+            if self.verbose:
+                console.log(f"Vault index updated with {changes} changes")
 
     def __set_collectors(self):
         self.shelf_collector = LocalShelfCollector(
-            self, self.client, self.path, self.excluded, self.verbose
+            self, self.client, self.path, self.skipped, self.verbose
         )
         self.book_collector = LocalBookCollector(
-            self, self.client, self.path, self.excluded, self.verbose
+            self, self.client, self.path, self.skipped, self.verbose
         )
         self.page_collector = LocalPageCollector(
-            self, self.client, self.path, self.excluded, self.verbose
+            self, self.client, self.path, self.skipped, self.verbose
         )
         self.chapter_collector = LocalChapterCollector(
-            self, self.client, self.path, self.excluded, self.verbose
+            self, self.client, self.path, self.skipped, self.verbose
         )
 
+    @tracer.wrap("collect local artifacts")
     def __set_artifacts(self):
-        self.shelves = self.shelf_collector.set_shelves()
-        self.books = self.book_collector.set_books(self.shelves)
-        self.chapters = self.chapter_collector.set_chapters(self.books)
-        self.pages = self.page_collector.set_pages(self.books)
-
-    def _refresh(self):
-        # refresh objects
-        if self.verbose:
-            console.log("Refreshing local client")
-
-        self.__set_artifacts()
-
-    def delete(self, arg: BookstackItems, item: str):
-        """Delete item from both local Obsidian Vault and remote Bookstack instance"""
-        item_sections = item.split(os.path.sep)
-        len_item_sections = len(item_sections)
-
-        if arg == BookstackItems.SHELF:
-            assert len_item_sections == 1
-            path = os.path.join(self.path, item)
-            if self.verbose:
-                console.log(f"Deleting path: {path}")
-
-            shutil.rmtree(path)
-            shelf = Shelf(item)
+        shelves = self.shelf_collector.set_shelves()
+        books = self.book_collector.set_books(shelves)
+        chapters = self.chapter_collector.set_chapters(books)
+        pages = self.page_collector.set_pages(books)
+        self._artifacts = (shelves, books, chapters, pages)
 
-            client_shelf = self.client._retrieve_from_client_map(shelf)
+    def __get_artifacts(self) -> Tuple:
+        if self._artifacts is None:
+            self.__set_artifacts()
 
-            class ShelfLink(DetailedBookstackLink):
-                LINK = f"/api/shelves/{client_shelf.details['id']}"
+        assert self._artifacts is not None
+        return self._artifacts
 
-            if self.verbose:
-                console.log(f"Deleting shelf in Bookstack: {client_shelf}")
+    @property
+    def shelves(self) -> List[Shelf]:
+        return self.__get_artifacts()[0]
 
-            self._delete_from_bookstack(ShelfLink.LINK)
+    @property
+    def books(self) -> List[Book]:
+        return self.__get_artifacts()[1]
 
-            for book in client_shelf.books:
+    @property
+    def chapters(self) -> List[Chapter]:
+        return self.__get_artifacts()[2]
 
-                class ShelfBookLink(DetailedBookstackLink):
-                    LINK = f"/api/books/{book.details['id']}"
+    @property
+    def pages(self) -> List[Page]:
+        return self.__get_artifacts()[3]
 
-                if self.verbose:
-                    console.log(f"Deleting book in Bookstack: {book}")
+    def _refresh(self):
+        # refresh objects
+        if self.verbose:
+            console.log("Refreshing local client")
 
-                self._delete_from_bookstack(ShelfBookLink.LINK)
+        self._artifacts = None
+        self._link_index = None
+        self._diff = None
+
+    def _notes(self) -> Iterator[str]:
+        """Vault paths, without extension, of every note which syncs as a page"""
+        for entry in self.vault.notes():
+            path = entry.path[: -len(".md")]
+            parts = path.split("/")
+
+            # Shelf/Book/Page or Shelf/Book/Chapter/Page
+            if len(parts) in (3, 4) and parts[0] not in self.excluded:
+                yield path
+
+    @property
+    def link_index(self) -> LinkIndex:
+        """Link index of both page trees, built the first time links are translated"""
+        if self._link_index is None:
+            assert self.client.base_url
+
+            with tracer.span("build link index"):
+                self._link_index = LinkIndex.build(
+                    self.client.base_url, self._notes(), self.client.pages
+                )
+
+        return self._link_index
+
+    @link_index.setter
+    def link_index(self, index: LinkIndex | None):
+        self._link_index = index
+
+    @property
+    def diff(self) -> Diff:
+        """Fingerprints of both trees, so syncing skips subtrees which match"""
+        if self._diff is None:
+            with tracer.span("diff trees"):
+                self._diff = Diff(
+                    local_tree(self.vault, self.skipped),
+                    remote_tree(self.client, self.skipped),
+                )
+
+        return self._diff
+
+    def __item_sections(self, arg: BookstackItems, item: str) -> List[str]:
+        """Split a vault path into the names of the items it is made of"""
+        item_sections = item.strip(os.path.sep).split(os.path.sep)
 
+        if arg == BookstackItems.SHELF:
+            assert len(item_sections) == 1
         if arg == BookstackItems.BOOK:
-            assert len_item_sections == 2
-            path = os.path.join(self.path, item_sections[0], item_sections[1])
-            if self.verbose:
-                console.log(f"Deleting path at: {path}")
-
-            shutil.rmtree(path)
-
-            shelf = Shelf(item_sections[0])
-            book = Book(item_sections[1], shelf=shelf)
+            assert len(item_sections) == 2
+        if arg == BookstackItems.CHAPTER:
+            assert len(item_sections) == 3
+        if arg == BookstackItems.PAGE:
+            # a page is either directly in a book or in a chapter
+            assert len(item_sections) in (3, 4)
+            item_sections[-1] = os.path.splitext(item_sections[-1])[0]
 
-            client_book = self.client._retrieve_from_client_map(book)
+        return item_sections
 
-            class BookLink(DetailedBookstackLink):
-                LINK = f"/api/books/{client_book.details['id']}"
+    def __delete_remote(self, arg: BookstackItems, details: Dict) -> bool:
+        """Delete one remote item, returns whether it succeeded"""
 
-            if self.verbose:
-                console.log(f"Deleting book in Bookstack: {client_book}")
+        class ItemLink(DetailedBookstackLink):
+            LINK = f"{BOOKSTACK_ENDPOINT_MAP[arg].value}/{details['id']}"
 
-            self._delete_from_bookstack(BookLink.LINK)
+        resp = self._delete_from_bookstack(ItemLink.LINK)
 
-        if arg == BookstackItems.PAGE:
-            assert len_item_sections == 3
-            path = os.path.join(
-                self.path, item_sections[0], item_sections[1], item_sections[2] + ".md"
+        if resp.status >= 300:
+            events.item(
+                "failed", arg.value, details["name"], error=f"HTTP {resp.status}"
             )
-            if self.verbose:
-                console.log(f"Deleting path at: {path}")
-
-            os.remove(path)
-            book = Book(item_sections[1])
-            page = Page(item_sections[2], book=book)
-            client_page = self.client._retrieve_from_client_map(page)
-
-            class PageLink(DetailedBookstackLink):
-                LINK = f"/api/pages/{client_page.details['id']}"
+            return False
 
-            if self.verbose:
-                console.log(f"Deleting page in Bookstack: {client_page}")
+        events.item("deleted", arg.value, details["name"])
+        return True
 
-            self._delete_from_bookstack(PageLink.LINK)
+    def __delete_local(self, arg: BookstackItems, item_sections: List[str]):
+        """Remove a deleted item from the vault"""
+        path = os.path.join(self.path, *item_sections)
 
-        if arg == BookstackItems.CHAPTER:
-            assert len_item_sections == 3
-            path = os.path.join(
-                self.path, item_sections[0], item_sections[1], item_sections[2]
-            )
-            if self.verbose:
-                console.log(f"Deleting path at: {path}")
+        if arg == BookstackItems.PAGE:
+            path += ".md"
 
+        if os.path.isdir(path):
             shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
 
-            shelf = Shelf(item_sections[0])
-            book = Book(item_sections[1], shelf=shelf)
-            chapter = Chapter(item_sections[2], book=book)
-
-            client_chapter = self.client._retrieve_from_client_map(chapter)
-
-            class ChapterLink(DetailedBookstackLink):
-                LINK = f"/api/books/{client_chapter.details['id']}"
+        self.vault.remove(path)
+        events.item("deleted", arg.value, path)
 
-            if self.verbose:
-                console.log(f"Deleting chapter in Bookstack: {client_chapter}")
+    def delete(self, arg: BookstackItems, items: List[str]):
+        """Delete items from both the remote Bookstack instance and the local Obsidian Vault.
+        Local files are only removed once their remote delete succeeded."""
+        sections = [self.__item_sections(arg, item) for item in items]
 
-            self._delete_from_bookstack(ChapterLink.LINK)
+        with ThreadPoolExecutor(MAX_CONNECTIONS) as pool:
+            targets = list(
+                pool.map(lambda item: self.client._resolve(arg, item), sections)
+            )
+            deletions = []
+
+            for item, item_sections, target in zip(items, sections, targets):
+                if target is None:
+                    events.item(
+                        "skipped", arg.value, item, error="not found in Bookstack"
+                    )
+                    continue
+
+                # books aren't deleted with their shelf, so take them too
+                cascade = [(arg, target)] + [
+                    (BookstackItems.BOOK, book)
+                    for book in target.get("books", [])
+                    if arg == BookstackItems.SHELF
+                ]
+                futures = [
+                    pool.submit(self.__delete_remote, item_type, details)
+                    for item_type, details in cascade
+                ]
+                deletions.append((item_sections, futures))
+
+            for item_sections, futures in deletions:
+                if all([future.result() for future in futures]):
+                    self.__delete_local(arg, item_sections)
+
+        self.vault.save()
 
     def _delete_from_bookstack(self, link: DetailedBookstackLink):
         """Make a DELETE request to a Bookstack API link"""
         resp = self.client._make_request(RequestType.DELETE, link)
         return resp
 
+    def _detect_moves(self) -> Dict[str, Tuple[int, str]]:
+        """Follow pages renamed or moved remotely by renaming their notes. Returns
+        notes renamed or moved locally by vault path, with their page id and old path."""
+        remote = {
+            page.details["id"]: page_path(page)
+            for page in self.client.pages
+            if page.book
+            and page.book.shelf
+            and page.book.shelf.name not in self.excluded
+        }
+        notes = (path + ".md" for path in self._notes())
+
+        with tracer.span("detect moves"):
+            remote_moves, local_moves = detect_moves(
+                self.page_links, self.vault, remote, notes
+            )
+
+        if local_moves:
+            self.page_collector.move_local_pages(local_moves)
+            self.vault.save()
+            self._refresh()  # local artifacts still have the old paths
+
+        self.page_links.save()
+        return {path: (id, old_path) for id, old_path, path in remote_moves}
+
+    def __resumed_books(self) -> Dict[str, Book]:
+        """Books an earlier run created but never put on their shelf, by vault path.
+        Only shelved books are found by name, so these would be created again."""
+        unshelved = {b.details["id"]: b for b in self.client.books if not b.shelf}
+        resumed = {}
+
+        for path, id in self.journal.landed("remote", "create", "book").items():
+            if int(id) in unshelved:
+                resumed[path] = unshelved[int(id)]
+
+        for shelf, ids in self.journal.unfinished("remote", "shelve", "shelf").items():
+            for id in json.loads(ids or "[]"):
+                if book := unshelved.get(id):
+                    resumed[f"{shelf}/{book.name}"] = book
+
+        # a create which was never marked may have landed all the same
+        by_name = {b.name: b for b in unshelved.values()}
+        for path in self.journal.unfinished("remote", "create", "book"):
+            name = path.split("/")[-1]
+            if path not in resumed and name in by_name:
+                resumed[path] = by_name[name]
+
+        return resumed
+
+    def __unlinked_pages(self) -> List[Tuple[str, int]]:
+        """Pages an earlier run created whose links it never got to rewrite"""
+        relinked = self.journal.landed("remote", "relink", "page")
+        pages = {
+            **self.journal.landed("remote", "create", "page"),
+            **self.journal.unfinished("remote", "relink", "page"),
+        }
+
+        return [
+            (path, int(id))
+            for path, id in pages.items()
+            if id and path not in relinked and self.vault.get(path)
+        ]
+
+    def __plan_remote(
+        self,
+        books: Iterator[Book],
+        moves: Dict[str, Tuple[int, str]],
+        resumed: Dict[str, Book],
+    ) -> Iterator[Tuple]:
+        """Diff each local book against its remote copy and read what it needs to upload"""
+        for book in books:
+            assert book.shelf
+            client_book = self.client.book_map.get(
+                con_hash(book.name + book.shelf.name)
+            ) or resumed.get(f"{book.shelf.name}/{book.name}")
+            chapters = self.chapter_collector.get_remote_missing_chapters(book, client_book)
+            pages = self.page_collector.get_remote_missing_pages(book, client_book)
+
+            for page in pages:
+                # read ahead while the previous book uploads, moves don't upload content
+                if self.vault.relpath(page.path) not in moves:
+                    page.content
+
+            yield book, client_book, chapters, pages
+
     def sync_remote(self):
-        """Sync local changes to the remote."""
-        self.shelf_collector.create_remote_missing_shelves()
-        self.missing_books = self.book_collector._create_remote_missing_books()
-        self.client._refresh()  # refresh to update book and page ids
-        self._refresh()
-        self.book_collector.update_shelf_books(self.missing_books)
-        self.client._refresh()  # refresh to update book and page ids
-        self.chapter_collector.create_remote_missing_chapters()
-        self.page_collector.create_remote_missing_pages()
+        """Sync local changes to the remote, one book at a time.
+        Each book is read on a background thread while the previous one uploads,
+        so only a couple of books are held in memory. Every operation is journaled,
+        one which fails is reported and the rest carry on."""
+        notes = sum(1 for _ in self._notes())
+        self.journal.start("remote")
+
+        with events.phase(
+            "remote", "Uploading missing files to remote...", total=notes, kind="page"
+        ):
+            moves = self._detect_moves()
+            shelf_books, unresolved_pages = self._push(moves)
+            self._finish_push(shelf_books, unresolved_pages)
+
+        self.journal.finish("remote")
+
+    def _push(
+        self, moves: Dict[str, Tuple[int, str]]
+    ) -> Tuple[Dict[str, list], List[Tuple[str, int]]]:
+        """Create and move what the remote is missing, short of putting new books on
+        their shelves. Returns shelf names with their details and book ids, for shelves
+        which gained books, and the pages whose links wait on pages not created yet."""
+        journal = self.journal
+        resumed = self.__resumed_books()
+        client_shelves = {shelf.name: shelf for shelf in self.client.shelves}
+        shelves = list(self.shelf_collector.iter_shelves())
+        shelf_books: Dict[str, list] = {}
+        unresolved_pages = []
+
+        for shelf in shelves:
+            if shelf.name not in client_shelves:
+                with journal.operation("remote", "create", "shelf", shelf.name):
+                    details = self.shelf_collector.create_remote_shelf(shelf)
+                    shelf_books[shelf.name] = [details, []]
+
+        # books of a shelf which failed to be created wait for the next run
+        books = self.book_collector.iter_books(
+            shelf
+            for shelf in shelves
+            if shelf.name in client_shelves or shelf.name in shelf_books
+        )
+
+        plans = prefetch(self.__plan_remote(books, moves, resumed))
+
+        for book, client_book, chapters, pages in plans:
+            assert book.shelf
+            path = f"{book.shelf.name}/{book.name}"
+
+            if client_book:
+                book_id = client_book.details["id"]
+                chapter_ids = {c.name: c.details["id"] for c in client_book.chapters}
+            else:
+                with journal.operation("remote", "create", "book", path) as op:
+                    book_id = self.book_collector.create_remote_book(book)["id"]
+                    op.result = str(book_id)
+
+                if not op.ok:
+                    continue
+
+                chapter_ids = {}
+
+            if not client_book or not client_book.shelf:
+                if book.shelf.name not in shelf_books:
+                    client_shelf = client_shelves[book.shelf.name]
+                    shelf_books[book.shelf.name] = [
+                        client_shelf.details,
+                        [b["id"] for b in client_shelf.client_books],
+                    ]
+                shelf_books[book.shelf.name][1].append(book_id)
+
+            for chapter in chapters:
+                chapter_path = f"{path}/{chapter.name}"
+
+                with journal.operation("remote", "create", "chapter", chapter_path):
+                    details = self.chapter_collector.create_remote_chapter(
+                        chapter, book_id
+                    )
+                    chapter_ids[chapter.name] = details["id"]
+
+            present = len(book.pages) + sum(len(c.pages) for c in book.chapters)
+            if present > len(pages):
+                skipped = present - len(pages)
+                events.item("skipped", "page", book.name, count=skipped)
+
+            # pages of a chapter which failed to be created wait for the next run
+            pages = [
+                page
+                for page in pages
+                if not page.chapter or page.chapter.name in chapter_ids
+            ]
+
+            if pages and moves:
+                pages = self.page_collector.move_remote_pages(
+                    pages, book_id, chapter_ids, moves
+                )
+
+            if pages:
+                unresolved_pages += self.page_collector.create_remote_pages(
+                    pages, book_id, chapter_ids
+                )
+
+        self.page_links.save()
+        return shelf_books, unresolved_pages
+
+    def _finish_push(
+        self, shelf_books: Dict[str, list], unresolved_pages: List[Tuple[str, int]]
+    ):
+        """Put new books on their shelves, then rewrite the links of new pages now
+        that every page exists"""
+        for name, (details, book_ids) in shelf_books.items():
+            if book_ids:
+                with self.journal.operation("remote", "shelve", "shelf", name) as op:
+                    op.result = json.dumps(book_ids)
+                    self.book_collector.update_shelf_books(details, book_ids)
+
+        unresolved_pages = self.__unlinked_pages() + unresolved_pages
+
+        if unresolved_pages:
+            self.page_collector.relink_pages(unresolved_pages)
+
+        self.page_links.save()
 
     def sync_local(self):
         """Sync any remote changes to local store"""
+        self.journal.start("local")
+
+        with events.phase(
+            "local",
+            "Downloading any missing files...",
+            total=len(self.client.pages),
+            kind="page",
+        ):
+            # pages of notes renamed locally stay until `remote` moves them
+            moves = self._detect_moves()
+            self._pull({id for id, _ in moves.values()})
+
+        self.journal.finish("local")
+
+    def _pull(self, moved: Set[int]):
+        """Create the shelves, books, chapters and pages the vault is missing,
+        leaving out `moved` pages"""
         self.shelf_collector.create_local_missing_shelves()
         self.book_collector.create_local_missing_books()
         self.chapter_collector.create_local_missing_chapters()
-        self.page_collector.create_local_missing_pages()
+        self.page_collector.create_local_missing_pages(moved=moved)
+        self.vault.save()
+        self.page_links.save()
+
+    def update_remote(
+        self,
+        remote: bool,
+        local: bool,
+        conflicts: ConflictPolicy = ConflictPolicy.KEEP_BOTH,
+    ):
+        """Sync page contents to the remote, to the vault, or both ways in one pass.
+        Both ways, pages are compared with how they were when both sides last matched,
+        so a page changed on both sides is a conflict, settled by `conflicts`."""
+        if remote and local:
+            label = "Updating remote and local files..."
+        else:
+            label = "Updating remote files..." if remote else "Updating local files..."
+
+        self.journal.start("update")
+
+        with tracer.span("catalog pages"):
+            notes = [path + ".md" for path in self._notes()]
+            local_pages = Catalog.local(self.vault, notes)
+            client_pages = [
+                page
+                for page in self.client.pages
+                if page.book
+                and page.book.shelf
+                and page.book.shelf.name not in self.excluded
+            ]
+            remote_pages = Catalog.remote(client_pages)
+
+        with events.phase("update", label, total=len(local_pages), kind="page"):
+            clashes = []
+
+            if remote and local:
+                pushes, pulls, clashes = changes(
+                    local_pages, remote_pages, self.page_links.bases(), UPDATE_SLACK
+                )
+            elif remote:
+                pushes, pulls = newer(local_pages, remote_pages, UPDATE_SLACK), []
+            else:
+                newer_pages = newer(remote_pages, local_pages, UPDATE_SLACK)
+                pushes, pulls = [], [(i, j) for j, i in newer_pages]
+
+            if conflicts == ConflictPolicy.LOCAL:
+                pushes += clashes
+            elif conflicts == ConflictPolicy.REMOTE:
+                pulls += clashes
+            elif conflicts == ConflictPolicy.KEEP_BOTH and clashes:
+                pushes += self.__keep_both(clashes, local_pages.paths, client_pages)
+            else:
+                for i, _ in clashes:
+                    path = local_pages.paths[i]
+                    events.item("conflict", "page", path, error="changed on both sides")
+
+            for i, j in pushes:
+                page = self.__note_page(local_pages.paths[i])
+                self.page_collector.update_local_content(page, client_pages[j])
+
+            if pulls:
+                self.__update_local(
+                    [
+                        (self.__note_page(local_pages.paths[i]), client_pages[j])
+                        for i, j in pulls
+                    ]
+                )
+
+            self.vault.save()
+            self.page_links.save()
+
+            settled = len(pushes) + len(pulls)
+            if conflicts == ConflictPolicy.SKIP:
+                settled += len(clashes)
+            events.item("skipped", "page", count=len(local_pages) - settled)
+
+        self.journal.finish("update")
+
+    def __keep_both(
+        self, clashes: List[Tuple[int, int]], paths: List[str], client_pages: List[Page]
+    ) -> List[Tuple[int, int]]:
+        """Keep the remote side of pages changed on both sides as new notes beside
+        theirs. Returns the conflicts whose notes can be pushed now that their page's
+        version is safe."""
+        copies = []
+
+        for i, j in clashes:
+            client_page = client_pages[j]
+            stamp = client_page.details["updated_at"][:16].replace("T", " ")
+            copy = f"{paths[i][: -len('.md')]} (remote {stamp.replace(':', '')}).md"
+            copies.append((self.__note_page(copy), client_page))
+
+        kept = self.__update_local(copies, copies=True)
+        return [(i, j) for i, j in clashes if client_pages[j].details["id"] in kept]
+
+    def __update_local(
+        self,
+        updated_pages: List[Tuple[Page, Page]],
+        copies: bool = False,
+        phase: str = "update",
+    ) -> Set[int]:
+        """Overwrite notes with the content of their newer remote pages, or write it to
+        new notes if they're `copies`. Returns the ids of the pages written."""
+        journal = self.journal
+        count = f"{len(updated_pages)} pages"
+        written = set()
+
+        with journal.operation(phase, "download", "page", count) as op:
+            # downloaded together so whole books or chapters can be exported at once
+            contents = self.page_collector.update(
+                [client_page for _, client_page in updated_pages]
+            )
 
-    def update_remote(self, remote: bool, local: bool):
-        """Sync page contents to the remote"""
-        updated_pages = []
+        if not op.ok:
+            return written
+
+        for page, client_page in updated_pages:
+            path = self.vault.relpath(page.path)
+            content = contents.get(client_page.details["id"])
+
+            if content is not None and self.vault.ignore.too_large(len(content)):
+                events.item("skipped", "page", path, error="over the size limit")
+                continue
+
+            with journal.operation(phase, "write", "page", path):
+                if content is None:
+                    raise RuntimeError("page is gone from Bookstack")
+
+                write_atomic(page.path, content)
+
+                entry = self.vault.update(page.path)
+                assert entry
+                id = client_page.details["id"]
+                written.add(id)
+
+                if copies:
+                    events.item("created", "page", page.path, bytes=len(content))
+                    continue
+
+                updated_at = client_page.details["updated_at"]
+                self.page_links.set(id, entry.path, entry.hash, updated_at)
+                events.item("updated", "page", page.path, bytes=len(content))
+
+        return written
+
+    def apply_remote(self, updated: Set[int], removed: Set[int]):
+        """Bring the vault up to date with pages known to have changed remotely.
+        New and moved pages are pulled as `local` does, changed pages downloaded
+        and removed pages deleted. Notes edited since they last matched their page
+        are left alone and reported."""
+        self.sync_local()
+        self.journal.start("listen")
+
+        with events.phase(
+            "listen",
+            "Applying remote changes...",
+            total=len(updated) + len(removed),
+            kind="page",
+        ):
+            bases = self.page_links.bases()
+            pulls = []
+
+            for page in self.client.pages:
+                id = page.details["id"]
+
+                # pages `local` just created are current already
+                if id not in updated or id not in bases:
+                    continue
+
+                path, hash, updated_at = bases[id]
+                entry = self.vault.get(path)
+
+                if not entry or updated_at == page.details["updated_at"]:
+                    events.item("skipped", "page", path)
+                elif entry.hash != hash:
+                    events.item("conflict", "page", path, error="changed on both sides")
+                else:
+                    pulls.append((self.__note_page(path), page))
+
+            if pulls:
+                self.__update_local(pulls, phase="listen")
+
+            for id in removed:
+                if id in bases:
+                    self.__remove_note(id, *bases[id][:2])
+
+            self.vault.save()
+            self.page_links.save()
+
+        self.journal.finish("listen")
+
+    def __remove_note(self, id: int, path: str, hash: str):
+        """Delete the note of a page deleted remotely, unless it changed since"""
+        entry = self.vault.get(path)
+
+        if entry and entry.hash != hash:
+            events.item("conflict", "page", path, error="deleted remotely, edited here")
+            return
+
+        with self.journal.operation("listen", "delete", "page", path) as op:
+            if entry:
+                os.remove(self.vault.abspath(path))
+                self.vault.update(path)
+
+        if op.ok:
+            self.page_links.remove(id)
+            events.item("deleted", "page", path)
+
+    def __note_page(self, path: str) -> Page:
+        """Page of a note which syncs, standing on its own"""
+        parts = path[: -len(".md")].split("/")
+        shelf = Shelf(parts[0])
+        book = Book(parts[1], shelf=shelf)
+        chapter = Chapter(parts[2], shelf=shelf, book=book) if len(parts) == 4 else None
+
+        return Page(
+            parts[-1] + ".md",
+            path=self.vault.abspath(path),
+            shelf=shelf,
+            book=book,
+            chapter=chapter,
+        )
 
-        for page in self.pages:
-            file_stat = os.stat(page.path)
+    def push(self, paths: List[str]):
+        """Upload single notes, updating their remote pages or creating any which are missing"""
+        missing = False
+        self.journal.start("update")
 
-            updated_at = datetime.utcfromtimestamp(file_stat.st_mtime)
+        for path in paths:
+            entry = self.vault.update(os.path.join(self.path, path))
 
-            client_page = self.client._retrieve_from_client_map(page)
+            if entry is None or entry.kind != NOTE:
+                events.item("skipped", "page", path, error="not a note in the vault")
+                continue
 
-            client_updated = datetime.strptime(
-                client_page.details["updated_at"], "%Y-%m-%dT%H:%M:%S.%fZ"
-            )
+            parts = entry.path[: -len(".md")].split("/")
+
+            if len(parts) not in (3, 4) or parts[0] in self.excluded:
+                events.item("skipped", "page", path, error="not a note which syncs")
+                continue
+
+            page = self.__note_page(entry.path)
+
+            try:
+                client_page = self.client._retrieve_from_client_map(page)
+            except KeyError:
+                missing = True
+                continue
+
+            self.page_collector.update_local_content(page, client_page)
+
+        if missing:
+            # creates the new pages, along with any shelf, book or chapter they need
+            self.sync_remote()
 
-            if remote:
-                if updated_at > client_updated and (
-                    updated_at - client_updated
-                ) > timedelta(
-                    seconds=5  # TODO: Surely there's a better way to tell the difference without downloading content
-                ):
-                    updated_pages.append(client_page)
-                    self.page_collector.update_local_content(page, client_page)
-            elif local:
-                if updated_at < client_updated and (
-                    client_updated - updated_at
-                ) > timedelta(seconds=5):
-                    console.log(f"Updating local page: {page}")
-                    updated_pages.append(page)
-                    content = self.page_collector.update(client_page)
-                    with open(page.path, "wb") as f:
-                        f.write(content)
-
-        if not updated_pages and self.verbose:
-            console.log("No pages changed to update")
+        self.vault.save()
+        self.page_links.save()
+        self.journal.finish("update")
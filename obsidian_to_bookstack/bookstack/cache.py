@@ -0,0 +1,158 @@
+import json
+import sys
+from typing import Any, Dict, Iterable, List, Tuple
+
+from ..sqllite import DatabaseFunctions as dbf
+from .constants import *
+
+# what syncing reads of each type, the rest of a response isn't kept
+RECORD_FIELDS = {
+    BookstackItems.SHELF: ["id", "name", "slug", "updated_at"],
+    BookstackItems.BOOK: ["id", "name", "slug", "updated_at"],
+    BookstackItems.CHAPTER: ["id", "name", "slug", "book_id", "updated_at"],
+    BookstackItems.PAGE: [
+        "id",
+        "name",
+        "slug",
+        "book_id",
+        "chapter_id",
+        "draft",
+        "updated_at",
+    ],
+}
+
+
+def record(item: BookstackItems, data: Dict) -> Dict:
+    """Compact record of a listed or detailed item. Children are kept as they're
+    ordered in an export: pages by id, chapters with their name and pages. Drafts,
+    which an export leaves out, and page bodies are never kept."""
+    rec = {field: data[field] for field in RECORD_FIELDS[item] if field in data}
+
+    if "books" in data:
+        rec["books"] = [{"id": b["id"], "name": b["name"]} for b in data["books"]]
+
+    if "pages" in data:
+        rec["pages"] = _children(data["pages"])
+
+    if "contents" in data:
+        rec["contents"] = _children(data["contents"])
+
+    return rec
+
+
+def _children(children: List[Dict]) -> List[int | Dict]:
+    """A book's chapters and pages, or a chapter's pages, short of drafts"""
+    kept = []
+
+    for child in children:
+        if child.get("type", "page") == "page":
+            if not child.get("draft"):
+                kept.append(child["id"])
+        else:
+            kept.append(
+                {
+                    "id": child["id"],
+                    "name": child["name"],
+                    "pages": _children(child.get("pages", [])),
+                }
+            )
+
+    return kept
+
+
+def _dated(entry: Dict) -> bool:
+    """Whether a cached record keeps pages as dicts, as records once did"""
+    return any(
+        isinstance(child, dict) and ("type" in child or _dated(child))
+        for child in entry.get("pages", []) + entry.get("contents", [])
+    )
+
+
+def _shared_keys(pairs: List[Tuple[str, Any]]) -> Dict:
+    return {sys.intern(key): value for key, value in pairs}
+
+
+class RemoteCache:
+    """Records of remote items as of the last successful crawl, keyed by type and id"""
+
+    def __init__(self, instance: str, full_crawl: bool = False) -> None:
+        self.instance = instance
+        self.items: Dict[BookstackItems, Dict[int, Dict]] = {}
+        self.watermarks: Dict[BookstackItems, str | None] = {}
+        # types already known to be current, which collectors don't need to list
+        self.fresh: set[BookstackItems] = set()
+        # types whose entries changed since they were loaded or saved
+        self.changed: set[BookstackItems] = set()
+
+        if full_crawl:
+            dbf.clear_remote_cache(instance)
+
+        for item in BookstackItems:
+            self.items[item] = {}
+
+            for row in dbf.select_remote_items(instance, item.value):
+                # rows are decoded one at a time, each would have keys of its own
+                entry = json.loads(row, object_pairs_hook=_shared_keys)
+
+                if "details" in entry:
+                    # kept whole responses before records, slimmed on the next save
+                    entry = record(item, {**entry, **entry.pop("details")})
+                    self.changed.add(item)
+                elif _dated(entry):
+                    entry = record(item, entry)  # pages kept as dicts, made ids
+                    self.changed.add(item)
+
+                self.items[item][entry["id"]] = entry
+
+            self.watermarks[item] = (
+                dbf.select_watermark(instance, item.value) if self.items[item] else None
+            )
+
+    def entries(self, item: BookstackItems) -> List[Dict]:
+        """All cached entries of a type"""
+        return list(self.items[item].values())
+
+    def get(self, item: BookstackItems, id: int) -> Dict | None:
+        return self.items[item].get(id)
+
+    def merge(self, item: BookstackItems, entries: Iterable[Dict]):
+        """Insert or replace entries of a type"""
+        for entry in entries:
+            self.items[item][entry["id"]] = entry
+            self.changed.add(item)
+
+    def prune(self, item: BookstackItems, ids: set):
+        """Drop any cached entries of a type whose id is not in `ids`"""
+        kept = {id: entry for id, entry in self.items[item].items() if id in ids}
+
+        if len(kept) != len(self.items[item]):
+            self.items[item] = kept
+            self.changed.add(item)
+
+    def remove(self, item: BookstackItems, id: int):
+        if self.items[item].pop(id, None) is not None:
+            self.changed.add(item)
+
+    def watermark(self, item: BookstackItems) -> str | None:
+        """Latest `updated_at` among the cached entries of a type"""
+        return max(
+            (entry["updated_at"] for entry in self.items[item].values()), default=None
+        )
+
+    def save(self):
+        """Persist the types which changed along with their new watermark, the rest
+        are as they were loaded"""
+        for item in BookstackItems:
+            if item not in self.changed:
+                continue
+
+            self.watermarks[item] = self.watermark(item)
+            dbf.replace_remote_items(
+                self.instance,
+                item.value,
+                # written as they're dumped, not dumped all at once
+                ((id, json.dumps(entry)) for id, entry in self.items[item].items()),
+                self.watermarks[item],
+            )
+
+        self.changed = set()
@@ -0,0 +1,105 @@
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Tuple
+
+from ..obsidian import Vault
+from .artifacts import Page
+from .moves import page_path
+
+UPDATE_SLACK = 5.0  # seconds between a note's mtime and its page's `updated_at`
+
+
+def epoch(timestamp: str) -> float:
+    """Seconds since the epoch of a Bookstack `updated_at`, which is in UTC"""
+    parsed = datetime.fromisoformat(timestamp.rstrip("Z"))
+    return parsed.replace(tzinfo=timezone.utc).timestamp()
+
+
+class Catalog:
+    """Pages of one side by vault path, held in a column per field rather than an
+    object per page. Sides are joined on their paths and compared row by row."""
+
+    def __init__(self) -> None:
+        self.paths: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.times = array("d")
+        self.ids = array("q")  # remote page ids, -1 for notes
+        # what a side's copy was when it last matched the other, see PageLinks
+        self.fingerprints: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def append(self, path: str, time: float, id: int = -1, fingerprint: str = ""):
+        self.rows[path] = len(self.paths)
+        self.paths.append(path)
+        self.times.append(time)
+        self.ids.append(id)
+        self.fingerprints.append(fingerprint)
+
+    @classmethod
+    def local(cls, vault: Vault, notes: Iterable[str]):
+        """Notes at `notes` vault paths, with the mtimes and hashes the vault scan
+        indexed"""
+        catalog = cls()
+
+        for path in notes:
+            if entry := vault.entries.get(path):
+                catalog.append(path, entry.mtime, fingerprint=entry.hash)
+
+        return catalog
+
+    @classmethod
+    def remote(cls, pages: Iterable[Page]):
+        """Crawled pages, by the vault paths they sync to"""
+        catalog = cls()
+
+        for page in pages:
+            id, updated_at = page.details["id"], page.details["updated_at"]
+            catalog.append(page_path(page), epoch(updated_at), id, updated_at)
+
+        return catalog
+
+
+def join(a: Catalog, b: Catalog) -> List[Tuple[int, int]]:
+    """Rows of `a` with their rows in `b`, paths on one side only are left out"""
+    rows = b.rows
+    return [(i, rows[path]) for i, path in enumerate(a.paths) if path in rows]
+
+
+def newer(a: Catalog, b: Catalog, slack: float) -> List[Tuple[int, int]]:
+    """Rows of `a`, with their rows in `b`, updated more than `slack` seconds after
+    them"""
+    a_times, b_times = a.times, b.times
+    return [(i, j) for i, j in join(a, b) if a_times[i] - b_times[j] > slack]
+
+
+def changes(
+    local: Catalog,
+    remote: Catalog,
+    bases: Dict[int, Tuple[str, str, str]],
+    slack: float,
+) -> Tuple[List[Tuple[int, int]], ...]:
+    """Joined rows which changed locally, remotely and on both sides since they last
+    matched, going by the `bases` recorded then. Pages matched before bases were
+    recorded are told apart by their times instead, so never conflict."""
+    ours, theirs, both = [], [], []
+
+    for i, j in join(local, remote):
+        base = bases.get(remote.ids[j])
+
+        if base and base[0] == local.paths[i] and base[2]:
+            local_changed = local.fingerprints[i] != base[1]
+            remote_changed = remote.fingerprints[j] != base[2]
+        else:
+            ahead = local.times[i] - remote.times[j]
+            local_changed, remote_changed = ahead > slack, -ahead > slack
+
+        if local_changed and remote_changed:
+            both.append((i, j))
+        elif local_changed:
+            ours.append((i, j))
+        elif remote_changed:
+            theirs.append((i, j))
+
+    return ours, theirs, both
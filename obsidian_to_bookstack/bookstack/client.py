@@ -1,16 +1,166 @@
 import json
 import os
+import threading
 from abc import ABC, abstractmethod
+from collections import Counter
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterable, Iterator, Tuple
 
 import urllib3
 
+from ..trace import tracer
 from .constants import *
 
 
+# a write to an item also changes the details of what contains it, named by these
+# fields of the item's own details
+PARENTS = {
+    "pages": {"book_id": "books", "chapter_id": "chapters"},
+    "chapters": {"book_id": "books"},
+}
+# containers an item's details don't name, every one of them is forgotten
+CONTAINERS = {"books": ("shelves",)}
+
+
+def _cached(path: str) -> bool:
+    """Whether GETs of a path are kept for the run, lists and details are while
+    exports, which are read once, aren't"""
+    return len(path.strip("/").split("/")) <= 3
+
+
+def _parse(data: bytes) -> Dict | None:
+    """JSON of a response, None if it isn't"""
+    try:
+        return json.loads(data)
+    except ValueError:
+        return None
+
+
 class Client(ABC):
     ...
 
 
+class ResponseCache:
+    """Successful list and detail GETs of a run, a GET made while the same one is in
+    flight waits on it. Page bodies read this run are kept until they're written, so
+    each is fetched at most once."""
+
+    def __init__(self) -> None:
+        self.responses: Dict[Tuple, Future] = {}
+        self.bodies: Dict[int, bytes] = {}
+        self.lock = threading.Lock()
+
+    def get(self, key: Tuple, fetch: Callable) -> urllib3.BaseHTTPResponse:
+        with self.lock:
+            future = self.responses.get(key)
+            fetching = future is None
+
+            if fetching:
+                future = self.responses[key] = Future()
+
+        if not fetching:
+            return future.result()
+
+        try:
+            resp = fetch()
+        except BaseException as e:
+            self.__drop(key, future)
+            future.set_exception(e)
+            raise
+
+        if resp.status != 200:
+            self.__drop(key, future)  # waiters share it, later requests retry
+
+        future.set_result(resp)
+        return resp
+
+    def __drop(self, key: Tuple, future: Future):
+        with self.lock:
+            if self.responses.get(key) is future:
+                del self.responses[key]
+
+    def body(self, id: int) -> bytes | None:
+        """Body of a page already read this run, without its header"""
+        return self.bodies.get(id)
+
+    def keep_body(self, id: int, body: bytes) -> bytes:
+        with self.lock:
+            self.bodies[id] = body
+
+        return body
+
+    def forget_bodies(self, ids: Iterable[int]):
+        """Drop bodies once they're written, the notes hold them from then on"""
+        with self.lock:
+            for id in ids:
+                self.bodies.pop(id, None)
+
+    def invalidate(
+        self, path: str, method: str, sent: Dict | None = None, received: bytes = b""
+    ):
+        """Forget what a write to `path` changed: the item itself, lists of its type,
+        the audit log and the containers listing the item. Those are named by the
+        request, its response and the item's cached details, the last being where it
+        was before a move or delete."""
+        parts = path.strip("/").split("/")
+        kind = parts[1] if len(parts) > 1 else ""
+        item = f"/api/{kind}/{parts[2]}" if len(parts) > 2 else None
+        fields = PARENTS.get(kind, {})
+        prefixes = [BookstackAPIEndpoints.AUDIT_LOG.value]
+        prefixes += [f"/api/{c}" for c in CONTAINERS.get(kind, ())]
+
+        with self.lock:
+            before = self.__details(item) if item and fields else None
+            parents = set()
+
+            for details in (sent, before, _parse(received) if fields else None):
+                for field, container in fields.items():
+                    if isinstance(details, dict) and details.get(field):
+                        parents.add(f"/api/{container}/{details[field]}")
+
+            # moved or deleted without its old place known, any container may list it
+            moved = method == "DELETE" or (
+                method == "PUT" and any(field in (sent or {}) for field in fields)
+            )
+            if moved and before is None:
+                prefixes += [f"/api/{c}" for c in set(fields.values())]
+
+            def affected(cached: str) -> bool:
+                if cached == f"/api/{kind}" or cached.startswith(tuple(prefixes)):
+                    return True
+
+                return any(
+                    cached == stale or cached.startswith(stale + "/")
+                    for stale in ([item] if item else []) + list(parents)
+                )
+
+            for key in [key for key in self.responses if affected(key[0])]:
+                del self.responses[key]
+
+            if kind == "pages" and len(parts) > 2 and parts[2].isdigit():
+                self.bodies.pop(int(parts[2]), None)
+
+    def __details(self, item: str) -> Dict | None:
+        """An item's details, if a finished GET this run read them"""
+        future = self.responses.get((item, ()))
+
+        if future is None or not future.done() or future.exception():
+            return None
+
+        resp = future.result()
+        return _parse(resp.data) if resp.status == 200 else None
+
+    def clear(self):
+        with self.lock:
+            self.responses = {}
+            self.bodies = {}
+
+    def release(self):
+        """Drop every response read so far, keeping the bodies"""
+        with self.lock:
+            self.responses = {}
+
+
 class RemoteClient(Client):
     @abstractmethod
     def __init__(self) -> None:
@@ -19,7 +169,9 @@ class RemoteClient(Client):
         self.secret = os.getenv("BOOKSTACK_TOKEN_SECRET")
         self.base_url = os.getenv("BOOKSTACK_BASE_URL")
         self.headers = {"Authorization": f"Token {self.id}:{self.secret}"}
-        self.http = urllib3.PoolManager()
+        self.http = urllib3.PoolManager(maxsize=MAX_CONNECTIONS)
+        self.requests: Counter = Counter()  # made so far, by method
+        self.responses = ResponseCache()
 
     def _make_request(
         self,
@@ -27,24 +179,74 @@ class RemoteClient(Client):
         endpoint: BookstackAPIEndpoints | DetailedBookstackLink,
         body=None,
         json=None,
+        fields=None,
+        cache: bool = True,
     ) -> urllib3.BaseHTTPResponse:
-        """Make a HTTP request to a Bookstack API Endpoint"""
+        """Make a HTTP request to a Bookstack API Endpoint.
+        List and detail GETs are made once per run, until a write to what they read,
+        unless `cache` is off for what's only read once."""
 
         assert self.base_url
 
-        request_url = self.base_url + endpoint.value
-        resp = self.http.request(
-            request_type.value, request_url, headers=self.headers, body=body, json=json
+        def fetch() -> urllib3.BaseHTTPResponse:
+            self.requests[request_type.value] += 1
+
+            with tracer.span(f"{request_type.value} {endpoint.value}", "http") as args:
+                resp = self.http.request(
+                    request_type.value,
+                    self.base_url + endpoint.value,
+                    headers=self.headers,
+                    body=body,
+                    json=json,
+                    fields=fields,
+                )
+                args["status"] = resp.status
+                args["bytes"] = len(resp.data)
+
+            return resp
+
+        if request_type == RequestType.GET and not (cache and _cached(endpoint.value)):
+            return fetch()
+
+        if request_type == RequestType.GET:
+            key = (endpoint.value, tuple(sorted((fields or {}).items())))
+            return self.responses.get(key, fetch)
+
+        resp = fetch()
+        self.responses.invalidate(
+            endpoint.value, request_type.value, json or fields, resp.data
         )
         return resp
 
-    def _get_from_client(self, endpoint: BookstackAPIEndpoints):
-        """Make a GET request to a Bookstack API Endpoint"""
-        resp = self._make_request(RequestType.GET, endpoint)
-        assert resp
+    def _get_from_client(self, endpoint: BookstackAPIEndpoints, params=None):
+        """Make a GET request to a Bookstack API Endpoint, following every page of results"""
+        return list(self._iter_from_client(endpoint, params))
+
+    def _iter_from_client(
+        self, endpoint: BookstackAPIEndpoints, params=None, cache: bool = True
+    ) -> Iterator[Dict]:
+        """Like `_get_from_client`, holding one page of results at a time"""
+        offset = 0
+
+        while True:
+            fields = {**(params or {}), "count": LIST_PAGE_SIZE, "offset": offset}
+            resp = self._make_request(
+                RequestType.GET, endpoint, fields=fields, cache=cache
+            )
+            assert resp
+
+            data = json.loads(resp.data)
+            offset += len(data["data"])
+            yield from data["data"]
+
+            if not data["data"] or offset >= data["total"]:
+                return
 
-        data = json.loads(resp.data.decode())
-        return data["data"]
+    def _get_total(self, endpoint: BookstackAPIEndpoints, params=None) -> int:
+        """Get the number of items a Bookstack API Endpoint would list"""
+        fields = {**(params or {}), "count": 1}
+        resp = self._make_request(RequestType.GET, endpoint, fields=fields)
+        return json.loads(resp.data)["total"]
 
 
 class LocalClient(Client):
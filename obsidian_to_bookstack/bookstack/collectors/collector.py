@@ -1,10 +1,15 @@
-import os
+import json
 from abc import ABC, abstractmethod
+from typing import Dict, List
 
-from ...console import console
+from ...events import events
+from ..cache import record
 from ..client import RemoteClient
 from ..constants import *
 
+# types whose details hold their children, pages are described fully by a listing
+DETAILED = [BookstackItems.SHELF, BookstackItems.BOOK, BookstackItems.CHAPTER]
+
 
 class BaseCollector(ABC):
     @abstractmethod
@@ -24,29 +29,90 @@ class LocalCollector(BaseCollector):
         self.path = path
         self.excluded = excluded
 
-    def _get_missing_set(self, item: BookstackItems, sync_type: SyncType):
-        """Returns a missing set of items, can either compare to local or remote. Returns list of missing items."""
-        attr = BOOKSTACK_ATTR_MAP[item]
 
-        items = getattr(self.local, attr)
-        client_items = getattr(self.client, attr)
+class RemoteCollector(BaseCollector):
+    def __init__(self, verbose: bool, client: RemoteClient) -> None:
+        super().__init__(verbose)
+        self.client = client
+
+    def _get_details(self, endpoint: BookstackAPIEndpoints, id: int) -> Dict:
+        """Get the detailed view of a single remote item"""
 
-        item_names = set(os.path.splitext(item.name)[0] for item in items)
-        client_item_names = set(item.name for item in client_items)
+        class DetailedLink(DetailedBookstackLink):
+            LINK = f"{endpoint.value}/{id}"
 
-        if sync_type == SyncType.LOCAL:
-            missing = client_item_names - item_names
-            missing_items = [ci for ci in client_items if ci.name in missing]
+        # recorded as soon as it's read, nothing reads it again
+        resp = self.client._make_request(
+            RequestType.GET, DetailedLink.LINK, cache=False
+        )
+        return json.loads(resp.data)
+
+    def _collect(self, endpoint: BookstackAPIEndpoints, item: BookstackItems) -> List[Dict]:
+        """Returns a record of every remote item of a type, only fetching what changed since the last crawl"""
+        cache = self.client.cache
+        watermark = cache.watermarks[item]
+
+        if item in cache.fresh:
+            return cache.entries(item)
+
+        # listings are read a page at a time, only the records of what changed are kept.
+        # A full listing isn't cached either, unlike a filtered one it's read just once.
+        if watermark is None:
+            listed = self.client._iter_from_client(endpoint, cache=False)
         else:
-            missing = item_names - client_item_names
-            missing_items = [
-                ci for ci in items if os.path.splitext(ci.name)[0] in missing
-            ]
+            # `gte` so items updated within the same instant as the watermark aren't missed
+            listed = self.client._iter_from_client(
+                endpoint,
+                params={"filter[updated_at:gte]": watermark, "sort": "+updated_at"},
+            )
 
-        return missing_items
+        seen = set()
+        changed = []
+        for entry in listed:
+            seen.add(entry["id"])
+            cached = cache.get(item, entry["id"])
+            if cached and cached["updated_at"] == entry["updated_at"]:
+                continue
 
+            # a detailed response is recorded and dropped, the listing holds none of it
+            data = entry
+            if item in DETAILED:
+                data = {**entry, **self._get_details(endpoint, entry["id"])}
 
-class RemoteCollector(BaseCollector):
-    def __init__(self, verbose: bool, client: RemoteClient) -> None:
-        super().__init__(verbose)
-        self.client = client
+            changed.append(record(item, data))
+            events.item("fetched", item.value, entry["name"])
+
+        if watermark is None:
+            cache.prune(item, seen)
+        elif self.client._get_total(endpoint) != len(set(cache.items[item]) | seen):
+            # something was deleted remotely, a plain listing is enough to prune it
+            remaining = self.client._iter_from_client(endpoint, cache=False)
+            cache.prune(item, {entry["id"] for entry in remaining})
+
+        cache.merge(item, changed)
+        return cache.entries(item)
+
+    def _changed(self, endpoint: BookstackAPIEndpoints, item: BookstackItems) -> bool:
+        """Whether any item of a type changed since the last crawl, from the listings
+        `_collect` starts with, which a crawl right after reuses"""
+        cache = self.client.cache
+        watermark = cache.watermarks[item]
+
+        if item in cache.fresh:
+            return False
+
+        if watermark is None:
+            return True
+
+        listed = self.client._get_from_client(
+            endpoint,
+            params={"filter[updated_at:gte]": watermark, "sort": "+updated_at"},
+        )
+
+        for entry in listed:
+            cached = cache.get(item, entry["id"])
+            if not cached or cached["updated_at"] != entry["updated_at"]:
+                return True
+
+        known = set(cache.items[item]) | {entry["id"] for entry in listed}
+        return self.client._get_total(endpoint) != len(known)
@@ -1,5 +1,6 @@
+import json
 import os
-from typing import List
+from typing import Dict, Iterator, List
 
 import urllib3
 
@@ -7,7 +8,8 @@ from obsidian_to_bookstack.bookstack.artifacts import Book, Shelf
 from obsidian_to_bookstack.bookstack.client import RemoteClient
 from obsidian_to_bookstack.bookstack.collectors.collector import LocalCollector
 from obsidian_to_bookstack.bookstack.constants import *
-from obsidian_to_bookstack.console import console
+from obsidian_to_bookstack.events import events
+from obsidian_to_bookstack.obsidian.Vault import FOLDER
 
 
 class LocalBookCollector(LocalCollector):
@@ -27,69 +29,75 @@ class LocalBookCollector(LocalCollector):
 
         return books
 
-    def update_shelf_books(self, missing_books: List[Book]):
-        """Update's a shelf's books array"""
-        new_books = []
-        s = {}
-        map = self.client._get_temp_book_map()
-
-        for book in missing_books:
-            if book.shelf not in s:
-                s[book.shelf] = [book]
-            else:
-                s[book.shelf].append(book)
-
-        for shelf in s:
-            new_books = []
-            for book in s[shelf]:
-                new_books.append(map[book.name])
+    def iter_books(self, shelves: Iterator[Shelf]) -> Iterator[Book]:
+        """Yield local books one at a time, each with its own chapters and pages.
+        Shelves and books holding the same items as their remote copy are skipped."""
+        diff = self.local.diff
 
-            client_shelf = self.client._retrieve_from_client_map(shelf)
-
-            if client_shelf:
-                books = new_books
-                if client_shelf.details.get("books"):
-                    books = client_shelf.details["books"] + new_books
+        for shelf in shelves:
+            if diff.same(shelf.name):
+                events.item("skipped", "page", shelf.name, count=diff.pages(shelf.name))
+                continue
+
+            for entry in self.local.vault.children(shelf.path):
+                if entry.kind != FOLDER:
+                    continue
+
+                if diff.same(shelf.name, entry.name):
+                    count = diff.pages(shelf.name, entry.name)
+                    events.item("skipped", "page", entry.path, count=count)
+                    continue
+
+                yield Book(
+                    path=os.path.join(shelf.path, entry.name),
+                    name=entry.name,
+                    client=self.client,
+                    shelf=shelf,
+                    from_client=False,
+                    vault=self.local.vault,
+                )
+
+    def update_shelf_books(self, shelf: Dict, book_ids: List[int]):
+        """Update's a shelf's books array"""
+        data = {"name": shelf["name"], "books": book_ids}
 
-                data = {
-                    "name": client_shelf.details["name"],
-                    "books": books,
-                }
+        self.client.headers["Content-Type"] = "application/json"
 
-                self.client.headers["Content-Type"] = "application/json"
+        class ShelfUpdate(DetailedBookstackLink):
+            LINK = f"/api/shelves/{shelf['id']}"
 
-                class ShelfUpdate(DetailedBookstackLink):
-                    LINK = f"/api/shelves/{client_shelf.details['id']}"
+        resp = self.client._make_request(RequestType.PUT, ShelfUpdate.LINK, json=data)
 
-                self.client._make_request(RequestType.PUT, ShelfUpdate.LINK, json=data)
+        if resp.status != 200:
+            raise RuntimeError(f"HTTP {resp.status}")
 
     def create_local_missing_books(self) -> None:
         """Create any missing books in the local store"""
-        missing_books = self._get_missing_set(BookstackItems.BOOK, SyncType.LOCAL)
+        for book in self.client.books:
+            if not book.shelf or book.shelf.name in self.excluded:
+                continue
 
-        for book in missing_books:
             path = os.path.join(self.path, book.shelf.name, book.name)
-            os.mkdir(path)
-
-            if self.verbose:
-                console.log(f"Creating a book at: {path}")
-
-    def _create_remote_missing_books(self) -> List[Book] | List:
-        """Create any books in the remote which are missing"""
-        missing_books = self._get_missing_set(BookstackItems.BOOK, SyncType.REMOTE)
-        for book in missing_books:
-            if self.verbose:
-                console.log(f"Bookstack missing book: {book}")
 
-            encoded_data, content_type = urllib3.encode_multipart_formdata(
-                {"name": book.name}
-            )
-            self.client.headers["Content-Type"] = content_type
-            self.client._make_request(
-                RequestType.POST, BookstackAPIEndpoints.BOOKS, body=encoded_data
-            )
+            if self.local.vault.get(path):
+                continue
 
-        if missing_books:
-            return missing_books  # save to update shelf location
-
-        return []
+            os.mkdir(path)
+            self.local.vault.update(path)
+            events.item("created", "book", path)
+
+    def create_remote_book(self, book: Book) -> Dict:
+        """Create a book in the remote, returns its details"""
+        encoded_data, content_type = urllib3.encode_multipart_formdata(
+            {"name": book.name}
+        )
+        self.client.headers["Content-Type"] = content_type
+        resp = self.client._make_request(
+            RequestType.POST, BookstackAPIEndpoints.BOOKS, body=encoded_data
+        )
+
+        if resp.status != 200:
+            raise RuntimeError(f"HTTP {resp.status}")
+
+        events.item("created", "book", book.name)
+        return json.loads(resp.data)
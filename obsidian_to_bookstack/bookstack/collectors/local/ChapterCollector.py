@@ -1,13 +1,14 @@
+import json
 import os
-from typing import List
+from typing import Dict, List
 
 import urllib3
 
-from obsidian_to_bookstack.bookstack.artifacts import Book
+from obsidian_to_bookstack.bookstack.artifacts import Book, Chapter
 from obsidian_to_bookstack.bookstack.client import RemoteClient
 from obsidian_to_bookstack.bookstack.collectors.collector import LocalCollector
 from obsidian_to_bookstack.bookstack.constants import *
-from obsidian_to_bookstack.console import console
+from obsidian_to_bookstack.events import events
 
 
 class LocalChapterCollector(LocalCollector):
@@ -26,35 +27,39 @@ class LocalChapterCollector(LocalCollector):
         return chapters
 
     def create_local_missing_chapters(self):
-        missing_chapters = self._get_missing_set(BookstackItems.CHAPTER, SyncType.LOCAL)
-
-        for chapter in missing_chapters:
-            if chapter.book:
-                path = os.path.join(
-                    self.path, chapter.book.shelf.name, chapter.book.name, chapter.name
-                )
-                if self.verbose:
-                    console.log(f"Creating a chapter at: {path}")
-                os.mkdir(path)
-
-    def create_remote_missing_chapters(self):
-        """Create any chapters in the remote which are missing"""
-        missing_chapters = self._get_missing_set(
-            BookstackItems.CHAPTER, SyncType.REMOTE
+        """Create any missing chapters in the local store"""
+        for chapter in self.client.chapters:
+            book = chapter.book
+
+            if not book or not book.shelf or book.shelf.name in self.excluded:
+                continue
+
+            path = os.path.join(self.path, book.shelf.name, book.name, chapter.name)
+
+            if self.local.vault.get(path):
+                continue
+
+            os.mkdir(path)
+            self.local.vault.update(path)
+            events.item("created", "chapter", path)
+
+    def get_remote_missing_chapters(self, book: Book, client_book: Book | None):
+        """Chapters of a local book which its remote copy is missing"""
+        client_chapters = {c.name for c in client_book.chapters} if client_book else set()
+        return [c for c in book.chapters if c.name not in client_chapters]
+
+    def create_remote_chapter(self, chapter: Chapter, book_id: int) -> Dict:
+        """Create a chapter in the remote, returns its details"""
+        encoded_data, content_type = urllib3.encode_multipart_formdata(
+            {"name": chapter.name, "book_id": book_id}
+        )
+        self.client.headers["Content-Type"] = content_type
+        resp = self.client._make_request(
+            RequestType.POST, BookstackAPIEndpoints.CHAPTERS, body=encoded_data
         )
-        for chapter in missing_chapters:
-            if self.verbose:
-                console.log(f"Bookstack missing chapter: {chapter}")
-
-            client_book = self.client._retrieve_from_client_map(chapter.book)
-
-            encoded_data, content_type = urllib3.encode_multipart_formdata(
-                {"name": chapter.name, "book_id": client_book.details["id"]}
-            )
-            self.client.headers["Content-Type"] = content_type
-            self.client._make_request(
-                RequestType.POST, BookstackAPIEndpoints.CHAPTERS, body=encoded_data
-            )
-
-        # if missing_chapters:
-        #     self.missing_books = missing_chape  # save to update shelf location
+
+        if resp.status != 200:
+            raise RuntimeError(f"HTTP {resp.status}")
+
+        events.item("created", "chapter", chapter.name)
+        return json.loads(resp.data)
@@ -1,11 +1,21 @@
+import json
 import os
-from typing import List, Type
+from typing import Dict, List, Set, Tuple, Type
 
 from obsidian_to_bookstack.bookstack.artifacts import Book, Page
+from obsidian_to_bookstack.bookstack.cache import record
 from obsidian_to_bookstack.bookstack.client import RemoteClient
 from obsidian_to_bookstack.bookstack.collectors.collector import LocalCollector
 from obsidian_to_bookstack.bookstack.constants import *
+from obsidian_to_bookstack.bookstack.export import (Sequence, book_sequence,
+                                                    chapter_sequence,
+                                                    split_export, strip_header,
+                                                    worth_exporting)
+from obsidian_to_bookstack.bookstack.links import (translate_to_local,
+                                                   translate_to_remote)
 from obsidian_to_bookstack.console import console
+from obsidian_to_bookstack.events import events
+from obsidian_to_bookstack.utils import write_atomic
 
 
 class LocalPageCollector(LocalCollector):
@@ -29,106 +39,355 @@ class LocalPageCollector(LocalCollector):
 
         return pages
 
-    def __download_content(self, page):
-        """Download content from item in remote instance"""
+    def __export(self, endpoint: BookstackAPIEndpoints, id: int) -> bytes:
+        """Download the markdown export of a whole book or chapter"""
 
-        class PageMarkdownLink(DetailedBookstackLink):
-            LINK = f"/api/pages/{page.details['id']}/export/markdown"
+        class MarkdownExportLink(DetailedBookstackLink):
+            LINK = f"{endpoint.value}/{id}/export/markdown"
 
-        content = self.client._make_request(RequestType.GET, PageMarkdownLink.LINK)
-        return content.data
+        return self.client._make_request(RequestType.GET, MarkdownExportLink.LINK).data
 
-    def __remove_header(self, content, end, inc=False):  # oof
-        first_index = content.find(b"#")
-        end = f"{end}".encode()
-        second_index = content.find(end, first_index + 1)
+    def __refresh_details(self, kind: BookstackItems, item):
+        """Refetch the details of a book or chapter, its cached contents miss pages created since"""
 
-        if inc:
-            second_index += 2
+        class DetailLink(DetailedBookstackLink):
+            LINK = f"{BOOKSTACK_ENDPOINT_MAP[kind].value}/{item.details['id']}"
 
-        if first_index != -1 and second_index != -1:
-            new_content = content[:first_index] + content[second_index:]
-            return new_content
-        else:
-            return content
+        resp = self.client._make_request(RequestType.GET, DetailLink.LINK)
+        item.details.update(record(kind, json.loads(resp.data)))
 
-    def __remove_full_header(self, content):
-        content = self.__remove_header(content, "#")
-        content = self.__remove_header(content, "\n\n", inc=True)
-        return content
+    def __keep_export(self, exported: bytes, sequence: Sequence) -> Dict[int, bytes]:
+        """Split a book or chapter export into the bodies of its pages, keeping them
+        all for the rest of the run"""
+        names = {id: name for name, id, _ in sequence if id is not None}
 
-    def create_local_missing_pages(self):
-        """Create any missing pages in the local store, and write content to files which are missing."""
-        missing_pages = self._get_missing_set(BookstackItems.PAGE, SyncType.LOCAL)
-        for page in missing_pages:
-            content = self.__download_content(page)
-            path_components = [self.path, page.book.shelf.name, page.book.name]
+        return {
+            id: self.client.responses.keep_body(id, strip_header(content, names[id]))
+            for id, content in split_export(exported, sequence).items()
+        }
+
+    def __download_contents(self, pages: List[Page]) -> Dict[int, bytes | None]:
+        """Bodies of many pages without their header, keyed by page id and None for
+        pages which are gone, for the caller to write. Each body is fetched at most once
+        a run, exporting a whole book or chapter where most of it is needed."""
+        contents = {}
+        by_book: Dict[int, List[Page]] = {}
+
+        for page in pages:
+            body = self.client.responses.body(page.details["id"])
 
-            if page.chapter:
-                path_components.append(page.chapter.name)
+            if body is not None:
+                contents[page.details["id"]] = body
+            elif page.book:
+                by_book.setdefault(page.book.details["id"], []).append(page)
 
-            path_components.append(page.name + ".md")
+        for needed in by_book.values():
+            book = needed[0].book
+            sequence = None
 
-            path = os.path.join(*path_components)
+            if worth_exporting(len(needed), len(book.pages)):
+                sequence = book_sequence(book)
 
-            if content is not None:
+                if sequence is None:
+                    self.__refresh_details(BookstackItems.BOOK, book)
+                    sequence = book_sequence(book)
+
+            if sequence:
                 if self.verbose:
-                    console.log(f"Creating a page at: {path}")
+                    console.log(f"Exporting book: {book}")
 
-                with open(path, "wb") as f:
-                    content = self.__remove_header(content, "\n\n", inc=True)
-                    f.write(content)
+                exported = self.__export(BookstackAPIEndpoints.BOOKS, book.details["id"])
+                contents.update(self.__keep_export(exported, sequence))
+                continue
 
-    def create_remote_missing_pages(self):
-        """Create any pages in the remote which are missing"""
-        missing_pages = self._get_missing_set(BookstackItems.PAGE, SyncType.REMOTE)
-        for page in missing_pages:
-            if self.verbose:
-                console.log(f"Bookstack missing page: {page}")
+            by_chapter: Dict[int, List[Page]] = {}
+            for page in needed:
+                if page.chapter:
+                    by_chapter.setdefault(page.chapter.details["id"], []).append(page)
 
-            client_book = self.client._retrieve_from_client_map(page.book)
+            for chapter_pages in by_chapter.values():
+                chapter = chapter_pages[0].chapter
 
-            client_chapter = None
+                if not worth_exporting(len(chapter_pages), len(chapter.pages)):
+                    continue
 
-            if page.chapter:
-                client_chapter = self.client._retrieve_from_client_map(page.chapter)
+                sequence = chapter_sequence(chapter)
 
-            book_id = client_book.details["id"]
+                if sequence is None:
+                    self.__refresh_details(BookstackItems.CHAPTER, chapter)
+                    sequence = chapter_sequence(chapter)
 
-            content = ""
+                if sequence:
+                    if self.verbose:
+                        console.log(f"Exporting chapter: {chapter}")
 
-            with open(page.path, "r") as f:
-                content = str(f.read())
+                    exported = self.__export(
+                        BookstackAPIEndpoints.CHAPTERS, chapter.details["id"]
+                    )
+                    contents.update(self.__keep_export(exported, sequence))
 
-            data = {
-                "book_id": book_id,
-                "name": os.path.splitext(page.name)[0],
-                "markdown": content,
+        for page in pages:
+            # a few pages, or ones a split couldn't find
+            if page.details["id"] not in contents:
+                contents[page.details["id"]] = self.client._get_body(
+                    page.details["id"], page.name
+                )
+
+        bodies = {page.details["id"]: contents[page.details["id"]] for page in pages}
+        self.client.responses.forget_bodies(bodies)
+        return bodies
+
+    def __page_dir(self, page: Page) -> str:
+        """Directory of a local page relative to the vault, for resolving relative links"""
+        return os.path.relpath(os.path.dirname(page.path), self.path)
+
+    def __local_path(self, page: Page) -> str:
+        """Where a remote page belongs in the vault"""
+        assert page.book and page.book.shelf
+        path_components = [self.path, page.book.shelf.name, page.book.name]
+
+        if page.chapter:
+            path_components.append(page.chapter.name)
+
+        path_components.append(page.name + ".md")
+
+        return os.path.join(*path_components)
+
+    def __link(self, id: int, path: str, updated_at: str | None = None):
+        """Remember which note a page is, to tell renames from new notes later and
+        which side changed since, `updated_at` being the page's as it was written"""
+        if entry := self.local.vault.get(path):
+            self.local.page_links.set(id, entry.path, entry.hash, updated_at)
+
+    def create_local_missing_pages(self, moved: Set[int] = set()):
+        """Create any missing pages in the local store, and write content to files which are missing.
+        Pages are downloaded and written a book at a time, `moved` pages are left for `remote`
+        and books holding the same pages on both sides aren't looked at."""
+        diff = self.local.diff
+
+        for book in self.client.books:
+            if not book.shelf or book.shelf.name in self.excluded:
+                continue
+
+            if diff.same(book.shelf.name, book.name):
+                events.item("skipped", "page", book.name, count=len(book.pages))
+                continue
+
+            missing_pages = [
+                page
+                for page in book.pages
+                if not self.local.vault.get(self.__local_path(page))
+                and page.details["id"] not in moved
+            ]
+
+            if missing_pages:
+                self.__create_local_pages(book, missing_pages)
+
+            if len(book.pages) > len(missing_pages):
+                skipped = len(book.pages) - len(missing_pages)
+                events.item("skipped", "page", book.name, count=skipped)
+
+    def __create_local_pages(self, book: Book, missing_pages: List[Page]):
+        assert book.shelf
+        journal = self.local.journal
+        path = f"{book.shelf.name}/{book.name}"
+
+        with journal.operation("local", "download", "book", path) as op:
+            contents = self.__download_contents(missing_pages)
+
+        if not op.ok:
+            return
+
+        downloads = []
+
+        for page in missing_pages:
+            content = contents[page.details["id"]]
+
+            if content is not None and self.local.vault.ignore.too_large(len(content)):
+                events.item("skipped", "page", page.name, error="over the size limit")
+            elif content is not None:
+                downloads.append((page, self.__local_path(page), content.decode()))
+
+        translated = translate_to_local(
+            self.local.link_index, [content for _, _, content in downloads]
+        )
+
+        for (page, path, _), (content, _) in zip(downloads, translated):
+            relpath = self.local.vault.relpath(path)
+
+            with journal.operation("local", "write", "page", relpath):
+                data = content.encode()
+                write_atomic(path, data)
+
+                self.local.vault.update(path)
+                self.__link(page.details["id"], path, page.details.get("updated_at"))
+                events.item("created", "page", path, bytes=len(data))
+
+    def get_remote_missing_pages(self, book: Book, client_book: Book | None):
+        """Pages of a local book which its remote copy is missing"""
+        client_pages = set()
+        if client_book:
+            client_pages = {
+                (page.chapter.name if page.chapter else None, page.name)
+                for page in client_book.pages
             }
 
-            if client_chapter:
-                data["chapter_id"] = client_chapter.details["id"]
+        pages = book.pages + [page for chapter in book.chapters for page in chapter.pages]
+        return [
+            page
+            for page in pages
+            if (page.chapter.name if page.chapter else None, os.path.splitext(page.name)[0])
+            not in client_pages
+        ]
+
+    def create_remote_pages(
+        self, missing_pages: List[Page], book_id: int, chapter_ids: Dict[str, int]
+    ) -> List:
+        """Create pages of one book in the remote, returns the vault paths and new ids
+        of those whose links point at pages which don't exist yet"""
+        contents = [(page.content, self.__page_dir(page)) for page in missing_pages]
+        translated = translate_to_remote(self.local.link_index, contents)
+        unresolved_pages = []
+
+        for page, (content, unresolved) in zip(missing_pages, translated):
+            path = self.local.vault.relpath(page.path)
+
+            with self.local.journal.operation("remote", "create", "page", path) as op:
+                name = os.path.splitext(page.name)[0]
+                data = {"book_id": book_id, "name": name, "markdown": content}
+
+                if page.chapter:
+                    data["chapter_id"] = chapter_ids[page.chapter.name]
+
+                self.client.headers["Content-Type"] = "application/json"
+                resp = self.client._make_request(
+                    RequestType.POST, BookstackAPIEndpoints.PAGES, json=data
+                )
+
+                if resp.status != 200:
+                    raise RuntimeError(f"HTTP {resp.status}")
+
+                events.item("created", "page", page.path, bytes=len(content.encode()))
+
+                details = json.loads(resp.data)
+                id = details["id"]
+                self.__link(id, page.path, details.get("updated_at"))
+                # later books can link straight to it
+                self.local.link_index._add(os.path.splitext(path)[0], id)
+
+                if unresolved:
+                    # a resumed run relinks it if this one doesn't get to
+                    op.result = str(id)
+                    unresolved_pages.append((path, id))
+
+        return unresolved_pages
+
+    def move_remote_pages(
+        self,
+        pages: List[Page],
+        book_id: int,
+        chapter_ids: Dict[str, int],
+        moves: Dict[str, Tuple[int, str]],
+    ) -> List[Page]:
+        """Rename or move the remote pages of notes which were renamed or moved locally,
+        `moves` maps their vault paths to page ids. Returns the pages left to create,
+        a move which fails is tried again next run."""
+        remaining = []
+
+        for page in pages:
+            path = self.local.vault.relpath(page.path)
+
+            if path not in moves:
+                remaining.append(page)
+                continue
+
+            id, old_path = moves[path]
+
+            with self.local.journal.operation("remote", "move", "page", path):
+                data = {"name": os.path.splitext(page.name)[0], "book_id": book_id}
+
+                if page.chapter:
+                    data["chapter_id"] = chapter_ids[page.chapter.name]
+
+                class PageLink(DetailedBookstackLink):
+                    LINK = f"/api/pages/{id}"
+
+                self.client.headers["Content-Type"] = "application/json"
+                resp = self.client._make_request(
+                    RequestType.PUT, PageLink.LINK, json=data
+                )
+
+                if resp.status != 200:
+                    raise RuntimeError(f"HTTP {resp.status}")
+
+                self.__link(id, path, json.loads(resp.data).get("updated_at"))
+                events.item("moved", "page", f"{old_path} -> {path}")
+
+        return remaining
+
+    def move_local_pages(self, moves: List[Tuple[int, str, str]]):
+        """Rename or move the notes of pages which were renamed or moved remotely"""
+        vault = self.local.vault
+
+        for id, old_path, path in moves:
+            target = vault.abspath(path)
+            folder = os.path.dirname(path)
+
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.rename(vault.abspath(old_path), target)
+
+            # index any folders the move created, then both ends of it
+            parts = folder.split("/")
+            for i in range(1, len(parts) + 1):
+                vault.update("/".join(parts[:i]))
+
+            vault.update(old_path)
+            vault.update(path)
+            self.__link(id, path)
+            events.item("moved", "page", f"{old_path} -> {path}")
 
-            self.client.headers["Content-Type"] = "application/json"
-            self.client._make_request(
-                RequestType.POST, BookstackAPIEndpoints.PAGES, json=data
-            )
+    def relink_pages(self, pages: List[Tuple[str, int]]):
+        """Rewrite the links of newly created pages, by vault path and page id,
+        once the pages they link to exist"""
+        for path, id in pages:
+            with self.local.journal.operation("remote", "relink", "page", path) as op:
+                op.result = str(id)
+
+                with open(self.local.vault.abspath(path), "r") as f:
+                    content, _ = self.local.link_index.to_remote(
+                        f.read(), os.path.dirname(path)
+                    )
+
+                class PageLink(DetailedBookstackLink):
+                    LINK = f"/api/pages/{id}"
+
+                self.client.headers["Content-Type"] = "application/json"
+                resp = self.client._make_request(
+                    RequestType.PUT, PageLink.LINK, json={"markdown": content}
+                )
+
+                if resp.status != 200:
+                    raise RuntimeError(f"HTTP {resp.status}")
+
+                self.__link(id, path, json.loads(resp.data).get("updated_at"))
+                events.item("updated", "page", path, bytes=len(content.encode()))
 
     def update_local_content(self, page: Page, client_page: Page):
         """Update the content of a page in the remote"""
         assert page.book
+        path = self.local.vault.relpath(page.path)
 
-        client_book = self.client._retrieve_from_client_map(page.book)
-        client_chapter = self.client._retrieve_from_client_map(page.chapter)
+        with self.local.journal.operation("update", "update", "page", path):
+            client_book = self.client._retrieve_from_client_map(page.book)
+            client_chapter = self.client._retrieve_from_client_map(page.chapter)
 
-        content = None
+            with open(page.path, "r") as f:
+                content = "".join(f.readlines()[0:])  # remove header
 
-        with open(page.path, "r") as f:
-            content = "".join(f.readlines()[0:])  # remove header
+            content, _ = self.local.link_index.to_remote(content, self.__page_dir(page))
 
-        if content:
-            if self.verbose:
-                console.log(f"Updating remote page: {page}")
+            if not content:
+                return
 
             data = {
                 "book_id": client_book.details["id"],
@@ -142,9 +401,31 @@ class LocalPageCollector(LocalCollector):
             class PageLink(DetailedBookstackLink):
                 LINK = f"/api/pages/{client_page.details['id']}"
 
-            self.client._make_request(RequestType.PUT, PageLink.LINK, json=data)
+            self.client.headers["Content-Type"] = "application/json"
+            resp = self.client._make_request(RequestType.PUT, PageLink.LINK, json=data)
 
-    def update(self, client_page: Page):
-        """Downloads and removes full header"""
-        content = self.__download_content(client_page)
-        return self.__remove_full_header(content)
+            if resp.status != 200:
+                raise RuntimeError(f"HTTP {resp.status}")
+
+            self.__link(
+                client_page.details["id"],
+                page.path,
+                json.loads(resp.data).get("updated_at"),
+            )
+            events.item("updated", "page", page.path, bytes=len(content.encode()))
+
+    def update(self, client_pages: List[Page]) -> Dict[int, bytes]:
+        """Downloads the bodies of pages, keyed by page id. Pages which are gone are
+        left out."""
+        contents = {
+            id: content
+            for id, content in self.__download_contents(client_pages).items()
+            if content is not None
+        }
+        translated = translate_to_local(
+            self.local.link_index, [content.decode() for content in contents.values()]
+        )
+
+        return {
+            id: content.encode() for id, (content, _) in zip(contents, translated)
+        }
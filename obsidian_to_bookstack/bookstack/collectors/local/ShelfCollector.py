@@ -1,5 +1,6 @@
+import json
 import os
-from typing import List
+from typing import Dict, Iterator, List
 
 import urllib3
 
@@ -7,7 +8,8 @@ from obsidian_to_bookstack.bookstack.artifacts import Shelf
 from obsidian_to_bookstack.bookstack.client import RemoteClient
 from obsidian_to_bookstack.bookstack.collectors.collector import LocalCollector
 from obsidian_to_bookstack.bookstack.constants import *
-from obsidian_to_bookstack.console import console
+from obsidian_to_bookstack.events import events
+from obsidian_to_bookstack.obsidian.Vault import FOLDER
 
 
 class LocalShelfCollector(LocalCollector):
@@ -21,40 +23,54 @@ class LocalShelfCollector(LocalCollector):
     def set_shelves(self) -> List[Shelf]:
         """Set shelves from Obsidian Vault local directory"""
         shelves = []
-        for shelf in os.listdir(self.path):
-            if os.path.isdir(os.path.join(self.path, shelf)) and shelf != ".obsidian":
-                if not shelf.startswith(".") and shelf not in self.excluded:
-                    s = Shelf(
-                        path=os.path.join(self.path, shelf),
-                        name=shelf,
-                        client=self.client,
-                        from_client=False,
-                    )
-                    shelves.append(s)
+        for entry in self.local.vault.children():
+            if entry.kind == FOLDER and entry.name not in self.excluded:
+                s = Shelf(
+                    path=os.path.join(self.path, entry.name),
+                    name=entry.name,
+                    client=self.client,
+                    from_client=False,
+                    vault=self.local.vault,
+                )
+                shelves.append(s)
 
         return shelves
 
+    def iter_shelves(self) -> Iterator[Shelf]:
+        """Yield local shelves without their books, those are streamed by `iter_books`"""
+        for entry in self.local.vault.children():
+            if entry.kind == FOLDER and entry.name not in self.excluded:
+                yield Shelf(
+                    path=os.path.join(self.path, entry.name),
+                    name=entry.name,
+                    client=self.client,
+                    vault=self.local.vault,
+                )
+
     def create_local_missing_shelves(self):
         """Create any missing shelves in the local store"""
-        missing_shelves = self._get_missing_set(BookstackItems.SHELF, SyncType.LOCAL)
-        for shelf in missing_shelves:
+        for shelf in self.client.shelves:
             path = os.path.join(self.path, shelf.name)
+
+            if shelf.name in self.excluded or self.local.vault.get(path):
+                continue
+
             os.mkdir(path)
+            self.local.vault.update(path)
+            events.item("created", "shelf", path)
+
+    def create_remote_shelf(self, shelf: Shelf) -> Dict:
+        """Create a shelf in the remote, returns its details"""
+        encoded_data, content_type = urllib3.encode_multipart_formdata(
+            {"name": shelf.name}
+        )
+        self.client.headers["Content-Type"] = content_type
+        resp = self.client._make_request(
+            RequestType.POST, BookstackAPIEndpoints.SHELVES, body=encoded_data
+        )
+
+        if resp.status != 200:
+            raise RuntimeError(f"HTTP {resp.status}")
 
-            if self.verbose:
-                console.log(f"Creating a shelf at: {path}")
-
-    def create_remote_missing_shelves(self):
-        """Create any shelves in the remote which are missing"""
-        missing_shelves = self._get_missing_set(BookstackItems.SHELF, SyncType.REMOTE)
-        for shelf in missing_shelves:
-            if self.verbose:
-                console.log(f"Bookstack missing shelf: {shelf}")
-
-            encoded_data, content_type = urllib3.encode_multipart_formdata(
-                {"name": shelf.name}
-            )
-            self.client.headers["Content-Type"] = content_type
-            self.client._make_request(
-                RequestType.POST, BookstackAPIEndpoints.SHELVES, body=encoded_data
-            )
+        events.item("created", "shelf", shelf.name)
+        return json.loads(resp.data)
@@ -0,0 +1,218 @@
+import json
+from typing import Dict, List, Set, Tuple
+
+from obsidian_to_bookstack.bookstack.cache import record
+from obsidian_to_bookstack.bookstack.client import RemoteClient
+from obsidian_to_bookstack.bookstack.collectors.collector import \
+    RemoteCollector
+from obsidian_to_bookstack.bookstack.constants import *
+from obsidian_to_bookstack.console import console
+from obsidian_to_bookstack.sqllite import DatabaseFunctions as dbf
+
+AUDIT_LOG_CHECKPOINT = "audit_log"
+
+# prefix of an audit log event type, e.g. `bookshelf_update` or `book_create_from_chapter`
+AUDIT_LOG_ITEMS = {
+    "bookshelf": BookstackItems.SHELF,
+    "book": BookstackItems.BOOK,
+    "chapter": BookstackItems.CHAPTER,
+    "page": BookstackItems.PAGE,
+}
+
+
+class RemoteAuditLogCollector(RemoteCollector):
+    """Keeps the cached remote model current by replaying Bookstack's audit log"""
+
+    def __init__(self, verbose: bool, client: RemoteClient) -> None:
+        super().__init__(verbose, client)
+        self.enabled = True
+        self.checkpoint = dbf.select_watermark(client.base_url, AUDIT_LOG_CHECKPOINT)
+
+    def _get_latest_event_id(self) -> int | None:
+        """Id of the newest audit log event, None if the log can't be read"""
+        resp = self.client._make_request(
+            RequestType.GET,
+            BookstackAPIEndpoints.AUDIT_LOG,
+            fields={"sort": "-id", "count": 1},
+        )
+
+        if resp.status != 200:
+            return None
+
+        events = json.loads(resp.data)["data"]
+        return events[0]["id"] if events else 0
+
+    def apply_changes(self):
+        """Replay events since the last checkpoint onto the cache, marking it fresh"""
+        cache = self.client.cache
+        cache.fresh = set()
+
+        if not self.enabled:
+            return
+
+        latest = self._get_latest_event_id()
+
+        if latest is None:
+            console.log(
+                "Couldn't read the audit log, falling back to listing remote changes"
+            )
+            self.enabled = False
+            return
+
+        if self.checkpoint is None:
+            # nothing to replay onto yet, the crawl that follows is current as of `latest`
+            self.checkpoint = str(latest)
+            return
+
+        events = []
+        if latest > int(self.checkpoint):
+            events = self.client._get_from_client(
+                BookstackAPIEndpoints.AUDIT_LOG,
+                params={"filter[id:gt]": self.checkpoint, "sort": "+id"},
+            )
+
+        refreshed, removed = self.replay(events)
+
+        if events:
+            self.checkpoint = str(events[-1]["id"])
+
+        if self.verbose:
+            console.log(
+                f"Applied {len(events)} audit log events: {len(refreshed)} pages refreshed, {len(removed)} removed"
+            )
+
+    def replay(self, events: List[Dict]) -> Tuple[Set[int], Set[int]]:
+        """Apply events, each a `type` and a `loggable_id` as the audit log has them,
+        onto the cache. Marks it fresh unless only a listing finds what changed.
+        Returns the ids of the pages refreshed and of those removed."""
+        cache = self.client.cache
+        refresh = {}
+        removed = {}
+        needs_listing = False
+
+        for event in events:
+            if event["type"].startswith("recycle_bin"):
+                # restored items keep their old timestamps, only a listing finds them
+                needs_listing = True
+                continue
+
+            prefix, _, action = event["type"].partition("_")
+            item = AUDIT_LOG_ITEMS.get(prefix)
+
+            if item is None:
+                continue
+
+            key = (item, event["loggable_id"])
+
+            if action == "delete":
+                refresh.pop(key, None)
+                removed[key] = action
+            else:
+                removed.pop(key, None)
+                refresh[key] = action
+
+        refreshed_pages: Set[int] = set()
+        removed_pages: Set[int] = set()
+
+        for item, id in removed:
+            removed_pages.update(self.__remove(item, id))
+
+        for (item, id), action in refresh.items():
+            if item != BookstackItems.PAGE:
+                self.__refresh(item, id)
+            elif self.__refresh(item, id):
+                refreshed_pages.add(id)
+            else:
+                removed_pages.add(id)  # deleted after the event was sent
+
+            # moves, sorts and conversions relocate children without logging them
+            if action in ["move", "sort"] or action.startswith("create_from"):
+                if item == BookstackItems.CHAPTER:
+                    refreshed_pages.update(
+                        self.__refresh_children({"filter[chapter_id]": id})
+                    )
+
+                if item == BookstackItems.BOOK:
+                    refreshed_pages.update(
+                        self.__refresh_children({"filter[book_id]": id})
+                    )
+
+        cache.fresh = set() if needs_listing else set(BookstackItems)
+        return refreshed_pages - removed_pages, removed_pages
+
+    def save_checkpoint(self):
+        """Record the last applied event, once the cache holding it has been saved"""
+        if self.enabled and self.checkpoint is not None:
+            dbf.update_watermark(
+                self.client.base_url, AUDIT_LOG_CHECKPOINT, self.checkpoint
+            )
+
+    def __refresh(self, item: BookstackItems, id: int) -> bool:
+        """Refetch a single item into the cache, returns whether it still exists"""
+        endpoint = BOOKSTACK_ENDPOINT_MAP[item]
+
+        class DetailedLink(DetailedBookstackLink):
+            LINK = f"{endpoint.value}/{id}"
+
+        resp = self.client._make_request(RequestType.GET, DetailedLink.LINK)
+
+        if resp.status == 404:
+            self.__remove(item, id)
+            return False
+
+        details = json.loads(resp.data)
+        entry = record(item, details)
+        self.client.cache.merge(item, [entry])
+
+        # a markdown page's details hold its body, it needn't be exported again
+        if details.get("markdown"):
+            self.client.responses.keep_body(id, details["markdown"].encode())
+
+        if self.verbose:
+            console.log(f"Refreshed remote {item.value}: {entry['name']}")
+
+        return True
+
+    def __refresh_children(self, params: dict) -> List[int]:
+        """Refetch the chapters and pages matching a filter, returns the pages' ids"""
+        pages = []
+
+        for item in [BookstackItems.CHAPTER, BookstackItems.PAGE]:
+            if item == BookstackItems.CHAPTER and "filter[chapter_id]" in params:
+                continue
+
+            listed = self.client._get_from_client(
+                BOOKSTACK_ENDPOINT_MAP[item], params=params
+            )
+
+            for entry in listed:
+                if self.__refresh(item, entry["id"]) and item == BookstackItems.PAGE:
+                    pages.append(entry["id"])
+
+        return pages
+
+    def __remove(self, item: BookstackItems, id: int) -> List[int]:
+        """Drop an item from the cache, along with anything Bookstack deleted with it.
+        Returns the ids of the pages dropped."""
+        cache = self.client.cache
+        cache.remove(item, id)
+        pages = [id] if item == BookstackItems.PAGE else []
+
+        parent_field = {
+            BookstackItems.BOOK: "book_id",
+            BookstackItems.CHAPTER: "chapter_id",
+        }.get(item)
+
+        if parent_field:
+            for child in [BookstackItems.CHAPTER, BookstackItems.PAGE]:
+                for entry in cache.entries(child):
+                    if entry.get(parent_field) == id:
+                        cache.remove(child, entry["id"])
+
+                        if child == BookstackItems.PAGE:
+                            pages.append(entry["id"])
+
+        if self.verbose:
+            console.log(f"Removed remote {item.value}: {id}")
+
+        return pages
@@ -1,4 +1,3 @@
-import json
 from typing import List
 
 from obsidian_to_bookstack.bookstack.artifacts import Book, Shelf
@@ -6,8 +5,7 @@ from obsidian_to_bookstack.bookstack.client import RemoteClient
 from obsidian_to_bookstack.bookstack.collectors.collector import \
     RemoteCollector
 from obsidian_to_bookstack.bookstack.constants import *
-from obsidian_to_bookstack.console import console
-from obsidian_to_bookstack.utils import con_hash
+from obsidian_to_bookstack.events import events
 
 
 class RemoteBookCollector(RemoteCollector):
@@ -16,36 +14,19 @@ class RemoteBookCollector(RemoteCollector):
 
     def get_books(self, shelves: List[Shelf]):
         """Get remote books from shelves"""
-        client_books = self.client._get_from_client(BookstackAPIEndpoints.BOOKS)
+        client_books = self._collect(BookstackAPIEndpoints.BOOKS, BookstackItems.BOOK)
 
-        for book in client_books:
+        books = [Book(book["name"], details=book) for book in client_books]
 
-            class DetailedBook(DetailedBookstackLink):
-                LINK = f"/api/books/{book['id']}"
-
-            details = json.loads(
-                self.client._make_request(
-                    RequestType.GET,
-                    DetailedBook.LINK,
-                ).data.decode()
-            )
-
-            book["details"] = details
-
-        books = [Book(book["name"], details=book["details"]) for book in client_books]
-
-        BOOK_MAP = {
-            con_hash(book.name + str(book.details["id"])): book for book in books
-        }
+        # link by id only, names in a shelf's details go stale when a book is renamed
+        BOOK_MAP = {book.details["id"]: book for book in books}
 
         for shelf in shelves:
             for book in shelf.client_books:
-                b = BOOK_MAP.get(con_hash(book["name"] + str(book["id"])))
+                b = BOOK_MAP.get(book["id"])
                 if b:
                     b.shelf = shelf
                     shelf.books.append(b)
 
-                if self.verbose:
-                    console.log(f"Found remote book: {b}")
-
+        events.item("found", BookstackItems.BOOK.value, count=len(books))
         return books
@@ -1,11 +1,9 @@
-import json
-
 from obsidian_to_bookstack.bookstack.artifacts import Shelf
 from obsidian_to_bookstack.bookstack.client import RemoteClient
 from obsidian_to_bookstack.bookstack.collectors.collector import \
     RemoteCollector
 from obsidian_to_bookstack.bookstack.constants import *
-from obsidian_to_bookstack.console import console
+from obsidian_to_bookstack.events import events
 
 
 class RemoteShelfCollector(RemoteCollector):
@@ -14,27 +12,18 @@ class RemoteShelfCollector(RemoteCollector):
 
     def get_shelves(self):
         """Gather remote's shelves and add detailed information"""
-        client_shelves = self.client._get_from_client(BookstackAPIEndpoints.SHELVES)
+        client_shelves = self._collect(
+            BookstackAPIEndpoints.SHELVES, BookstackItems.SHELF
+        )
 
         shelves = []
 
         for shelf in client_shelves:
-
-            class DetailedShelf(DetailedBookstackLink):
-                SHELF = f"/api/shelves/{shelf['id']}"
-
-            details = json.loads(
-                self.client._make_request(
-                    RequestType.GET,
-                    DetailedShelf.SHELF,
-                ).data.decode()
-            )
+            details = dict(shelf)  # don't pop from the cached copy
 
             s = Shelf(shelf["name"], details=details)
-            s.client_books = s.details.pop("books")
+            s.client_books = s.details.pop("books", [])
             shelves.append(s)
 
-            if self.verbose:
-                console.log(f"Found remote shelf: {s}")
-
+        events.item("found", BookstackItems.SHELF.value, count=len(shelves))
         return shelves
@@ -1,3 +1,4 @@
+from .RemoteAuditLogCollector import RemoteAuditLogCollector
 from .RemoteBookCollector import RemoteBookCollector
 from .RemoteChapterCollector import RemoteChapterCollector
 from .RemotePageCollector import RemotePageCollector
@@ -8,4 +9,5 @@ __all__ = [
     "RemoteBookCollector",
     "RemotePageCollector",
     "RemoteChapterCollector",
+    "RemoteAuditLogCollector",
 ]
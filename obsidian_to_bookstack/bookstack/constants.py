@@ -6,6 +6,7 @@ class BookstackAPIEndpoints(Enum):
     BOOKS = "/api/books"
     SHELVES = "/api/shelves"
     CHAPTERS = "/api/chapters"
+    AUDIT_LOG = "/api/audit-log"
 
 
 class DetailedBookstackLink(Enum):
@@ -31,6 +32,28 @@ class SyncType(Enum):
     REMOTE = "remote"
 
 
+class ConflictPolicy(Enum):
+    """What `update --both` does with a page changed on both sides"""
+
+    KEEP_BOTH = "keep-both"  # push the note, keep the page's version as a new note
+    LOCAL = "local"
+    REMOTE = "remote"
+    SKIP = "skip"
+
+
+# maximum `count` the Bookstack list endpoints accept
+LIST_PAGE_SIZE = 500
+
+# concurrent requests, and the connections kept open for them
+MAX_CONNECTIONS = 8
+
+BOOKSTACK_ENDPOINT_MAP = {
+    BookstackItems.SHELF: BookstackAPIEndpoints.SHELVES,
+    BookstackItems.BOOK: BookstackAPIEndpoints.BOOKS,
+    BookstackItems.PAGE: BookstackAPIEndpoints.PAGES,
+    BookstackItems.CHAPTER: BookstackAPIEndpoints.CHAPTERS,
+}
+
 BOOKSTACK_ATTR_MAP = {
     BookstackItems.SHELF: "shelves",
     BookstackItems.BOOK: "books",
@@ -44,5 +67,9 @@ __all__ = [
     "BookstackItems",
     "RequestType",
     "SyncType",
+    "ConflictPolicy",
     "BOOKSTACK_ATTR_MAP",
+    "BOOKSTACK_ENDPOINT_MAP",
+    "LIST_PAGE_SIZE",
+    "MAX_CONNECTIONS",
 ]
@@ -0,0 +1,134 @@
+from typing import Dict, List, Tuple
+
+from .artifacts import Book, Chapter
+
+# a book or chapter export is used once at least this many of its pages are needed...
+EXPORT_MIN_PAGES = 3
+# ...and they make up at least this share of it
+EXPORT_MIN_SHARE = 0.5
+
+# (name, page id or None for a chapter, bytes separating it from the next item)
+Sequence = List[Tuple[str, int | None, int]]
+
+
+def worth_exporting(needed: int, total: int) -> bool:
+    """Whether one export beats a request per needed page"""
+    return needed >= EXPORT_MIN_PAGES and needed >= total * EXPORT_MIN_SHARE
+
+
+def book_sequence(book: Book) -> Sequence | None:
+    """Order of the items in a book's markdown export, None if its cached contents are stale"""
+    names = {page.details["id"]: page.details["name"] for page in book.pages}
+    return contents_sequence(book.details.get("contents", []), names)
+
+
+def contents_sequence(
+    contents: List[int | Dict], names: Dict[int, str]
+) -> Sequence | None:
+    """Order of the items in a book's markdown export from its cached `contents`, None
+    if they're stale. `names` holds the current name of each of the book's pages."""
+    sequence = []
+
+    for item in contents:
+        if isinstance(item, dict):  # a chapter, pages are kept by id
+            sequence.append((item["name"], None, 0))
+
+            for i, id in enumerate(item["pages"]):
+                # the last page of a chapter is followed by the chapter's separator too
+                last = i == len(item["pages"]) - 1
+                sequence.append(("", id, 4 if last else 2))
+        else:
+            sequence.append(("", item, 2))
+
+    return _with_page_names(sequence, names)
+
+
+def chapter_sequence(chapter: Chapter) -> Sequence | None:
+    """Order of the pages in a chapter's markdown export, None if its cached details are stale"""
+    names = {page.details["id"]: page.details["name"] for page in chapter.pages}
+    sequence = [("", id, 2) for id in chapter.details.get("pages", [])]
+
+    return _with_page_names(sequence, names)
+
+
+def _with_page_names(sequence: Sequence, names: Dict[int, str]) -> Sequence | None:
+    """Fill in current page names, names in cached contents go stale on rename"""
+    ids = [id for _, id, _ in sequence if id is not None]
+
+    if set(ids) != set(names) or len(ids) != len(names):
+        return None
+
+    return [
+        (names[id] if id is not None else name, id, separator)
+        for name, id, separator in sequence
+    ]
+
+
+def _occurrences(content: bytes, marker: bytes) -> List[int]:
+    """Every position of a marker, including ones overlapping each other"""
+    positions = []
+    position = content.find(marker)
+
+    while position != -1:
+        positions.append(position)
+        position = content.find(marker, position + 1)
+
+    return positions
+
+
+def split_export(content: bytes, sequence: Sequence) -> Dict[int, bytes]:
+    """Split a book or chapter export into what each page's own export would have been.
+    Only done when every item's header is found exactly where the sequence expects it,
+    a body holding a line like another item's header makes the split ambiguous, and
+    nothing is returned."""
+    headers = [f"\n# {name}\n\n".encode() for name, _, _ in sequence]
+    positions: Dict[bytes, List[int]] = {}
+
+    for header in headers:
+        if header not in positions:
+            positions[header] = _occurrences(content, header)
+
+    # each header's lines must be those of its items, no more and no fewer
+    if any(len(found) != headers.count(header) for header, found in positions.items()):
+        return {}
+
+    # the nth line of a header begins its nth item
+    seen: Dict[bytes, int] = {}
+    starts = []
+
+    for header in headers:
+        starts.append(positions[header][seen.get(header, 0)])
+        seen[header] = seen.get(header, 0) + 1
+
+    # ...and the items' headers must come in their order
+    if any(a >= b for a, b in zip(starts, starts[1:])):
+        return {}
+
+    pages = {}
+
+    for i, (name, id, separator) in enumerate(sequence):
+        if id is None:
+            continue
+
+        # the header ends in a newline which may begin the next one
+        start = starts[i] + 1
+        end = starts[i + 1] + 1 if i + 1 < len(sequence) else len(content)
+
+        page = content[start:end]
+        if separator and page.endswith(b"\n" * separator):
+            page = page[:-separator]
+
+        pages[id] = page
+
+    return pages
+
+
+def strip_header(content: bytes, name: str) -> bytes:
+    """A page's body, without the title its markdown export starts with"""
+    header = f"# {name}\n".encode()
+
+    if not content.startswith(header):
+        return content
+
+    content = content[len(header) :]
+    return content[1:] if content.startswith(b"\n") else content
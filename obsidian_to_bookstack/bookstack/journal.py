@@ -0,0 +1,96 @@
+import time
+import traceback
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+from ..console import console
+from ..events import events
+from ..sqllite import DatabaseFunctions as dbf
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+# actions whose failures the next plan finds again by itself, the rest are kept
+REPLANNED = {"create", "move", "update", "download", "write"}
+
+
+class Operation:
+    """One journaled operation, `result` is kept with it once it lands"""
+
+    def __init__(self, id: int) -> None:
+        self.id = id
+        self.ok = False
+        self.result: str = ""
+        self.error = ""
+
+
+class Journal:
+    """Every operation a sync makes, written before it is made and marked once it lands.
+    An interrupted run leaves its rows behind for the next one to resume from."""
+
+    def __init__(self, instance: str, vault: str, verbose: bool = False) -> None:
+        self.instance = instance
+        self.vault = vault
+        self.verbose = verbose
+        # by phase, a phase may start inside another, as `push` runs `sync_remote`
+        self.runs: Dict[str, str] = {}
+        self.left: Dict[str, List[Tuple]] = {}
+
+    def start(self, phase: str, run: str | None = None):
+        """Start a run of a phase, or join the `run` another process started, keeping
+        what runs before it left behind"""
+        self.runs[phase] = run or str(time.time_ns())
+        self.left[phase] = dbf.select_operations(
+            self.instance, self.vault, phase, self.runs[phase]
+        )
+
+        if self.left[phase] and run is None:
+            console.log("Resuming an interrupted sync...")
+
+    def landed(self, phase: str, action: str, kind: str) -> Dict[str, str]:
+        """Results of operations which landed before a run was interrupted"""
+        return {
+            path: result
+            for a, k, path, state, result in self.left.get(phase, [])
+            if (a, k) == (action, kind) and state == DONE
+        }
+
+    def unfinished(self, phase: str, action: str, kind: str) -> Dict[str, str]:
+        """Results of operations which an earlier run failed or never finished"""
+        return {
+            path: result
+            for a, k, path, state, result in self.left.get(phase, [])
+            if (a, k) == (action, kind) and state != DONE
+        }
+
+    @contextmanager
+    def operation(self, phase: str, action: str, kind: str, path: str):
+        """Journal a block as one operation. A failure is recorded and reported
+        rather than raised, check `ok` on the yielded operation afterwards."""
+        op = Operation(
+            dbf.insert_operation(
+                self.instance, self.vault, self.runs[phase], phase, action, kind, path
+            )
+        )
+
+        try:
+            yield op
+        except Exception as e:
+            op.error = str(e) or type(e).__name__
+            dbf.update_operation(op.id, FAILED, op.result, op.error)
+            events.item("failed", kind, path, error=op.error)
+
+            if self.verbose:
+                console.log(traceback.format_exc())
+        else:
+            op.ok = True
+            dbf.update_operation(op.id, DONE, op.result, "")
+
+    def finish(self, phase: str):
+        """Forget a completed phase, keeping this run's failures which the next plan
+        won't find again by itself"""
+        dbf.delete_operations(
+            self.instance, self.vault, phase, self.runs.pop(phase), list(REPLANNED)
+        )
+        self.left.pop(phase, None)
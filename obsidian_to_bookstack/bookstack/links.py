@@ -0,0 +1,292 @@
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Dict, Iterable, List, Tuple
+from urllib.parse import unquote
+
+from .artifacts import Page
+
+# [[Note]], [[Note#Heading]], [[Note|alias]], [[Note#Heading|alias]], not ![[embeds]]
+WIKILINK = re.compile(r"(?<!!)\[\[([^\[\]|#]+)(?:#([^\[\]|]*))?(?:\|([^\[\]]*))?\]\]")
+MARKDOWN_LINK = re.compile(r"(?<!!)\[([^\[\]]*)\]\(<?([^()\s<>]+)>?\)")
+FENCED_CODE = re.compile(r"^(```|~~~).*?^\1", re.MULTILINE | re.DOTALL)
+
+# below this many pages, starting a process pool costs more than it saves
+POOL_THRESHOLD = 64
+
+# later additions sent along with every batch, past this many the pool is restarted
+# with a fresh copy of the index instead
+MAX_ADDED = 256
+
+# off in processes which already share the cores with others
+pooling = True
+
+
+def bookmark_id(heading: str) -> str:
+    """Approximate the id Bookstack gives a heading"""
+    slug = re.sub(r"[^a-z0-9]+", "-", heading.lower()).strip("-")
+    return f"bkmrk-{slug[:20]}"
+
+
+class LinkIndex:
+    """Resolves note names and vault paths to Bookstack pages and back, each in O(1)"""
+
+    def __init__(self, base_url: str) -> None:
+        self.base_url = base_url.rstrip("/")
+        # lowercased vault path without extension -> [wikilink target, page id]
+        self.notes: Dict[str, list] = {}
+        # lowercased note name -> lowercased vault path, None when the name is ambiguous
+        self.names: Dict[str, str | None] = {}
+        self.ids: Dict[int, str] = {}
+        self.slugs: Dict[str, int] = {}
+        # what was indexed since pool workers copied the index, for them to catch up on
+        self.added: List[Tuple[str, int | None]] = []
+
+        self.remote_link = re.compile(
+            rf"^(?:{re.escape(self.base_url)})?/(?:link/(\d+)|books/([^/#]+)/page/([^/#]+))(?:#(.*))?$"
+        )
+
+    @classmethod
+    def build(cls, base_url: str, notes: Iterable[str], client_pages: List[Page]):
+        """Index the remote page tree and the vault's notes, given as paths without extension"""
+        index = cls(base_url)
+
+        for page in client_pages:
+            if not page.book or not page.book.shelf:
+                continue
+
+            parts = [page.book.shelf.name, page.book.name]
+            if page.chapter:
+                parts.append(page.chapter.name)
+            parts.append(page.name)
+
+            index.__put("/".join(parts), page.details["id"])
+
+            if page.book.details.get("slug") and page.details.get("slug"):
+                index.slugs[
+                    f"{page.book.details['slug']}/{page.details['slug']}"
+                ] = page.details["id"]
+
+        for note in notes:
+            index.__put(note, None)
+
+        return index
+
+    def _add(self, path: str, id: int | None):
+        """Index a note or page once the index is built, e.g. a page just created"""
+        self.__put(path, id)
+        self.added.append((path, id))
+
+    def __put(self, path: str, id: int | None):
+        key = path.lower()
+        name = os.path.basename(path)
+
+        if key in self.notes:
+            if id is not None:
+                self.notes[key][1] = id
+        else:
+            self.notes[key] = [path, id]
+
+            name_key = name.lower()
+            self.names[name_key] = None if name_key in self.names else key
+
+        if id is not None:
+            self.ids[id] = key
+
+    def _lookup(self, target: str) -> list | None:
+        key = target.strip().lower()
+        if key.endswith(".md"):
+            key = key[:-3]
+
+        if key in self.notes:
+            return self.notes[key]
+
+        # partial paths fall back to their note name
+        path = self.names.get(key.rsplit("/", 1)[-1])
+        return self.notes[path] if path else None
+
+    def _target(self, key: str) -> str:
+        """Shortest wikilink target for a note, its name unless that's ambiguous"""
+        path = self.notes[key][0]
+        name = os.path.basename(path)
+        return name if self.names.get(name.lower()) == key else path
+
+    def to_remote(self, content: str, page_dir: str = "") -> Tuple[str, int]:
+        """Rewrite wikilinks and relative markdown links to Bookstack links, returns unresolved count"""
+        unresolved = 0
+
+        def wikilink(match: re.Match) -> str:
+            nonlocal unresolved
+            target, heading, alias = match.groups()
+            note = self._lookup(target)
+
+            if not note or note[1] is None:
+                unresolved += 1
+                return match.group(0)
+
+            url = f"{self.base_url}/link/{note[1]}"
+            text = target.strip()
+            if heading:
+                url += f"#{bookmark_id(heading)}"
+                text = f"{text} > {heading}"
+
+            return f"[{alias or text}]({url})"
+
+        def relative(match: re.Match) -> str:
+            nonlocal unresolved
+            text, href = match.groups()
+
+            if "://" in href or href.startswith(("#", "/", "mailto:")):
+                return match.group(0)
+
+            href, _, anchor = unquote(href).partition("#")
+            if not href.endswith(".md"):
+                return match.group(0)
+
+            note = self._lookup(os.path.normpath(os.path.join(page_dir, href)))
+
+            if not note or note[1] is None:
+                unresolved += 1
+                return match.group(0)
+
+            url = f"{self.base_url}/link/{note[1]}"
+            if anchor:
+                url += f"#{bookmark_id(anchor)}"
+
+            return f"[{text}]({url})"
+
+        def rewrite(text: str) -> str:
+            text = WIKILINK.sub(wikilink, text)
+            return MARKDOWN_LINK.sub(relative, text)
+
+        return _outside_code(content, rewrite), unresolved
+
+    def to_local(self, content: str) -> Tuple[str, int]:
+        """Rewrite links to Bookstack pages into wikilinks, returns unresolved count"""
+        unresolved = 0
+
+        def remote(match: re.Match) -> str:
+            nonlocal unresolved
+            text, href = match.groups()
+            link = self.remote_link.match(href)
+
+            if not link:
+                return match.group(0)
+
+            id, book_slug, page_slug, anchor = link.groups()
+            id = int(id) if id else self.slugs.get(f"{book_slug}/{page_slug}")
+            key = self.ids.get(id) if id is not None else None
+
+            if key is None:
+                unresolved += 1
+                return match.group(0)
+
+            target = self._target(key)
+
+            if text == target:
+                return f"[[{target}]]"
+
+            if anchor and text.startswith(f"{target} > "):
+                return f"[[{target}#{text[len(target) + 3:]}]]"
+
+            return f"[[{target}|{text}]]"
+
+        return _outside_code(content, lambda text: MARKDOWN_LINK.sub(remote, text)), unresolved
+
+
+def _outside_code(content: str, rewrite) -> str:
+    """Apply `rewrite` to everything but fenced code blocks"""
+    parts = []
+    last = 0
+
+    for block in FENCED_CODE.finditer(content):
+        parts.append(rewrite(content[last : block.start()]))
+        parts.append(block.group(0))
+        last = block.end()
+
+    parts.append(rewrite(content[last:]))
+    return "".join(parts)
+
+
+_worker_index: LinkIndex | None = None
+_worker_added = 0  # how many of the parent's later additions this worker applied
+
+# one pool a run, started by the first batch large enough and replaced once the
+# index is rebuilt or too much was added to it since
+_pool: ProcessPoolExecutor | None = None
+_pool_index: LinkIndex | None = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker(index: LinkIndex):
+    global _worker_index, _worker_added
+    _worker_index = index
+    _worker_added = len(index.added)
+
+
+def _catch_up(added: Tuple[Tuple[str, int | None], ...]) -> LinkIndex:
+    """The worker's index, with what the parent added since it started"""
+    global _worker_added
+    assert _worker_index
+
+    for path, id in added[_worker_added:]:
+        _worker_index._add(path, id)
+
+    _worker_added = len(added)
+    return _worker_index
+
+
+def _to_remote(added: Tuple, item: Tuple[str, str]) -> Tuple[str, int]:
+    return _catch_up(added).to_remote(*item)
+
+
+def _to_local(added: Tuple, content: str) -> Tuple[str, int]:
+    return _catch_up(added).to_local(content)
+
+
+def _pool_for(index: LinkIndex) -> ProcessPoolExecutor:
+    global _pool, _pool_index
+
+    with _pool_lock:
+        if _pool is None or _pool_index is not index or len(index.added) > MAX_ADDED:
+            if _pool:
+                _pool.shutdown(wait=False)
+
+            # the new workers' copy holds everything added so far
+            index.added.clear()
+
+            # spawned, not forked, the callers run background threads
+            _pool = ProcessPoolExecutor(
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(index,),
+            )
+            _pool_index = index
+
+        return _pool
+
+
+def translate_to_remote(
+    index: LinkIndex, items: List[Tuple[str, str]]
+) -> List[Tuple[str, int]]:
+    """Rewrite many (content, page directory) pairs, across processes for large batches"""
+    if len(items) < POOL_THRESHOLD or not pooling:
+        return [index.to_remote(*item) for item in items]
+
+    pool = _pool_for(index)
+    # a snapshot, pickled with each chunk as the tasks are sent
+    added = tuple(index.added)
+    return list(pool.map(partial(_to_remote, added), items, chunksize=32))
+
+
+def translate_to_local(index: LinkIndex, contents: List[str]) -> List[Tuple[str, int]]:
+    """Rewrite many page contents, across processes for large batches"""
+    if len(contents) < POOL_THRESHOLD or not pooling:
+        return [index.to_local(content) for content in contents]
+
+    pool = _pool_for(index)
+    added = tuple(index.added)
+    return list(pool.map(partial(_to_local, added), contents, chunksize=32))
@@ -0,0 +1,123 @@
+import hashlib
+from typing import Dict, List, Tuple
+
+from ..obsidian.Vault import FOLDER, NOTE, Vault
+
+# shelf, book and chapter names, as deep as the subtree goes
+Key = Tuple[str, ...]
+
+
+class Tree:
+    """Fingerprints of every shelf, book and chapter on one side, each covering
+    the names of everything below it"""
+
+    def __init__(self) -> None:
+        self.fingerprints: Dict[Key, str] = {}
+        self.pages: Dict[Key, int] = {}
+
+    def _node(self, key: Key, children: List[str], pages: int) -> str:
+        fingerprint = hashlib.md5("\n".join(sorted(children)).encode()).hexdigest()
+        self.fingerprints[key] = fingerprint
+        self.pages[key] = pages
+        return fingerprint
+
+
+def local_tree(vault: Vault, excluded: list) -> Tree:
+    """Tree of the vault's shelves, books, chapters and notes"""
+    tree = Tree()
+    shelves, total = [], 0
+
+    for shelf in vault.children():
+        if shelf.kind != FOLDER or shelf.name in excluded:
+            continue
+
+        books, shelf_pages = [], 0
+
+        for book in vault.children(shelf.path):
+            if book.kind != FOLDER:
+                continue
+
+            items, book_pages = [], 0
+
+            for item in vault.children(book.path):
+                if item.kind == NOTE:
+                    items.append(f"p:{item.name[: -len('.md')]}")
+                    book_pages += 1
+                elif item.kind == FOLDER:
+                    pages = [
+                        f"p:{note.name[: -len('.md')]}"
+                        for note in vault.children(item.path)
+                        if note.kind == NOTE
+                    ]
+                    key = (shelf.name, book.name, item.name)
+                    items.append(f"c:{item.name}:{tree._node(key, pages, len(pages))}")
+                    book_pages += len(pages)
+
+            key = (shelf.name, book.name)
+            books.append(f"b:{book.name}:{tree._node(key, items, book_pages)}")
+            shelf_pages += book_pages
+
+        fingerprint = tree._node((shelf.name,), books, shelf_pages)
+        shelves.append(f"s:{shelf.name}:{fingerprint}")
+        total += shelf_pages
+
+    tree._node((), shelves, total)
+    return tree
+
+
+def remote_tree(client, excluded: list) -> Tree:
+    """Tree of a crawled remote, laid out like the vault it syncs to"""
+    tree = Tree()
+    shelves, total = [], 0
+
+    for shelf in client.shelves:
+        if shelf.name in excluded:
+            continue
+
+        books, shelf_pages = [], 0
+
+        for book in shelf.books:
+            items = [f"p:{page.name}" for page in book.pages if not page.chapter]
+            book_pages = len(items)
+
+            for chapter in book.chapters:
+                pages = [f"p:{page.name}" for page in chapter.pages]
+                key = (shelf.name, book.name, chapter.name)
+                items.append(f"c:{chapter.name}:{tree._node(key, pages, len(pages))}")
+                book_pages += len(pages)
+
+            key = (shelf.name, book.name)
+            books.append(f"b:{book.name}:{tree._node(key, items, book_pages)}")
+            shelf_pages += book_pages
+
+        fingerprint = tree._node((shelf.name,), books, shelf_pages)
+        shelves.append(f"s:{shelf.name}:{fingerprint}")
+        total += shelf_pages
+
+    tree._node((), shelves, total)
+    return tree
+
+
+class Diff:
+    """Compares the vault and the remote a subtree at a time"""
+
+    def __init__(self, local: Tree, remote: Tree) -> None:
+        self.local = local
+        self.remote = remote
+
+    def same(self, *key: str) -> bool:
+        """Whether a subtree holds the same items on both sides. Checked from the top,
+        so a whole unchanged shelf is settled by one comparison."""
+        for depth in range(len(key) + 1):
+            fingerprint = self.local.fingerprints.get(key[:depth])
+
+            if fingerprint is not None and fingerprint == self.remote.fingerprints.get(
+                key[:depth]
+            ):
+                return True
+
+        return False
+
+    def pages(self, *key: str) -> int:
+        """Number of notes in a local subtree"""
+        return self.local.pages.get(key, 0)
@@ -0,0 +1,134 @@
+import sys
+from typing import Dict, Iterable, List, Tuple
+
+from ..obsidian import Vault
+from ..sqllite import DatabaseFunctions as dbf
+from .artifacts import Page
+
+# (page id, old vault path, new vault path)
+Move = Tuple[int, str, str]
+
+
+def page_path(page: Page) -> str:
+    """Vault path a remote page syncs to"""
+    assert page.book and page.book.shelf
+    parts = [page.book.shelf.name, page.book.name]
+
+    if page.chapter:
+        parts.append(page.chapter.name)
+
+    return "/".join(parts + [page.name + ".md"])
+
+
+class PageLinks:
+    """Which remote page each synced note is, with the note's hash and the page's
+    `updated_at` when both last matched"""
+
+    def __init__(self, instance: str, vault: str) -> None:
+        self.instance = instance
+        self.vault = vault
+        self.links: Dict[int, Tuple[str, str]] = {}  # page id -> (path, hash)
+        self.updated: Dict[int, str] = {}  # page id -> updated_at, if it was known
+        self._dirty: set[int] = set()
+        self._removed: set[int] = set()
+
+    def load(self):
+        for id, path, hash, updated_at in dbf.select_page_links(
+            self.instance, self.vault
+        ):
+            # the vault's entries hold the same strings
+            self.links[id] = (sys.intern(path), sys.intern(hash))
+            if updated_at:
+                self.updated[id] = updated_at
+
+    def save(self):
+        """Persist links changed since the last save"""
+        dbf.update_page_links(
+            self.instance,
+            self.vault,
+            [(id, *self.links[id], self.updated.get(id, "")) for id in self._dirty],
+            list(self._removed),
+        )
+        self._dirty = set()
+        self._removed = set()
+
+    def set(self, id: int, path: str, hash: str, updated_at: str | None = None):
+        """Link a note to a page, `updated_at` being the page's as of this match"""
+        if self.links.get(id) == (path, hash) and (
+            updated_at is None or self.updated.get(id) == updated_at
+        ):
+            return
+
+        if updated_at is not None:
+            self.updated[id] = updated_at
+        elif self.links.get(id, (None, None))[1] != hash:
+            self.updated.pop(id, None)  # the old match says nothing about this one
+
+        self.links[id] = (path, hash)
+        self._dirty.add(id)
+        self._removed.discard(id)
+
+    def remove(self, id: int):
+        if self.links.pop(id, None):
+            self.updated.pop(id, None)
+            self._dirty.discard(id)
+            self._removed.add(id)
+
+    def bases(self) -> Dict[int, Tuple[str, str, str]]:
+        """Path, hash and `updated_at` of every page as of its last match"""
+        return {
+            id: (path, hash, self.updated.get(id, ""))
+            for id, (path, hash) in self.links.items()
+        }
+
+
+def detect_moves(
+    links: PageLinks, vault: Vault, remote: Dict[int, str], notes: Iterable[str]
+) -> Tuple[List[Move], List[Move]]:
+    """Notes and pages which were renamed or moved on one side since the last sync.
+    `remote` maps page ids to the vault paths they sync to and `notes` are the vault
+    paths of notes which sync. Returns the moves to make remotely, then locally."""
+    remote_moves: List[Move] = []
+    local_moves: List[Move] = []
+
+    # pages already in sync from before links were kept
+    for id, path in remote.items():
+        if id not in links.links and (entry := vault.get(path)):
+            links.set(id, path, entry.hash)
+
+    # paths of pages and of linked notes, one set as they're mostly the same
+    known = set(remote.values())
+    known.update(path for path, _ in links.links.values())
+
+    # notes which are neither a page nor known, by content
+    candidates: Dict[str, List[str]] = {}
+    for path in notes:
+        entry = vault.get(path)
+        if entry and path not in known:
+            candidates.setdefault(entry.hash, []).append(path)
+
+    for id, (path, hash) in list(links.links.items()):
+        remote_path = remote.get(id)
+        entry = vault.get(path)
+
+        if remote_path is None:
+            if not entry:
+                links.remove(id)  # gone from both sides
+            continue
+
+        if remote_path != path:
+            # renamed or moved remotely
+            if entry and not vault.get(remote_path):
+                local_moves.append((id, path, remote_path))
+            else:
+                moved = vault.get(remote_path)
+                links.set(id, remote_path, moved.hash if moved else hash)
+            continue
+
+        if not entry:
+            # renamed or moved locally, unchanged notes can be told apart by content
+            matches = candidates.get(hash, [])
+            if len(matches) == 1:
+                remote_moves.append((id, path, matches.pop()))
+
+    return remote_moves, local_moves
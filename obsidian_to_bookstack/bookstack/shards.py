@@ -0,0 +1,216 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Set, Tuple
+
+from ..console import console
+from ..events import events
+from ..obsidian import Vault
+from ..obsidian.Vault import FOLDER
+from ..trace import tracer
+from .moves import PageLinks
+
+# where a worker process sends its events, set when it starts
+_queue = None
+
+
+def partition(weights: Dict[str, int], jobs: int) -> List[List[str]]:
+    """Split shelves into at most `jobs` shards of about the same weight"""
+    shards: List[List[str]] = [[] for _ in range(jobs)]
+    loads = [0] * jobs
+
+    # heaviest first, each onto the lightest shard so far
+    for name in sorted(weights, key=lambda name: (-weights[name], name)):
+        lightest = loads.index(min(loads))
+        shards[lightest].append(name)
+        loads[lightest] += weights[name] + 1
+
+    return [shard for shard in shards if shard]
+
+
+def _init_worker(events_queue):
+    global _queue
+    from . import links
+
+    links.pooling = False  # the shards already use every core
+    _queue = events_queue
+
+
+def _task(function: Callable, *args):
+    """Run a shard's work, then mark the end of its events"""
+    assert _queue
+    try:
+        return function(*args)
+    finally:
+        _queue.put(None)
+
+
+def _worker_bookstack(settings: Dict, shard: List[str], phase: str, run: str):
+    """A client of only this shard's shelves, joining the parent's journaled run"""
+    from .bookstack import Bookstack
+
+    events.forward(None)  # the parent already counted what its crawl found
+    b = Bookstack(
+        settings["path"],
+        settings["excluded"],
+        verbose=settings["verbose"],
+        scan_vault=False,
+        fresh=True,
+        shelves=shard,
+        ignore=settings["ignore"],
+    )
+    events.forward(_queue)
+    b.journal.start(phase, run)
+    return b
+
+
+def _scan(settings: Dict, shard: List[str]) -> int:
+    vault = Vault(settings["path"], settings["ignore"])
+    vault.load()
+    changes = vault.scan(shard)
+    vault.save()
+    return changes
+
+
+def _pull(settings: Dict, shard: List[str], run: str, moved: Set[int]):
+    _worker_bookstack(settings, shard, "local", run)._pull(moved)
+
+
+def _push(
+    settings: Dict, shard: List[str], run: str, moves: Dict[str, Tuple[int, str]]
+) -> Tuple[Dict[str, list], List[Tuple[str, int]]]:
+    return _worker_bookstack(settings, shard, "remote", run)._push(moves)
+
+
+class Shards:
+    """Syncs a share of the shelves in each of a pool of processes. The parent crawls,
+    detects moves and keeps the journal, then makes the few changes spanning shelves
+    itself: putting new books on their shelves and relinking new pages."""
+
+    def __init__(self, b, jobs: int) -> None:
+        self.b = b
+        self.jobs = jobs
+        self.settings = {
+            "path": b.path,
+            "excluded": b.excluded,
+            "ignore": b.ignore,
+            "verbose": b.verbose,
+        }
+        self.shards: List[List[str]] = []
+
+        # spawned, not forked, like targets, so no connection or lock is shared
+        context = multiprocessing.get_context("spawn")
+        self.queue = context.Queue()
+        self.pool = ProcessPoolExecutor(
+            jobs,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self.queue,),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.pool.shutdown()
+
+    def __run(self, function: Callable, *args) -> List:
+        """Run `function` for every shard, recording their events as they arrive"""
+        futures = [
+            self.pool.submit(_task, function, self.settings, shard, *args)
+            for shard in self.shards
+        ]
+        return events.relay(self.queue, futures)
+
+    def __partition(self):
+        """Shard the shelves on either side, weighed by their notes and pages"""
+        b = self.b
+        weights = {
+            entry.name: 0
+            for entry in b.vault.children()
+            if entry.kind == FOLDER and entry.name not in b.excluded
+        }
+
+        for shelf in b.client.shelves:
+            if shelf.name not in b.excluded:
+                weights.setdefault(shelf.name, 0)
+
+        for entry in b.vault.notes():
+            shelf = entry.path.split("/", 1)[0]
+            if shelf in weights:
+                weights[shelf] += 1
+
+        for page in b.client.pages:
+            if page.book and page.book.shelf and page.book.shelf.name in weights:
+                weights[page.book.shelf.name] += 1
+
+        self.shards = partition(weights, self.jobs)
+
+    def __reload(self):
+        """Pick up the vault index and page links the workers saved"""
+        b = self.b
+        b.vault = Vault(b.path, b.ignore)
+        b.vault.load()
+        b.page_links = PageLinks(b.client.base_url, b.vault.path)
+        b.page_links.load()
+        b._refresh()
+
+    def scan(self):
+        """Scan the top of the vault here and each shard's shelves in its own process"""
+        b = self.b
+
+        with tracer.span("scan vault"):
+            changes = b.vault.scan([])
+            b.vault.save()
+            self.__partition()
+            changes += sum(self.__run(_scan))
+            self.__reload()
+
+        if b.verbose:
+            sizes = ", ".join(str(len(shard)) for shard in self.shards)
+            console.log(f"Vault index updated with {changes} changes")
+            console.log(f"Syncing shelves in shards of {sizes}")
+
+    def sync_local(self):
+        """Pull each shard's shelves in its own process"""
+        b = self.b
+        b.journal.start("local")
+
+        with events.phase(
+            "local",
+            "Downloading any missing files...",
+            total=len(b.client.pages),
+            kind="page",
+        ):
+            moves = b._detect_moves()
+            self.__run(_pull, b.journal.runs["local"], {id for id, _ in moves.values()})
+            self.__reload()
+
+        b.journal.finish("local")
+
+    def sync_remote(self):
+        """Push each shard's shelves in its own process, then shelve the new books and
+        relink the new pages here, since both can span shards"""
+        b = self.b
+        notes = sum(1 for _ in b._notes())
+        b.journal.start("remote")
+
+        with events.phase(
+            "remote", "Uploading missing files to remote...", total=notes, kind="page"
+        ):
+            moves = b._detect_moves()
+            results = self.__run(_push, b.journal.runs["remote"], moves)
+            self.__reload()
+
+            # the crawl predates the pages the workers created, their links know them
+            for id, (path, _) in b.page_links.links.items():
+                b.link_index._add(path[: -len(".md")], id)
+
+            shelf_books: Dict[str, list] = {}
+            unresolved_pages: List[Tuple[str, int]] = []
+            for books, pages in results:
+                shelf_books.update(books)
+                unresolved_pages += pages
+
+            b._finish_push(shelf_books, unresolved_pages)
+
+        b.journal.finish("remote")
@@ -1,4 +1,5 @@
 import os
+from typing import Dict
 
 import toml
 from dotenv import load_dotenv
@@ -6,14 +7,31 @@ from dotenv import load_dotenv
 from .sqllite import DatabaseFunctions as dbf
 
 
+def env_path(env: str) -> str:
+    """The env file a command loads, the last used one if none is given"""
+    if env:
+        return os.path.expanduser(env)
+
+    return dbf.select_env() or ".env"
+
+
+def config_path(conf_path: str) -> str:
+    """The config file a command loads, the last used or the default one if none is
+    given"""
+    if conf_path:
+        return conf_path
+
+    if conf := dbf.select_config():
+        return conf
+
+    USER = os.environ["USER"]
+    path = f"/home/{USER}/.config/obsidian_to_bookstack"
+    return os.path.join(path, "conf.toml")
+
+
 def load_env(env: str):
     """Load environment vars"""
-
-    if env:
-        ENV_PATH = os.path.expanduser(env)
-    else:
-        loaded_env = dbf.select_env()
-        ENV_PATH = loaded_env or ".env"
+    ENV_PATH = env_path(env)
 
     try:
         dbf.update_env(ENV_PATH)
@@ -29,17 +47,19 @@ def load_toml(conf_path: str):
     """Try to load config"""
 
     if not conf_path:
-        if conf := dbf.select_config():
-            conf_path = conf
-            dbf.update_config(conf_path)
-        else:
-            USER = os.environ["USER"]
-            path = f"/home/{USER}/.config/obsidian_to_bookstack"
-            conf_path = os.path.join(path, "conf.toml")
-            dbf.update_config(conf_path)
+        conf_path = config_path(conf_path)
+        dbf.update_config(conf_path)
 
     try:
         with open(conf_path, "r") as t:
             return toml.load(t)
     except:
         print("Couldn't load 'conf.toml'")
+
+
+def load_ignore(excluded: Dict) -> Dict:
+    """Ignore patterns and the note size limit from an `excluded` table"""
+    return {
+        "patterns": list(excluded.get("patterns", [])),
+        "max_size": int(excluded.get("max_size", 0)),
+    }
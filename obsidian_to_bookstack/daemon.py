@@ -0,0 +1,184 @@
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+import traceback
+from typing import Dict
+
+from .sqllite.DatabaseFunctions import DATA_PATH
+
+SOCKET_PATH = os.path.join(DATA_PATH, "daemon.sock")
+
+# seconds between background refreshes of the remote model, which only pre-warm it,
+# every request brings it up to date itself
+REFRESH_INTERVAL = 60
+
+# commands which change either side, the models are refreshed after them
+WRITES = {"sync", "remote", "local", "update", "delete", "push"}
+
+
+def request(payload: Dict, path: str = SOCKET_PATH) -> Dict | None:
+    """Send a request to a running daemon, None when there isn't one"""
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.connect(path)
+            s.sendall(json.dumps(payload).encode() + b"\n")
+
+            with s.makefile("rb") as f:
+                line = f.readline()
+    except (ConnectionRefusedError, FileNotFoundError):
+        return None  # left behind by a daemon which didn't shut down cleanly
+
+    return json.loads(line) if line else None
+
+
+class Daemon:
+    """Keeps the vault and remote models warm, serving requests over a Unix socket"""
+
+    def __init__(self, bookstack, files: Dict, path: str = SOCKET_PATH) -> None:
+        self.bookstack = bookstack
+        self.files = files  # config and env files it was started with
+        self.path = path
+        # the models aren't thread safe, requests and refreshes take turns
+        self.lock = threading.Lock()
+        self.stale = threading.Event()
+        self.written = False  # a command ran since the models were last rebuilt
+        self.stopped = threading.Event()
+
+    def handle(self, payload: Dict) -> Dict:
+        """Run one request against the warm models"""
+        from .bookstack.constants import BookstackItems, ConflictPolicy
+        from .console import console
+
+        command = payload.get("command")
+        args = payload.get("args", {})
+        b = self.bookstack
+
+        for name, file in self.files.items():
+            if payload.get(name) != file:
+                # started with other settings, the caller runs the command itself
+                return {"served": False}
+
+        if command == "ping":
+            return {
+                "served": True,
+                "ok": True,
+                "pid": os.getpid(),
+                "vault": b.path,
+                "instance": b.client.base_url,
+            }
+
+        if command not in WRITES:
+            return {"served": True, "ok": False, "error": f"Unknown command: {command}"}
+
+        start = time.monotonic()
+
+        with self.lock, console.capture() as capture:
+            # each request is a run of its own, what it reads may have changed since
+            b.client.responses.clear()
+
+            try:
+                if command in ("sync", "remote", "local", "update"):
+                    self.update(scan=True)
+
+                if command in ("sync", "local"):
+                    b.sync_local()
+                if command in ("sync", "remote"):
+                    b.sync_remote()
+                if command == "update":
+                    b.update_remote(
+                        remote=args["remote"],
+                        local=args["local"],
+                        conflicts=ConflictPolicy(args.get("conflicts", "keep-both")),
+                    )
+                if command == "delete":
+                    b.delete(BookstackItems(args["item"]), args["paths"])
+                if command == "push":
+                    b.push(args["paths"])
+
+                ok, error = True, ""
+            except Exception as e:
+                console.log(traceback.format_exc())
+                ok, error = False, str(e) or type(e).__name__
+
+            self.written = True
+
+        self.stale.set()
+
+        return {
+            "served": True,
+            "ok": ok,
+            "error": error,
+            "output": capture.get(),
+            "seconds": time.monotonic() - start,
+        }
+
+    def update(self, scan: bool):
+        """Bring the models up to date, rebuilding them only after a command or when
+        the delta listing, or with `scan` the vault scan, found changes"""
+        b = self.bookstack
+        written, self.written = self.written, False
+
+        if written:
+            b.client.responses.clear()
+            b.client._reload()
+
+        # a delta listing from the cached watermarks, what the background refresh left
+        # for a request to list is small
+        changed = written or b.client._update()
+
+        # cheap when nothing changed, only files whose size or mtime moved are read
+        if scan and b.vault.scan():
+            changed = True
+
+        if changed:
+            b._refresh()
+
+    def refresh(self):
+        """Recrawl what changed remotely, in the background between requests, so the
+        listing each request starts with stays small"""
+        from .console import console
+
+        while not self.stopped.is_set():
+            self.stale.wait(REFRESH_INTERVAL)
+            self.stale.clear()
+
+            with self.lock:
+                try:
+                    self.update(scan=False)
+                except Exception as e:
+                    console.log(f"[red]Refreshing the remote model failed: {e}[/red]")
+
+    def serve_forever(self):
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                line = self.rfile.readline()
+                if not line:
+                    return
+
+                response = daemon.handle(json.loads(line))
+                self.wfile.write(json.dumps(response).encode() + b"\n")
+
+        if os.path.exists(self.path):
+            if request({"command": "ping"}, self.path):
+                raise RuntimeError(f"A daemon is already listening on {self.path}")
+
+            os.remove(self.path)
+
+        server = socketserver.ThreadingUnixStreamServer(self.path, Handler)
+        os.chmod(self.path, 0o600)
+        threading.Thread(target=self.refresh, daemon=True).start()
+
+        try:
+            server.serve_forever()
+        finally:
+            self.stopped.set()
+            server.server_close()
+            os.remove(self.path)
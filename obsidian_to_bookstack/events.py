@@ -0,0 +1,272 @@
+import json
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import IO, Dict, List
+
+from .trace import tracer
+
+# rich is only imported once something is shown, the group callback opens the stream
+# for every command, `--help` included
+
+# seconds between console refreshes and flushes of the event file
+REFRESH_RATE = 0.1
+
+# item actions: created, updated, deleted, skipped, failed for work done on
+# either side, fetched and found for what a remote crawl saw
+
+
+class Phase:
+    """Running totals of one phase, for throughput and ETA"""
+
+    def __init__(self, name: str, label: str, total: int | None, kind: str | None):
+        self.name = name
+        self.label = label
+        self.total = total
+        self.kind = kind  # the item kind `total` counts
+        self.start = time.monotonic()
+        self.done = 0
+        self.bytes = 0
+        self.counts: Dict[str, int] = {}
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+
+    def rate(self) -> float:
+        elapsed = self.elapsed()
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def eta(self) -> float | None:
+        rate = self.rate()
+        if self.total is None or not rate:
+            return None
+
+        return max(self.total - self.done, 0) / rate
+
+
+class JsonLinesSink:
+    """Writes every event as a line of JSON"""
+
+    def __init__(self, file: IO) -> None:
+        self.file = file
+        self.flushed = 0.0
+
+    def emit(self, event: Dict):
+        self.file.write(json.dumps(event) + "\n")
+
+        now = time.monotonic()
+        if event["event"] != "item" or now - self.flushed >= REFRESH_RATE:
+            self.file.flush()
+            self.flushed = now
+
+    def close(self):
+        self.file.flush()
+
+
+class ConsoleSink:
+    """Renders events as a status line, plus batched item lines when verbose"""
+
+    def __init__(self, verbose: bool, status: bool = True) -> None:
+        self.verbose = verbose
+        self.show_status = status
+        self.status = None
+        self.lines: List[str] = []
+        self.rendered = 0.0
+
+    def emit(self, event: Dict, phases: List[Phase]):
+        if event["event"] == "phase_start" and len(phases) == 1 and self.show_status:
+            from .console import console
+
+            self.status = console.status(event["label"])
+            self.status.start()
+
+        if event["event"] == "item" and self.verbose:
+            count = f" x{event['count']}" if event["count"] > 1 else ""
+            name = f": {event['name']}" if event["name"] else ""
+            self.lines.append(f"{event['action']} {event['kind']}{count}{name}")
+
+        now = time.monotonic()
+        if event["event"] != "item" or now - self.rendered >= REFRESH_RATE:
+            self.render(phases)
+            self.rendered = now
+
+        if event["event"] == "phase_end" and not phases and self.status:
+            self.status.stop()
+            self.status = None
+
+    def render(self, phases: List[Phase]):
+        if self.lines:
+            from .console import console
+
+            # one write for the whole batch, rather than a log call per item
+            console.print("\n".join(self.lines), markup=False, highlight=False)
+            self.lines = []
+
+        if not self.status or not phases:
+            return
+
+        phase = phases[-1]
+        text = phases[0].label
+
+        if phase.done:
+            progress = f"{phase.done}/{phase.total}" if phase.total else f"{phase.done}"
+            text += f" {phase.kind or phase.name} {progress}, {phase.rate():.1f}/s"
+
+            if (eta := phase.eta()) is not None:
+                text += f", ETA {int(eta) // 60}m{int(eta) % 60:02d}s"
+
+        self.status.update(text)
+
+    def close(self):
+        self.render([])
+
+
+class EventStream:
+    """Progress events of a run, fanned out to a JSON lines file and the console"""
+
+    def __init__(self) -> None:
+        self.json: JsonLinesSink | None = None
+        self.console: ConsoleSink | None = None
+        self.phases: List[Phase] = []
+        self.lock = threading.Lock()
+        self.queue = None  # where a worker process sends its items
+
+    def open(self, file: IO | None, verbose: bool, status: bool = True):
+        """Start emitting, to `file` as JSON lines when given"""
+        self.json = JsonLinesSink(file) if file else None
+        self.console = ConsoleSink(verbose, status)
+
+    def forward(self, queue):
+        """Send items to the process which started this one, rather than emitting them.
+        It records them in its own phases, in the order they arrive."""
+        self.queue = queue
+
+    def relay(self, source, futures: List) -> List:
+        """Record the items worker processes forward to `source` as they arrive, each
+        worker marking the end of its task with None, and return the tasks' results"""
+        finished = 0
+
+        while finished < len(futures):
+            try:
+                item = source.get(timeout=REFRESH_RATE)
+            except queue.Empty:
+                # a worker which died never marks its end
+                if all(f.done() for f in futures) and any(
+                    f.exception() for f in futures
+                ):
+                    break
+                continue
+
+            if item is None:
+                finished += 1
+            else:
+                self.item(*item)
+
+        return [future.result() for future in futures]
+
+    def close(self):
+        for sink in (self.json, self.console):
+            if sink:
+                sink.close()
+
+    def __emit(self, event: Dict):
+        event["t"] = time.time()
+
+        if self.json:
+            self.json.emit(event)
+        if self.console:
+            self.console.emit(event, self.phases)
+
+    @contextmanager
+    def phase(
+        self,
+        name: str,
+        label: str = "",
+        total: int | None = None,
+        kind: str | None = None,
+    ):
+        """Time a step of the run, `total` items of `kind` are expected during it"""
+        phase = Phase(name, label or name, total, kind)
+
+        with self.lock:
+            self.phases.append(phase)
+            self.__emit(
+                {
+                    "event": "phase_start",
+                    "phase": name,
+                    "label": phase.label,
+                    "total": total,
+                }
+            )
+
+        try:
+            with tracer.span(name, label=phase.label):
+                yield phase
+        finally:
+            with self.lock:
+                self.phases.remove(phase)
+                self.__emit(
+                    {
+                        "event": "phase_end",
+                        "phase": name,
+                        "seconds": phase.elapsed(),
+                        "counts": phase.counts,
+                        "bytes": phase.bytes,
+                    }
+                )
+
+    def item(
+        self,
+        action: str,
+        kind: str,
+        name: str = "",
+        bytes: int = 0,
+        count: int = 1,
+        error: str = "",
+    ):
+        """Record work on `count` items, every phase running counts it"""
+        if not count:
+            return
+
+        if self.queue is not None:
+            self.queue.put((action, kind, name, bytes, count, error))
+            return
+
+        with self.lock:
+            for phase in self.phases:
+                phase.counts[action] = phase.counts.get(action, 0) + count
+                phase.bytes += bytes
+
+                if phase.kind in (None, kind):
+                    phase.done += count
+
+            event = {
+                "event": "item",
+                "action": action,
+                "kind": kind,
+                "name": name,
+                "count": count,
+                "bytes": bytes,
+            }
+
+            if error:
+                event["error"] = error
+
+            if self.phases:
+                phase = self.phases[-1]
+                event.update(
+                    {
+                        "phase": phase.name,
+                        "done": phase.done,
+                        "total": phase.total,
+                        "rate": phase.rate(),
+                        "bytes_rate": phase.bytes / max(phase.elapsed(), 1e-9),
+                        "eta": phase.eta(),
+                    }
+                )
+
+            self.__emit(event)
+
+
+events = EventStream()
@@ -0,0 +1,184 @@
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, urlsplit
+
+WEBHOOK_PATH = "/webhook"
+
+# a burst of events is applied together, once none arrived for QUIET seconds,
+# or MAX_DELAY seconds after its first if they keep coming
+QUIET = 2.0
+MAX_DELAY = 10.0
+
+# Bookstack's payloads are small, anything larger isn't one
+MAX_PAYLOAD = 1 << 20
+
+
+def content_length(header: str | None) -> int | None:
+    """A request's body size, None unless the header is a plain count of bytes"""
+    if header is None:
+        return 0
+
+    # int() would also take signs, spaces and underscores
+    if not header.isascii() or not header.isdigit():
+        return None
+
+    return int(header)
+
+
+def parse_event(payload) -> Dict | None:
+    """The audit log event a webhook payload reports, None if it isn't one"""
+    from .bookstack.collectors.remote.RemoteAuditLogCollector import AUDIT_LOG_ITEMS
+
+    if not isinstance(payload, dict) or not isinstance(payload.get("event"), str):
+        return None
+
+    item = payload.get("related_item")
+    if not isinstance(item, dict) or not isinstance(item.get("id"), int):
+        return None
+
+    if payload["event"].partition("_")[0] not in AUDIT_LOG_ITEMS:
+        return None
+
+    return {"type": payload["event"], "loggable_id": item["id"]}
+
+
+class Listener:
+    """Receives Bookstack's webhooks and pulls the items they report into the vault,
+    applying each burst of events at once"""
+
+    def __init__(self, bookstack, token: str) -> None:
+        self.bookstack = bookstack
+        self.token = token
+        self.pending: List[Dict] = []
+        self.first = 0.0  # when the oldest pending event arrived
+        self.last = 0.0
+        self.arrived = threading.Condition()
+        self.stopped = threading.Event()
+
+    def authorized(self, path: str) -> bool:
+        """Whether a request's URL carries the token, as a query or path segment"""
+        url = urlsplit(path)
+
+        if url.path.startswith(WEBHOOK_PATH + "/"):
+            token = url.path[len(WEBHOOK_PATH) + 1 :]
+        elif url.path == WEBHOOK_PATH:
+            token = parse_qs(url.query).get("token", [""])[0]
+        else:
+            return False
+
+        # compared as bytes, strings are only comparable when they're ASCII
+        return hmac.compare_digest(token.encode(), self.token.encode())
+
+    def receive(self, event: Dict):
+        with self.arrived:
+            now = time.monotonic()
+            if not self.pending:
+                self.first = now
+
+            self.pending.append(event)
+            self.last = now
+            self.arrived.notify()
+
+    def __next_burst(self) -> List[Dict]:
+        """Wait for events, then for them to settle"""
+        with self.arrived:
+            while not self.pending and not self.stopped.is_set():
+                self.arrived.wait(1)
+
+            while not self.stopped.is_set():
+                now = time.monotonic()
+                wait = min(self.last + QUIET, self.first + MAX_DELAY) - now
+
+                if wait <= 0:
+                    break
+
+                self.arrived.wait(wait)
+
+            burst, self.pending = self.pending, []
+            return burst
+
+    def apply(self, burst: List[Dict]):
+        """Refresh the reported items in the remote model, then pull them"""
+        from .console import console
+
+        b = self.bookstack
+
+        # each burst is a run of its own, what it reads may have changed since
+        b.client.responses.clear()
+
+        try:
+            updated, removed = b.client.audit_log_collector.replay(burst)
+            b.client._reload()
+
+            # cheap when nothing changed, only files whose size or mtime moved are read
+            b.vault.scan()
+            b._refresh()
+            b.apply_remote(updated, removed)
+        except Exception as e:
+            console.log(traceback.format_exc())
+            console.log(f"[red]Applying {len(burst)} events failed: {e}[/red]")
+
+    def work(self):
+        while not self.stopped.is_set():
+            if burst := self.__next_burst():
+                self.apply(burst)
+
+    def serve_forever(self, host: str, port: int):
+        listener = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if not listener.authorized(self.path):
+                    self.send_error(403)
+                    return
+
+                length = content_length(self.headers.get("Content-Length"))
+                if length is None:
+                    self.send_error(400, "Bad Content-Length")
+                    return
+                if length > MAX_PAYLOAD:
+                    self.send_error(413)
+                    return
+
+                try:
+                    event = parse_event(json.loads(self.rfile.read(length)))
+                except ValueError:
+                    self.send_error(400, "Not JSON")
+                    return
+
+                # tests and events about other items are acknowledged all the same
+                if event:
+                    listener.receive(event)
+
+                self.send_response(202 if event else 200)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        worker = threading.Thread(target=self.work, daemon=True)
+        worker.start()
+
+        try:
+            server.serve_forever()
+        finally:
+            self.stopped.set()
+            server.server_close()
+
+            with self.arrived:
+                self.arrived.notify()
+
+            worker.join()
+
+
+def webhook_token(token: str | None) -> str:
+    """The token webhooks must carry, a new one each start if none is configured"""
+    return token or os.getenv("BOOKSTACK_WEBHOOK_TOKEN") or secrets.token_urlsafe(16)
@@ -1,4 +1,257 @@
+import hashlib
+import json
+import os
+import sys
+from typing import Dict, List
+
+from ..sqllite import DatabaseFunctions as dbf
+from .ignore import IgnoreRules
+
+NOTE = "note"
+FOLDER = "folder"
+ATTACHMENT = "attachment"
+
+
+class VaultEntry:
+    """Metadata of a single file or folder in the vault"""
+
+    __slots__ = ("path", "kind", "size", "mtime", "hash", "frontmatter")
+
+    def __init__(
+        self,
+        path: str,
+        kind: str,
+        size: int = 0,
+        mtime: float = 0.0,
+        hash: str = "",
+        frontmatter: Dict | None = None,
+    ) -> None:
+        self.path = path  # relative to the vault, "/" separated
+        self.kind = kind
+        self.size = size
+        self.mtime = mtime
+        self.hash = hash
+        self.frontmatter = frontmatter or {}
+
+    def __str__(self) -> str:
+        return self.path
+
+    @property
+    def name(self) -> str:
+        return self.path.rsplit("/", 1)[-1]
+
+
+def parse_frontmatter(content: bytes) -> Dict:
+    """Parse simple `key: value` and `- item` YAML frontmatter"""
+    if not content.startswith(b"---\n"):
+        return {}
+
+    end = content.find(b"\n---", 4)
+    if end == -1:
+        return {}
+
+    frontmatter = {}
+    key = None
+
+    for line in content[4:end].decode(errors="replace").splitlines():
+        if line.lstrip().startswith("- ") and key:
+            if not isinstance(frontmatter[key], list):
+                frontmatter[key] = []
+            frontmatter[key].append(line.strip()[2:].strip().strip("\"'"))
+        elif ":" in line and not line.startswith(" "):
+            key, _, value = line.partition(":")
+            key = key.strip()
+            frontmatter[key] = value.strip().strip("\"'")
+
+    return frontmatter
+
+
 class Vault:
-    def __init__(self, shelves=None, path=None) -> None:
-        self.shelves = shelves
-        self.path = path
+    """In-memory index of an Obsidian Vault's notes, folders and attachments.
+    `ignore` takes the configured ignore `patterns` and `max_size`."""
+
+    def __init__(self, path: str, ignore: Dict | None = None) -> None:
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.ignore = IgnoreRules(self.path, **(ignore or {}))
+        self.entries: Dict[str, VaultEntry] = {}
+        self.tree: Dict[str, Dict[str, VaultEntry]] = {"": {}}
+        self._dirty: set[str] = set()
+        self._removed: set[str] = set()
+
+    def relpath(self, path: str) -> str:
+        """Index key of an absolute or vault relative path"""
+        if os.path.isabs(path):
+            path = os.path.relpath(path, self.path)
+
+        path = path.replace(os.sep, "/")
+        return "" if path == "." else path
+
+    def abspath(self, key: str) -> str:
+        return os.path.join(self.path, *key.split("/"))
+
+    def get(self, path: str) -> VaultEntry | None:
+        return self.entries.get(self.relpath(path))
+
+    def children(self, path: str = "") -> List[VaultEntry]:
+        """Entries directly inside a folder"""
+        return list(self.tree.get(self.relpath(path), {}).values())
+
+    def notes(self) -> List[VaultEntry]:
+        return [entry for entry in self.entries.values() if entry.kind == NOTE]
+
+    def folders(self) -> List[VaultEntry]:
+        return [entry for entry in self.entries.values() if entry.kind == FOLDER]
+
+    def attachments(self) -> List[VaultEntry]:
+        return [entry for entry in self.entries.values() if entry.kind == ATTACHMENT]
+
+    def load(self):
+        """Load the index saved by a previous run"""
+        for row in dbf.select_vault_entries(self.path):
+            path, kind, size, mtime, hash, frontmatter = row
+            # interned, so page links loaded from their own rows share the strings
+            path, kind, hash = sys.intern(path), sys.intern(kind), sys.intern(hash)
+            self.__add(VaultEntry(path, kind, size, mtime, hash, json.loads(frontmatter)))
+
+    def save(self):
+        """Persist entries changed since the last save"""
+        dbf.update_vault_entries(
+            self.path,
+            [
+                (
+                    entry.path,
+                    entry.kind,
+                    entry.size,
+                    entry.mtime,
+                    entry.hash,
+                    json.dumps(entry.frontmatter),
+                )
+                for entry in (self.entries[key] for key in self._dirty)
+            ],
+            list(self._removed),
+        )
+        self._dirty = set()
+        self._removed = set()
+
+    def scan(self, folders: List[str] | None = None) -> int:
+        """Walk the vault, only rereading files whose size or mtime changed. Returns the number of changes.
+        With `folders`, only those top level folders are walked below the top level.
+        Ignored files are never read, ignored folders never descended into."""
+
+        def walked(key: str) -> bool:
+            return folders is None or "/" not in key or key.split("/", 1)[0] in folders
+
+        seen = set()
+        changes = 0
+        stack = [""]
+        self.ignore.reset()  # ignore files may have changed since the last scan
+
+        while stack:
+            folder = stack.pop()
+
+            with os.scandir(self.abspath(folder) if folder else self.path) as it:
+                for item in it:
+                    key = f"{folder}/{item.name}" if folder else item.name
+                    is_dir = item.is_dir()
+                    stat = item.stat()
+
+                    if self.ignore.ignored(key, is_dir, stat.st_size):
+                        continue
+
+                    seen.add(key)
+
+                    if is_dir and (folders is None or folder or key in folders):
+                        stack.append(key)
+
+                    if self.__update(key, stat, is_dir):
+                        changes += 1
+
+        for key in [key for key in self.entries if key not in seen and walked(key)]:
+            self.remove(key)
+            changes += 1
+
+        return changes
+
+    def update(self, path: str) -> VaultEntry | None:
+        """Reindex a single file or folder after it was written, removed or renamed"""
+        key = self.relpath(path)
+
+        try:
+            stat = os.stat(self.abspath(key))
+        except FileNotFoundError:
+            self.remove(key)
+            return None
+
+        is_dir = os.path.isdir(self.abspath(key))
+
+        if self.ignore.excludes(key, is_dir, stat.st_size):
+            self.remove(key)
+            return None
+
+        self.__update(key, stat, is_dir)
+        return self.entries[key]
+
+    def remove(self, path: str):
+        """Drop a file or folder, and everything under it, from the index"""
+        key = self.relpath(path)
+        entry = self.entries.pop(key, None)
+
+        if entry is None:
+            return
+
+        parent, _, name = key.rpartition("/")
+        self.tree.get(parent, {}).pop(name, None)
+        self._dirty.discard(key)
+        self._removed.add(key)
+
+        for child in list(self.tree.pop(key, {}).values()):
+            self.remove(child.path)
+
+    def __update(self, key: str, stat: os.stat_result, is_dir: bool) -> bool:
+        """Refresh an entry from its stat, returns whether anything changed"""
+        entry = self.entries.get(key)
+
+        if is_dir:
+            if entry and entry.kind == FOLDER:
+                return False
+
+            self.__add(VaultEntry(key, FOLDER, mtime=stat.st_mtime))
+            self._dirty.add(key)
+            return True
+
+        if entry and entry.kind == FOLDER:
+            self.remove(key)
+            entry = None
+
+        if entry and entry.size == stat.st_size and entry.mtime == stat.st_mtime:
+            return False
+
+        kind = NOTE if key.endswith(".md") else ATTACHMENT
+        hash = hashlib.md5()
+        frontmatter = {}
+
+        with open(self.abspath(key), "rb") as f:
+            if kind == NOTE:
+                content = f.read()
+                hash.update(content)
+                frontmatter = parse_frontmatter(content)
+            else:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    hash.update(chunk)
+
+        self.__add(
+            VaultEntry(
+                key, kind, stat.st_size, stat.st_mtime, hash.hexdigest(), frontmatter
+            )
+        )
+        self._dirty.add(key)
+        return True
+
+    def __add(self, entry: VaultEntry):
+        parent, _, name = entry.path.rpartition("/")
+        self.entries[entry.path] = entry
+        self.tree.setdefault(parent, {})[name] = entry
+        self._removed.discard(entry.path)
+
+        if entry.kind == FOLDER:
+            self.tree.setdefault(entry.path, {})
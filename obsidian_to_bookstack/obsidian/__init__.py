@@ -1 +1 @@
-from .Vault import Vault
+from .Vault import Vault, VaultEntry
@@ -0,0 +1,163 @@
+import os
+import re
+from typing import Dict, List
+
+IGNORE_FILE = ".bookstackignore"
+
+# hidden files and folders, like `.obsidian`, unless a rule brings them back
+DEFAULT_PATTERNS = [".*"]
+
+
+class Rule:
+    """One compiled `.gitignore` style pattern, matched against paths below `base`"""
+
+    __slots__ = ("base", "regex", "negate", "dir_only")
+
+    def __init__(self, base: str, regex: re.Pattern, negate: bool, dir_only: bool):
+        self.base = base
+        self.regex = regex
+        self.negate = negate
+        self.dir_only = dir_only
+
+
+def translate(pattern: str) -> str:
+    """Regex matching the same paths as a glob, where only `**` crosses folders"""
+    regex = ""
+    i = 0
+
+    while i < len(pattern):
+        c = pattern[i]
+
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+            continue
+
+        if c == "*":
+            regex += "[^/]*"
+        elif c == "?":
+            regex += "[^/]"
+        elif c == "[" and (end := pattern.find("]", i + 2)) != -1:
+            chars = pattern[i + 1 : end].replace("\\", "\\\\")
+            if chars[0] == "!":
+                chars = "^" + chars[1:]
+            regex += f"[{chars}]"
+            i = end
+        elif c == "\\" and i + 1 < len(pattern):
+            i += 1
+            regex += re.escape(pattern[i])
+        else:
+            regex += re.escape(c)
+
+        i += 1
+
+    return regex
+
+
+def compile_rules(lines: List[str], base: str = "") -> List[Rule]:
+    """Compile ignore patterns written in a folder, `base` being its vault path"""
+    rules = []
+
+    for line in lines:
+        pattern = line.rstrip("\n").rstrip()
+
+        if not pattern or pattern.startswith("#"):
+            continue
+
+        negate = pattern.startswith("!")
+        if negate:
+            pattern = pattern[1:]
+
+        dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+
+        if not pattern:
+            continue
+
+        # patterns holding a slash are relative to their folder, others match any name
+        if "/" in pattern:
+            regex = translate(pattern.lstrip("/"))
+        else:
+            regex = "(?:.*/)?" + translate(pattern)
+
+        rules.append(Rule(base, re.compile(regex, re.DOTALL), negate, dir_only))
+
+    return rules
+
+
+class IgnoreRules:
+    """What syncing leaves alone in a vault: configured patterns, the patterns of each
+    folder's `.bookstackignore`, and notes or attachments over `max_size` bytes.
+    Rules are compiled once per folder and checked before anything is read."""
+
+    def __init__(
+        self, path: str, patterns: List[str] | None = None, max_size: int = 0
+    ) -> None:
+        self.path = path
+        self.max_size = max_size
+        self.rules = compile_rules(DEFAULT_PATTERNS + list(patterns or []))
+        self.__folders: Dict[str, List[Rule]] = {}
+        self.__chains: Dict[str, List[Rule]] = {}
+
+    def reset(self):
+        """Forget the folders' ignore files, they're read again as they're needed"""
+        self.__folders = {}
+        self.__chains = {}
+
+    def __folder_rules(self, folder: str) -> List[Rule]:
+        """Rules of a folder's own ignore file, read the first time they're needed"""
+        if folder not in self.__folders:
+            file = os.path.join(self.path, *folder.split("/"), IGNORE_FILE)
+
+            try:
+                with open(file) as f:
+                    self.__folders[folder] = compile_rules(f.readlines(), folder)
+            except (FileNotFoundError, NotADirectoryError):
+                self.__folders[folder] = []
+
+        return self.__folders[folder]
+
+    def __chain(self, folder: str) -> List[Rule]:
+        """Every rule which applies inside a folder, the most specific last"""
+        if folder not in self.__chains:
+            parent = folder.rpartition("/")[0]
+            rules = self.__chain(parent) if folder else self.rules
+            self.__chains[folder] = rules + self.__folder_rules(folder)
+
+        return self.__chains[folder]
+
+    def too_large(self, size: int) -> bool:
+        return bool(self.max_size) and size > self.max_size
+
+    def ignored(self, key: str, is_dir: bool, size: int = 0) -> bool:
+        """Whether a vault path is ignored by the rules of the folders above it.
+        The folders themselves are assumed walked, see `excludes` otherwise."""
+        if not is_dir and self.too_large(size):
+            return True
+
+        ignored = False
+
+        for rule in self.__chain(key.rpartition("/")[0]):
+            if rule.dir_only and not is_dir:
+                continue
+
+            relative = key[len(rule.base) + 1 :] if rule.base else key
+            if rule.regex.fullmatch(relative):
+                ignored = not rule.negate
+
+        return ignored
+
+    def excludes(self, key: str, is_dir: bool = False, size: int = 0) -> bool:
+        """Whether a vault path is ignored, itself or through a folder above it"""
+        parts = key.split("/")
+
+        for depth in range(1, len(parts)):
+            if self.ignored("/".join(parts[:depth]), True):
+                return True
+
+        return self.ignored(key, is_dir, size)
+
@@ -0,0 +1,159 @@
+import json
+import sqlite3
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Tuple
+
+from .bookstack.constants import MAX_CONNECTIONS
+from .obsidian.Vault import Vault
+from .sqllite import DatabaseFunctions as dbf
+
+# documents written per transaction while indexing
+BATCH_SIZE = 500
+
+
+def _write_batched(docs: Iterable[Tuple]) -> int:
+    """Write documents as they're produced, committing every `BATCH_SIZE`"""
+    batch = []
+    written = 0
+
+    for doc in docs:
+        batch.append(doc)
+
+        if len(batch) >= BATCH_SIZE:
+            dbf.update_search_docs(batch)
+            written += len(batch)
+            batch = []
+
+    if batch:
+        dbf.update_search_docs(batch)
+        written += len(batch)
+
+    return written
+
+
+class SearchIndex:
+    """Full-text index over the vault's notes and the last crawled remote pages"""
+
+    def __init__(self) -> None:
+        dbf.create_search_index_if_not_exists()
+
+    def update_local(self, vault: Vault) -> int:
+        """Reindex notes whose hash changed, returns the number of documents written"""
+        prefix = f"local:{vault.path}:"
+        known = dbf.select_search_fingerprints(prefix)
+        seen = set()
+
+        def docs():
+            for entry in vault.notes():
+                key = prefix + entry.path
+                seen.add(key)
+
+                if known.get(key) == entry.hash:
+                    continue
+
+                with open(vault.abspath(entry.path), "r", errors="replace") as f:
+                    body = f.read()
+
+                parts = entry.path[: -len(".md")].split("/")
+                yield (key, entry.hash, " > ".join(parts), "local", parts[-1], body)
+
+        written = _write_batched(docs())
+        dbf.delete_search_docs([key for key in known if key not in seen])
+        return written
+
+    def update_remote(
+        self,
+        instance: str,
+        bodies: Callable[[Dict, Dict[int, str], List[int]], Dict[int, bytes | None]],
+    ) -> int:
+        """Reindex cached remote pages whose `updated_at` changed. The cache doesn't
+        keep page bodies, `bodies` fetches some of a book's given its record and the
+        names of all its pages, None for any which are gone. A few books are fetched
+        at once."""
+        prefix = f"remote:{instance}:"
+        known = dbf.select_search_fingerprints(prefix)
+        seen = set()
+
+        def names(item_type: str):
+            items = [json.loads(data) for data in dbf.iter_remote_items(instance, item_type)]
+            return {item["id"]: item for item in items}
+
+        shelves = names("shelf")
+        books = names("book")
+        chapters = names("chapter")
+
+        shelf_of_book = {}
+        for shelf in shelves.values():
+            for book in shelf.get("books", []):
+                shelf_of_book[book["id"]] = shelf["name"]
+
+        page_names: Dict[int, Dict[int, str]] = {}
+        stale: Dict[int, List[Dict]] = {}
+
+        for data in dbf.iter_remote_items(instance, "page"):
+            page = json.loads(data)
+            key = f"{prefix}{page['id']}"
+            seen.add(key)
+            page_names.setdefault(page.get("book_id"), {})[page["id"]] = page["name"]
+
+            if known.get(key) != page["updated_at"]:
+                stale.setdefault(page.get("book_id"), []).append(page)
+
+        def ready(pages: List[Dict], future: Future):
+            markdown = future.result()
+            return ((page, markdown[page["id"]]) for page in pages)
+
+        def fetched() -> Iterator[Tuple[Dict, bytes | None]]:
+            with ThreadPoolExecutor(MAX_CONNECTIONS) as pool:
+                window: Deque[Tuple[List[Dict], Future]] = deque()
+
+                for book_id, pages in stale.items():
+                    book = books.get(book_id, {"id": book_id})
+                    ids = [page["id"] for page in pages]
+                    window.append(
+                        (pages, pool.submit(bodies, book, page_names[book_id], ids))
+                    )
+
+                    # bodies of at most this many books are held at once
+                    if len(window) > MAX_CONNECTIONS:
+                        yield from ready(*window.popleft())
+
+                while window:
+                    yield from ready(*window.popleft())
+
+        def docs():
+            for page, markdown in fetched():
+                if markdown is None:
+                    continue  # indexed once it can be fetched
+
+                book = books.get(page.get("book_id"), {})
+                chapter = chapters.get(page.get("chapter_id"), {})
+                parts = [
+                    shelf_of_book.get(book.get("id"), ""),
+                    book.get("name", ""),
+                    chapter.get("name", ""),
+                    page["name"],
+                ]
+
+                yield (
+                    f"{prefix}{page['id']}",
+                    page["updated_at"],
+                    " > ".join(part for part in parts if part),
+                    "remote",
+                    page["name"],
+                    markdown.decode(errors="replace"),
+                )
+
+        written = _write_batched(docs())
+        dbf.delete_search_docs([key for key in known if key not in seen])
+        return written
+
+    def search(self, query: str, limit: int = 20) -> List[Tuple[str, str, str]]:
+        """Ranked (location, source, snippet) hits"""
+        try:
+            return dbf.search(query, limit)
+        except sqlite3.OperationalError:
+            # not valid FTS5 query syntax, search for the words as they are
+            terms = ['"' + term.replace('"', '""') + '"' for term in query.split()]
+            return dbf.search(" ".join(terms), limit)
@@ -1,12 +1,32 @@
+import atexit
 import os
 import sqlite3
+from typing import Iterable, Iterator
 
 DATA_PATH = f"/home/{os.environ.get('USER')}/.config/obsidian_to_bookstack/data"
 
+# one connection per process, opened on first use
+_conn: sqlite3.Connection | None = None
+_conn_pid: int | None = None
+
+
 def connect():
-    conn = sqlite3.connect(f"{DATA_PATH}/settings.db")
-    cursor = conn.cursor()
-    return conn, cursor
+    global _conn, _conn_pid
+
+    if _conn is None or _conn_pid != os.getpid():
+        make_data_folder()
+        # several targets may sync from their own processes at once
+        _conn = sqlite3.connect(
+            f"{DATA_PATH}/settings.db", timeout=30, check_same_thread=False
+        )
+        _conn.execute("PRAGMA journal_mode=WAL;")
+        # commits survive the process dying, only a power loss could undo the last few
+        _conn.execute("PRAGMA synchronous=NORMAL;")
+        _conn_pid = os.getpid()
+        atexit.register(_conn.close)
+        init_db()
+
+    return _conn, _conn.cursor()
 
 
 def make_data_folder():
@@ -15,7 +35,6 @@ def make_data_folder():
 
 
 def create_settings_if_not_exists():
-    make_data_folder()
     conn, cursor = connect()
     cursor.execute(
         f"""
@@ -26,7 +45,6 @@ def create_settings_if_not_exists():
         );
         """
     )
-    conn.close()
 
 
 def select_config() -> str | None:
@@ -39,7 +57,6 @@ def select_config() -> str | None:
     result = cursor.fetchone()
     config = result[0] if result else None
 
-    conn.close()
     return config
 
 
@@ -52,7 +69,6 @@ def select_env() -> str | None:
     )
     result = cursor.fetchone()
     env = result[0] if result else None
-    conn.close()
     return env if env else None
 
 
@@ -71,7 +87,6 @@ def update_config(config: str):
     )
 
     conn.commit()
-    conn.close()
 
 
 def update_env(env: str):
@@ -88,8 +103,421 @@ def update_env(env: str):
         (env,),
     )
     conn.commit()
-    conn.close()
+
+
+def create_remote_cache_if_not_exists():
+    conn, cursor = connect()
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS remote_items (
+            instance TEXT,
+            item_type TEXT,
+            id INTEGER,
+            data TEXT,
+            PRIMARY KEY (instance, item_type, id)
+        );
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sync_state (
+            instance TEXT,
+            item_type TEXT,
+            watermark TEXT,
+            PRIMARY KEY (instance, item_type)
+        );
+        """
+    )
+
+
+def select_remote_items(instance: str, item_type: str) -> Iterator[str]:
+    """Cached items of a type, read as they're iterated"""
+    conn, cursor = connect()
+    cursor.execute(
+        """
+        SELECT data FROM remote_items WHERE instance = ? AND item_type = ?;
+        """,
+        (instance, item_type),
+    )
+    return (row[0] for row in cursor)
+
+
+def replace_remote_items(
+    instance: str,
+    item_type: str,
+    items: Iterable[tuple[int, str]],
+    watermark: str | None,
+):
+    """Replace the cached items of a type and its watermark in one transaction"""
+    conn, cursor = connect()
+    cursor.execute(
+        """
+        DELETE FROM remote_items WHERE instance = ? AND item_type = ?;
+        """,
+        (instance, item_type),
+    )
+    cursor.executemany(
+        """
+        INSERT INTO remote_items (instance, item_type, id, data)
+        VALUES (?, ?, ?, ?);
+        """,
+        ((instance, item_type, id, data) for id, data in items),
+    )
+    cursor.execute(
+        """
+        INSERT OR REPLACE INTO sync_state (instance, item_type, watermark)
+        VALUES (?, ?, ?);
+        """,
+        (instance, item_type, watermark),
+    )
+    conn.commit()
+
+
+def select_watermark(instance: str, item_type: str) -> str | None:
+    conn, cursor = connect()
+    cursor.execute(
+        """
+        SELECT watermark FROM sync_state WHERE instance = ? AND item_type = ?;
+        """,
+        (instance, item_type),
+    )
+    result = cursor.fetchone()
+    return result[0] if result else None
+
+
+def update_watermark(instance: str, item_type: str, watermark: str):
+    conn, cursor = connect()
+    cursor.execute(
+        """
+        INSERT OR REPLACE INTO sync_state (instance, item_type, watermark)
+        VALUES (?, ?, ?);
+        """,
+        (instance, item_type, watermark),
+    )
+    conn.commit()
+
+
+def clear_remote_cache(instance: str):
+    conn, cursor = connect()
+    cursor.execute("DELETE FROM remote_items WHERE instance = ?;", (instance,))
+    cursor.execute("DELETE FROM sync_state WHERE instance = ?;", (instance,))
+    conn.commit()
+
+
+def create_vault_index_if_not_exists():
+    conn, cursor = connect()
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS vault_index (
+            vault TEXT,
+            path TEXT,
+            kind TEXT,
+            size INTEGER,
+            mtime REAL,
+            hash TEXT,
+            frontmatter TEXT,
+            PRIMARY KEY (vault, path)
+        );
+        """
+    )
+
+
+def select_vault_entries(vault: str) -> Iterator[tuple]:
+    """Indexed entries of a vault, read as they're iterated"""
+    conn, cursor = connect()
+    cursor.execute(
+        """
+        SELECT path, kind, size, mtime, hash, frontmatter
+        FROM vault_index WHERE vault = ?;
+        """,
+        (vault,),
+    )
+    return cursor
+
+
+def update_vault_entries(vault: str, entries: list[tuple], removed: list[str]):
+    """Upsert changed entries and delete removed ones in one transaction"""
+    conn, cursor = connect()
+    cursor.executemany(
+        """
+        INSERT OR REPLACE INTO vault_index (vault, path, kind, size, mtime, hash, frontmatter)
+        VALUES (?, ?, ?, ?, ?, ?, ?);
+        """,
+        [(vault, *entry) for entry in entries],
+    )
+    cursor.executemany(
+        """
+        DELETE FROM vault_index WHERE vault = ? AND path = ?;
+        """,
+        [(vault, path) for path in removed],
+    )
+    conn.commit()
+
+
+def create_page_links_if_not_exists():
+    conn, cursor = connect()
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS page_links (
+            instance TEXT,
+            vault TEXT,
+            page_id INTEGER,
+            path TEXT,
+            hash TEXT,
+            updated_at TEXT NOT NULL DEFAULT '',
+            PRIMARY KEY (instance, vault, page_id)
+        );
+        """
+    )
+
+    # links kept before the remote side of a match was recorded
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(page_links);")}
+    if "updated_at" not in columns:
+        cursor.execute(
+            "ALTER TABLE page_links ADD COLUMN updated_at TEXT NOT NULL DEFAULT '';"
+        )
+        conn.commit()
+
+
+def select_page_links(instance: str, vault: str) -> Iterator[tuple]:
+    """Links of a vault's notes to an instance's pages, read as they're iterated"""
+    conn, cursor = connect()
+    cursor.execute(
+        """
+        SELECT page_id, path, hash, updated_at FROM page_links
+        WHERE instance = ? AND vault = ?;
+        """,
+        (instance, vault),
+    )
+    return cursor
+
+
+def update_page_links(
+    instance: str, vault: str, links: list[tuple], removed: list[int]
+):
+    """Upsert changed (page id, path, hash, updated_at) links and delete removed ones
+    in one transaction"""
+    conn, cursor = connect()
+    cursor.executemany(
+        """
+        INSERT OR REPLACE INTO page_links
+            (instance, vault, page_id, path, hash, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?);
+        """,
+        [(instance, vault, *link) for link in links],
+    )
+    cursor.executemany(
+        """
+        DELETE FROM page_links WHERE instance = ? AND vault = ? AND page_id = ?;
+        """,
+        [(instance, vault, id) for id in removed],
+    )
+    conn.commit()
+
+
+def create_journal_if_not_exists():
+    conn, cursor = connect()
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS journal (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            instance TEXT,
+            vault TEXT,
+            run TEXT,
+            phase TEXT,
+            action TEXT,
+            kind TEXT,
+            path TEXT,
+            state TEXT,
+            result TEXT,
+            error TEXT
+        );
+        """
+    )
+
+
+def insert_operation(
+    instance: str, vault: str, run: str, phase: str, action: str, kind: str, path: str
+) -> int:
+    """Journal an operation before it is made, returns its id"""
+    conn, cursor = connect()
+    cursor.execute(
+        """
+        INSERT INTO journal (instance, vault, run, phase, action, kind, path, state)
+        VALUES (?, ?, ?, ?, ?, ?, ?, 'pending');
+        """,
+        (instance, vault, run, phase, action, kind, path),
+    )
+    conn.commit()
+    assert cursor.lastrowid is not None
+    return cursor.lastrowid
+
+
+def update_operation(id: int, state: str, result: str, error: str):
+    conn, cursor = connect()
+    cursor.execute(
+        """
+        UPDATE journal SET state = ?, result = ?, error = ? WHERE id = ?;
+        """,
+        (state, result, error, id),
+    )
+    conn.commit()
+
+
+def select_operations(instance: str, vault: str, phase: str, run: str) -> list[tuple]:
+    """(action, kind, path, state, result) of a phase's operations from earlier runs"""
+    conn, cursor = connect()
+    cursor.execute(
+        """
+        SELECT action, kind, path, state, result FROM journal
+        WHERE instance = ? AND vault = ? AND phase = ? AND run != ?
+        ORDER BY id;
+        """,
+        (instance, vault, phase, run),
+    )
+    return cursor.fetchall()
+
+
+def delete_operations(
+    instance: str, vault: str, phase: str, run: str, replanned: list[str]
+):
+    """Drop a phase's operations, except failures of this run the next can't replan"""
+    conn, cursor = connect()
+    cursor.execute(
+        f"""
+        DELETE FROM journal
+        WHERE instance = ? AND vault = ? AND phase = ? AND (
+            run != ? OR state = 'done'
+            OR action IN ({", ".join("?" for _ in replanned)})
+        );
+        """,
+        (instance, vault, phase, run, *replanned),
+    )
+    conn.commit()
+
+
+def create_search_index_if_not_exists():
+    """Not part of `init_db`, so a sqlite build without FTS5 only breaks `search`"""
+    conn, cursor = connect()
+    cursor.execute(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+            location UNINDEXED,
+            source UNINDEXED,
+            title,
+            body,
+            tokenize = 'unicode61 remove_diacritics 2'
+        );
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS search_state (
+            key TEXT PRIMARY KEY,
+            doc_id INTEGER,
+            fingerprint TEXT
+        );
+        """
+    )
+
+
+def select_search_fingerprints(prefix: str) -> dict[str, str]:
+    conn, cursor = connect()
+    cursor.execute(
+        """
+        SELECT key, fingerprint FROM search_state WHERE substr(key, 1, ?) = ?;
+        """,
+        (len(prefix), prefix),
+    )
+    return dict(cursor.fetchall())
+
+
+def update_search_docs(docs: list[tuple]):
+    """Replace (key, fingerprint, location, source, title, body) documents in one transaction"""
+    conn, cursor = connect()
+    for key, fingerprint, location, source, title, body in docs:
+        cursor.execute(
+            """
+            DELETE FROM search_index
+            WHERE rowid = (SELECT doc_id FROM search_state WHERE key = ?);
+            """,
+            (key,),
+        )
+        cursor.execute(
+            """
+            INSERT INTO search_index (location, source, title, body)
+            VALUES (?, ?, ?, ?);
+            """,
+            (location, source, title, body),
+        )
+        cursor.execute(
+            """
+            INSERT OR REPLACE INTO search_state (key, doc_id, fingerprint)
+            VALUES (?, ?, ?);
+            """,
+            (key, cursor.lastrowid, fingerprint),
+        )
+    conn.commit()
+
+
+def delete_search_docs(keys: list[str]):
+    conn, cursor = connect()
+    for key in keys:
+        cursor.execute(
+            """
+            DELETE FROM search_index
+            WHERE rowid = (SELECT doc_id FROM search_state WHERE key = ?);
+            """,
+            (key,),
+        )
+        cursor.execute("DELETE FROM search_state WHERE key = ?;", (key,))
+    conn.commit()
+
+
+def search(query: str, limit: int) -> list[tuple]:
+    """Ranked (location, source, snippet) hits, titles weigh ten times the body.
+    Matches in a snippet are wrapped in \\x02 and \\x03."""
+    conn, cursor = connect()
+    cursor.execute(
+        """
+        SELECT location, source, snippet(search_index, 3, char(2), char(3), '…', 12)
+        FROM search_index
+        WHERE search_index MATCH ?
+        ORDER BY bm25(search_index, 0.0, 0.0, 10.0, 1.0)
+        LIMIT ?;
+        """,
+        (query, limit),
+    )
+    return cursor.fetchall()
+
+
+def iter_remote_items(instance: str, item_type: str):
+    """Stream cached items of a type without loading them all"""
+    conn, cursor = connect()
+    last = 0
+
+    while True:
+        # in batches, so writes can be committed between them
+        cursor.execute(
+            """
+            SELECT rowid, data FROM remote_items
+            WHERE instance = ? AND item_type = ? AND rowid > ?
+            ORDER BY rowid LIMIT 500;
+            """,
+            (instance, item_type, last),
+        )
+        rows = cursor.fetchall()
+
+        if not rows:
+            return
+
+        for last, data in rows:
+            yield data
 
 
 def init_db():
     create_settings_if_not_exists()
+    create_remote_cache_if_not_exists()
+    create_vault_index_if_not_exists()
+    create_page_links_if_not_exists()
+    create_journal_if_not_exists()
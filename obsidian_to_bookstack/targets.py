@@ -0,0 +1,147 @@
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+from dotenv import load_dotenv
+
+from .config import load_ignore
+
+# what a target's process is told of the command line, it must pickle
+RUN_OPTIONS = ("verbose", "full_crawl", "audit_log", "conflicts")
+
+# what a target's `env` file says of its instance, and nothing else may
+INSTANCE_VARS = ("BOOKSTACK_BASE_URL", "BOOKSTACK_TOKEN_ID", "BOOKSTACK_TOKEN_SECRET")
+
+# where a target's process sends its events, set when it starts
+_queue = None
+
+
+def load_targets(toml: Dict) -> Dict[str, Dict]:
+    """Named targets from `[targets.<name>]`, falling back to `[wiki]` for anything they leave out"""
+    wiki = toml.get("wiki", {})
+    targets = {}
+
+    for name, target in toml.get("targets", {}).items():
+        excluded = target.get("excluded", wiki.get("excluded", {}))
+
+        targets[name] = {
+            "name": name,
+            "path": target.get("path", wiki.get("path")),
+            "excluded": excluded.get("shelves", []),
+            "ignore": load_ignore(excluded),
+            "env": target.get("env"),
+            "base_url": target.get("base_url"),
+        }
+
+    return targets
+
+
+def load_target_env(target: Dict):
+    """Point this process at a target's instance, with only the secrets the target
+    gives, never those of the default `.env` loaded before it"""
+    for name in INSTANCE_VARS:
+        os.environ.pop(name, None)
+
+    if target["env"]:
+        load_dotenv(os.path.expanduser(target["env"]), override=True)
+
+    if target["base_url"]:
+        os.environ["BOOKSTACK_BASE_URL"] = target["base_url"]
+
+
+def run_command(b, command: str, options: Dict):
+    """Run a fanned out command against a built client"""
+    if command in ("sync", "local"):
+        b.sync_local()
+    if command in ("sync", "remote"):
+        b.sync_remote()
+    if command == "update-remote":
+        b.update_remote(remote=True, local=False)
+    if command == "update-local":
+        b.update_remote(remote=False, local=True)
+    if command == "update-both":
+        from .bookstack.constants import ConflictPolicy
+
+        policy = ConflictPolicy(options["conflicts"])
+        b.update_remote(remote=True, local=True, conflicts=policy)
+
+
+def _init_worker(events_queue):
+    global _queue
+    _queue = events_queue
+
+
+def run_target(target: Dict, command: str, options: Dict) -> Dict:
+    """Run a command against one target, in its own process"""
+    from .events import events
+
+    events.forward(_queue)
+
+    try:
+        return _run_target(target, command, options)
+    finally:
+        if _queue:
+            _queue.put(None)
+
+
+def _run_target(target: Dict, command: str, options: Dict) -> Dict:
+    from .bookstack.bookstack import Bookstack
+    from .console import console
+
+    summary = {"target": target["name"], "ok": False, "requests": {}, "error": ""}
+    start = time.monotonic()
+
+    try:
+        load_target_env(target)
+        console.log(
+            f"[bold blue]{target['name']}[/bold blue]: {command} "
+            f"{target['path']} <-> {os.getenv('BOOKSTACK_BASE_URL')}"
+        )
+
+        b = Bookstack(
+            target["path"],
+            target["excluded"],
+            verbose=options["verbose"],
+            full_crawl=options["full_crawl"],
+            audit_log=options["audit_log"],
+            ignore=target["ignore"],
+        )
+        run_command(b, command, options)
+
+        summary["ok"] = True
+        summary["requests"] = dict(b.client.requests)
+    except Exception as e:
+        if options["verbose"]:
+            console.log(traceback.format_exc())
+
+        summary["error"] = str(e) or type(e).__name__
+
+    summary["instance"] = os.getenv("BOOKSTACK_BASE_URL") or ""
+    summary["seconds"] = time.monotonic() - start
+    return summary
+
+
+def fan_out(targets: List[Dict], command: str, options: Dict) -> List[Dict]:
+    """Run a command against every target at once, one process each, recording the
+    items they forward as events of this process"""
+    from .events import events
+
+    settings = {name: options[name] for name in RUN_OPTIONS if name in options}
+
+    # spawned, not forked, so no target shares this process' connections
+    context = multiprocessing.get_context("spawn")
+    events_queue = context.Queue()
+
+    with ProcessPoolExecutor(
+        len(targets),
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(events_queue,),
+    ) as pool:
+        futures = [
+            pool.submit(run_target, target, command, settings) for target in targets
+        ]
+        return events.relay(events_queue, futures)
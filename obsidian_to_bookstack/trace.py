@@ -0,0 +1,152 @@
+import io
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, List
+
+# allocation sites listed per phase with `--profile-memory`
+MEMORY_TOP = 5
+
+
+class Tracer:
+    """Records spans as a Chrome trace, and what phases allocated when asked to"""
+
+    def __init__(self) -> None:
+        self.path: str | None = None
+        self.memory = False
+        self.spans: List[Dict] = []
+        self.threads: Dict[int, str] = {}
+        self.lock = threading.Lock()
+
+    def open(self, path: str | None, memory: bool = False):
+        """Start recording, to `path` when given and allocations when `memory` is"""
+        self.path = path
+        self.memory = memory
+
+        if memory:
+            tracemalloc.start()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path or self.memory)
+
+    @contextmanager
+    def span(self, name: str, cat: str = "phase", **args):
+        """Time a block, anything added to the yielded dict ends up in its args"""
+        if not self.enabled:
+            yield args
+            return
+
+        # only phases are measured, a snapshot per request would dwarf the request
+        snapshot = None
+        if self.memory and cat == "phase":
+            snapshot = tracemalloc.take_snapshot()
+        start = time.perf_counter_ns()
+
+        try:
+            yield args
+        finally:
+            end = time.perf_counter_ns()
+
+            if snapshot:
+                args["allocated"] = self.__report_memory(name, snapshot)
+
+            thread = threading.current_thread()
+            span = {
+                "name": name,
+                "cat": cat,
+                "ph": "X",
+                "ts": start / 1000,
+                "dur": (end - start) / 1000,
+                "pid": os.getpid(),
+                "tid": thread.ident,
+                "args": args,
+            }
+
+            with self.lock:
+                self.spans.append(span)
+                self.threads[thread.ident or 0] = thread.name
+
+    def wrap(self, name: str):
+        """Decorate a function to run in a span"""
+
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def __report_memory(self, name: str, snapshot) -> List[str]:
+        """Log the sites which allocated the most during a phase"""
+        from .console import console
+
+        stats = tracemalloc.take_snapshot().compare_to(snapshot, "lineno")
+        current, peak = tracemalloc.get_traced_memory()
+        top = []
+
+        for stat in stats:
+            frame = stat.traceback[0]
+
+            # skip the snapshots themselves, filtering them first takes longer
+            if frame.filename != tracemalloc.__file__:
+                top.append(f"{stat.size_diff / 1024:+.1f} KiB {frame}")
+            if len(top) == MEMORY_TOP:
+                break
+
+        console.log(
+            f"[bold blue]{name}[/bold blue]: {current / 2**20:.1f} MiB traced, "
+            f"{peak / 2**20:.1f} MiB peak"
+        )
+        for line in top:
+            console.log(f"    {line}", markup=False, highlight=False)
+
+        return top
+
+    def close(self):
+        """Write the trace, it opens in Perfetto or chrome://tracing"""
+        if self.memory:
+            tracemalloc.stop()
+
+        if not self.path:
+            return
+
+        from .console import console
+
+        names = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": os.getpid(),
+                "tid": tid,
+                "args": {"name": name},
+            }
+            for tid, name in self.threads.items()
+        ]
+
+        with open(self.path, "w") as f:
+            json.dump({"traceEvents": names + self.spans, "displayTimeUnit": "ms"}, f)
+
+        console.log(f"Wrote a trace of {len(self.spans)} spans to {self.path}")
+
+
+def print_profile(profiler, limit: int = 25):
+    """Print the functions which took the longest, cumulatively"""
+    import pstats
+
+    from .console import console
+
+    profiler.disable()
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(limit)
+    console.print(stream.getvalue(), markup=False, highlight=False, soft_wrap=True)
+
+
+tracer = Tracer()
@@ -1,5 +1,8 @@
 import hashlib
-from collections.abc import Callable
+import os
+import queue
+import threading
+from collections.abc import Callable, Iterable, Iterator
 
 from .console import console
 
@@ -15,3 +18,59 @@ def with_status(func: Callable, status_message: str):
     """Wrap a function with a status"""
     with console.status(status_message, spinner="pong"):
         return func()
+
+
+def prefetch(items: Iterable, depth: int = 1) -> Iterator:
+    """Produce items on a background thread, at most `depth` ahead of the consumer"""
+    ready = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+    done = object()
+
+    def offer(entry) -> bool:
+        """Wait for room in the queue, unless the consumer went away"""
+        while not stopped.is_set():
+            try:
+                ready.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not offer((item, None)):
+                    return
+
+            offer((done, None))
+        except BaseException as e:
+            offer((done, e))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item, error = ready.get()
+
+            if error is not None:
+                raise error
+            if item is done:
+                return
+
+            yield item
+    finally:
+        # the consumer may stop early, let the producer finish
+        stopped.set()
+        thread.join()
+
+
+def write_atomic(path: str, data: bytes):
+    """Write a file whole or not at all, an interrupted write leaves the old one"""
+    temp = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+
+    with open(temp, "wb") as f:
+        f.write(data)
+
+    os.replace(temp, path)
@@ -0,0 +1,10 @@
+import pytest
+
+from obsidian_to_bookstack.sqllite import DatabaseFunctions as dbf
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """A settings database of the test's own, the real one is left alone"""
+    monkeypatch.setattr(dbf, "DATA_PATH", str(tmp_path / "data"))
+    monkeypatch.setattr(dbf, "_conn", None)
@@ -0,0 +1,65 @@
+from obsidian_to_bookstack.bookstack.catalog import Catalog, changes, epoch
+
+STAMP = "2024-01-01T00:00:00.000000Z"
+
+
+def sides(*rows):
+    """Catalogs of (path, local hash, remote updated_at, seconds local is ahead)"""
+    local, remote = Catalog(), Catalog()
+
+    for id, (path, hash, updated_at, ahead) in enumerate(rows, 1):
+        local.append(path, epoch(STAMP) + ahead, fingerprint=hash)
+        remote.append(path, epoch(STAMP), id, updated_at)
+
+    return local, remote
+
+
+def test_epoch():
+    assert epoch("1970-01-01T00:01:00.000000Z") == 60.0
+
+
+def test_changes_against_bases():
+    local, remote = sides(
+        ("same.md", "h1", STAMP, 0),
+        ("ours.md", "new", STAMP, 0),
+        ("theirs.md", "h3", "2024-02-01T00:00:00.000000Z", 0),
+        ("both.md", "new", "2024-02-01T00:00:00.000000Z", 0),
+    )
+    bases = {
+        1: ("same.md", "h1", STAMP),
+        2: ("ours.md", "h2", STAMP),
+        3: ("theirs.md", "h3", STAMP),
+        4: ("both.md", "h4", STAMP),
+    }
+
+    assert changes(local, remote, bases, 5.0) == ([(1, 1)], [(2, 2)], [(3, 3)])
+
+
+def test_changes_by_time_without_bases():
+    local, remote = sides(
+        ("ahead.md", "a", STAMP, 60),
+        ("behind.md", "b", STAMP, -60),
+        ("close.md", "c", STAMP, 2),
+    )
+
+    ours, theirs, both = changes(local, remote, {}, 5.0)
+
+    assert ours == [(0, 0)]
+    assert theirs == [(1, 1)]
+    assert both == []
+
+
+def test_changes_base_of_another_path():
+    # the note at this path isn't the one the page last matched, times decide
+    local, remote = sides(("moved.md", "new", "2024-02-01T00:00:00.000000Z", 60))
+    bases = {1: ("old.md", "h", STAMP)}
+
+    assert changes(local, remote, bases, 5.0) == ([(0, 0)], [], [])
+
+
+def test_changes_only_joined_paths():
+    local, remote = Catalog(), Catalog()
+    local.append("local only.md", 0.0, fingerprint="h")
+    remote.append("remote only.md", 0.0, 1, STAMP)
+
+    assert changes(local, remote, {}, 5.0) == ([], [], [])
@@ -0,0 +1,162 @@
+import json
+from collections import Counter
+
+from obsidian_to_bookstack.bookstack.client import RemoteClient, ResponseCache
+from obsidian_to_bookstack.bookstack.constants import (
+    BookstackAPIEndpoints,
+    DetailedBookstackLink,
+    RequestType,
+)
+
+
+class Response:
+    def __init__(self, data=None, status: int = 200) -> None:
+        self.status = status
+        self.data = json.dumps(data or {}).encode()
+
+
+class Http:
+    """Answers every request with the JSON it's given for the path, counting them"""
+
+    def __init__(self, responses=None) -> None:
+        self.responses = responses or {}
+        self.made = []
+
+    def request(self, method, url, **kwargs):
+        path = url[len("http://bookstack.test") :]
+        self.made.append((method, path))
+        return Response(self.responses.get(path))
+
+
+class Client:
+    """What `_make_request` reads of a client"""
+
+    _make_request = RemoteClient._make_request
+
+    def __init__(self, http: Http) -> None:
+        self.base_url = "http://bookstack.test"
+        self.headers = {}
+        self.http = http
+        self.requests = Counter()
+        self.responses = ResponseCache()
+
+
+def link(path: str) -> DetailedBookstackLink:
+    class Link(DetailedBookstackLink):
+        LINK = path
+
+    return Link.LINK
+
+
+def cached(responses: ResponseCache, *paths: str) -> ResponseCache:
+    for path in paths:
+        responses.get((path, ()), lambda path=path: Response({"path": path}))
+
+    return responses
+
+
+def kept(responses: ResponseCache):
+    return sorted(path for path, _ in responses.responses)
+
+
+def test_get_once_per_run():
+    client = Client(Http())
+
+    client._make_request(RequestType.GET, link("/api/pages/3"))
+    client._make_request(RequestType.GET, link("/api/pages/3"))
+    client._make_request(RequestType.GET, BookstackAPIEndpoints.PAGES)
+    client._make_request(RequestType.GET, BookstackAPIEndpoints.PAGES)
+
+    assert client.http.made == [("GET", "/api/pages/3"), ("GET", "/api/pages")]
+
+
+def test_exports_not_cached():
+    client = Client(Http())
+    export = link("/api/books/2/export/markdown")
+
+    client._make_request(RequestType.GET, export)
+    client._make_request(RequestType.GET, export)
+
+    assert client.http.made == [("GET", "/api/books/2/export/markdown")] * 2
+    assert kept(client.responses) == []
+
+
+def test_uncached_get():
+    client = Client(Http())
+
+    client._make_request(RequestType.GET, link("/api/books/2"), cache=False)
+    client._make_request(RequestType.GET, link("/api/books/2"))
+
+    assert len(client.http.made) == 2
+    assert kept(client.responses) == ["/api/books/2"]
+
+
+def test_failed_get_retried():
+    responses = ResponseCache()
+    responses.get(("/api/pages/3", ()), lambda: Response(status=500))
+
+    assert kept(responses) == []
+
+
+def test_write_invalidates():
+    client = Client(Http({"/api/pages/3": {"id": 3, "book_id": 2}}))
+    for path in ("/api/pages/3", "/api/books/2", "/api/books/9", "/api/shelves"):
+        client._make_request(RequestType.GET, link(path))
+    client.responses.keep_body(3, b"body")
+
+    client._make_request(RequestType.PUT, link("/api/pages/3"), json={"name": "B"})
+
+    # the page, its book and the audit log, a rename doesn't change other containers
+    assert kept(client.responses) == ["/api/books/9", "/api/shelves"]
+    assert client.responses.body(3) is None
+
+
+def test_invalidate_move_forgets_old_and_new_parents():
+    responses = ResponseCache()
+    page = Response({"id": 3, "book_id": 2, "chapter_id": 4})
+    responses.get(("/api/pages/3", ()), lambda: page)
+    cached(
+        responses,
+        "/api/books/2",
+        "/api/chapters/4",
+        "/api/chapters/5",
+        "/api/chapters/6",
+        "/api/pages",
+        "/api/audit-log",
+    )
+
+    responses.invalidate("/api/pages/3", "PUT", {"chapter_id": 5})
+
+    assert kept(responses) == ["/api/chapters/6"]
+
+
+def test_invalidate_delete_without_details():
+    # where the page was isn't known, every book and chapter may list it
+    responses = cached(
+        ResponseCache(), "/api/books/2", "/api/chapters/4", "/api/shelves/1"
+    )
+
+    responses.invalidate("/api/pages/3", "DELETE")
+
+    assert kept(responses) == ["/api/shelves/1"]
+
+
+def test_invalidate_book_forgets_shelves():
+    responses = cached(ResponseCache(), "/api/shelves/1", "/api/books/1", "/api/pages")
+
+    responses.invalidate("/api/books", "POST", {"name": "B"}, b'{"id": 2}')
+
+    assert kept(responses) == ["/api/books/1", "/api/pages"]
+
+
+def test_release_keeps_bodies():
+    responses = cached(ResponseCache(), "/api/books/2")
+    responses.keep_body(3, b"body")
+
+    responses.release()
+
+    assert kept(responses) == []
+    assert responses.body(3) == b"body"
+
+    responses.forget_bodies([3])
+    assert responses.body(3) is None
@@ -0,0 +1,59 @@
+from obsidian_to_bookstack.bookstack.export import split_export, strip_header
+
+SEQUENCE = [("A", 1, 2), ("B", 2, 2), ("C", 3, 2)]
+
+
+def test_split_export():
+    exported = b"# Book\n\nAbout\n\n# A\n\nintro\n\n# B\n\nreal B\n\n# C\n\nc body"
+
+    assert split_export(exported, SEQUENCE) == {
+        1: b"# A\n\nintro",
+        2: b"# B\n\nreal B",
+        3: b"# C\n\nc body",
+    }
+
+
+def test_split_export_chapter():
+    sequence = [("Chap", None, 0), ("A", 1, 4), ("B", 2, 2)]
+    exported = b"# Book\n\n# Chap\n\nAbout\n\n# A\n\na body\n\n\n\n# B\n\nb body"
+
+    assert split_export(exported, sequence) == {
+        1: b"# A\n\na body",
+        2: b"# B\n\nb body",
+    }
+
+
+def test_split_export_heading_like_next_page():
+    # A quotes B's title as a heading of its own
+    exported = (
+        b"# Book\n\n# A\n\nintro\n\n# B\n\nquoted\n\n# B\n\nreal B\n\n# C\n\nc body"
+    )
+
+    assert split_export(exported, SEQUENCE) == {}
+
+
+def test_split_export_heading_like_own_title():
+    exported = b"# Book\n\n# A\n\nintro\n\n# A\n\nmore\n\n# B\n\nb\n\n# C\n\nc"
+
+    assert split_export(exported, SEQUENCE) == {}
+
+
+def test_split_export_same_names():
+    sequence = [("A", 1, 2), ("A", 2, 2)]
+    exported = b"# Book\n\n# A\n\nfirst\n\n# A\n\nsecond"
+
+    assert split_export(exported, sequence) == {
+        1: b"# A\n\nfirst",
+        2: b"# A\n\nsecond",
+    }
+
+
+def test_split_export_missing_page():
+    exported = b"# Book\n\n# A\n\nintro\n\n# C\n\nc body"
+
+    assert split_export(exported, SEQUENCE) == {}
+
+
+def test_strip_header():
+    assert strip_header(b"# A\n\nintro", "A") == b"intro"
+    assert strip_header(b"intro", "A") == b"intro"
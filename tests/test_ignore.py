@@ -0,0 +1,83 @@
+import re
+
+from obsidian_to_bookstack.obsidian.ignore import IGNORE_FILE, IgnoreRules, translate
+
+
+def matches(pattern: str, path: str) -> bool:
+    return re.fullmatch(translate(pattern), path) is not None
+
+
+def test_translate_star_stays_in_folder():
+    assert matches("*.md", "note.md")
+    assert not matches("*.md", "folder/note.md")
+    assert matches("a?c", "abc")
+    assert not matches("a?c", "a/c")
+
+
+def test_translate_double_star():
+    assert matches("**/draft.md", "draft.md")
+    assert matches("**/draft.md", "a/b/draft.md")
+    assert matches("notes/**", "notes/a/b.md")
+    assert not matches("notes/**", "other/a.md")
+
+
+def test_translate_classes_and_escapes():
+    assert matches("[ab].md", "a.md")
+    assert not matches("[!ab].md", "a.md")
+    assert matches("[!ab].md", "c.md")
+    assert matches("\\*.md", "*.md")
+    assert not matches("\\*.md", "a.md")
+
+
+def test_negation(tmp_path):
+    rules = IgnoreRules(str(tmp_path), ["*.md", "!keep.md"])
+
+    assert rules.ignored("note.md", False)
+    assert not rules.ignored("keep.md", False)
+    assert not rules.ignored("keep.txt", False)
+
+
+def test_dir_only(tmp_path):
+    rules = IgnoreRules(str(tmp_path), ["build/"])
+
+    assert rules.ignored("build", True)
+    assert not rules.ignored("build", False)
+    assert rules.excludes("build/note.md")
+
+
+def test_anchored(tmp_path):
+    rules = IgnoreRules(str(tmp_path), ["/top.md", "a/b.md"])
+
+    assert rules.ignored("top.md", False)
+    assert not rules.ignored("sub/top.md", False)
+    assert rules.ignored("a/b.md", False)
+    assert not rules.ignored("x/a/b.md", False)
+
+    # patterns without a slash match at any depth
+    assert IgnoreRules(str(tmp_path), ["top.md"]).ignored("sub/top.md", False)
+
+
+def test_hidden_by_default(tmp_path):
+    rules = IgnoreRules(str(tmp_path), ["!.keep"])
+
+    assert rules.ignored(".obsidian", True)
+    assert not rules.ignored(".keep", False)
+
+
+def test_folder_ignore_file(tmp_path):
+    (tmp_path / "shelf").mkdir()
+    (tmp_path / "shelf" / IGNORE_FILE).write_text("/private.md\n!*.keep.md\n")
+    rules = IgnoreRules(str(tmp_path), ["*.keep.md"])
+
+    assert rules.ignored("shelf/private.md", False)
+    assert not rules.ignored("private.md", False)
+    assert not rules.ignored("shelf/a.keep.md", False)
+    assert rules.ignored("a.keep.md", False)
+
+
+def test_too_large(tmp_path):
+    rules = IgnoreRules(str(tmp_path), max_size=10)
+
+    assert rules.ignored("big.md", False, 11)
+    assert not rules.ignored("small.md", False, 10)
+    assert not rules.ignored("folder", True, 11)
@@ -0,0 +1,78 @@
+from obsidian_to_bookstack.bookstack.journal import Journal
+
+INSTANCE = "http://bookstack.test"
+VAULT = "/vault"
+
+
+def fail(journal: Journal, phase: str, action: str, path: str):
+    with journal.operation(phase, action, "page", path):
+        raise RuntimeError("HTTP 500")
+
+
+def test_interrupted_run_is_resumed(database):
+    journal = Journal(INSTANCE, VAULT)
+    journal.start("remote")
+
+    with journal.operation("remote", "create", "book", "S/B") as op:
+        op.result = "7"
+    fail(journal, "remote", "create", "S/B/A")
+    # interrupted, `finish` never runs
+
+    resumed = Journal(INSTANCE, VAULT)
+    resumed.start("remote")
+
+    assert resumed.landed("remote", "create", "book") == {"S/B": "7"}
+    assert resumed.unfinished("remote", "create", "page") == {"S/B/A": ""}
+
+
+def test_finish_keeps_failures_not_replanned(database):
+    journal = Journal(INSTANCE, VAULT)
+    journal.start("remote")
+
+    with journal.operation("remote", "create", "page", "S/B/A"):
+        pass
+    fail(journal, "remote", "create", "S/B/C")
+    fail(journal, "remote", "relink", "S/B/D")
+    journal.finish("remote")
+
+    later = Journal(INSTANCE, VAULT)
+    later.start("remote")
+
+    assert later.landed("remote", "create", "page") == {}
+    assert later.unfinished("remote", "create", "page") == {}
+    assert later.unfinished("remote", "relink", "page") == {"S/B/D": ""}
+
+
+def test_nested_phases_keep_their_runs(database):
+    journal = Journal(INSTANCE, VAULT)
+    journal.start("push")
+    push = journal.runs["push"]
+
+    # `push` runs `sync_remote`, which starts a phase of its own
+    journal.start("remote")
+    fail(journal, "remote", "relink", "S/B/A")
+    journal.finish("remote")
+
+    assert journal.runs == {"push": push}
+
+    fail(journal, "push", "relink", "S/B/C")
+    journal.finish("push")
+
+    later = Journal(INSTANCE, VAULT)
+    later.start("push")
+    later.start("remote")
+
+    assert later.unfinished("push", "relink", "page") == {"S/B/C": ""}
+    assert later.unfinished("remote", "relink", "page") == {"S/B/A": ""}
+
+
+def test_joined_run(database):
+    journal = Journal(INSTANCE, VAULT)
+    journal.start("remote")
+    fail(journal, "remote", "relink", "S/B/A")
+
+    # another process joining the run doesn't take its rows for an earlier run's
+    joined = Journal(INSTANCE, VAULT)
+    joined.start("remote", journal.runs["remote"])
+
+    assert joined.unfinished("remote", "relink", "page") == {}
@@ -0,0 +1,45 @@
+from obsidian_to_bookstack.listen import Listener, content_length, parse_event
+
+TOKEN = "s3cret"
+
+
+def test_authorized():
+    listener = Listener(None, TOKEN)
+
+    assert listener.authorized(f"/webhook?token={TOKEN}")
+    assert listener.authorized(f"/webhook/{TOKEN}")
+    assert not listener.authorized("/webhook?token=wrong")
+    assert not listener.authorized("/webhook/wrong")
+    assert not listener.authorized("/webhook")
+    assert not listener.authorized(f"/other?token={TOKEN}")
+    assert not listener.authorized(f"/webhooks/{TOKEN}")
+
+
+def test_authorized_non_ascii():
+    # compared as bytes, a non-ASCII token is refused rather than raising
+    assert not Listener(None, TOKEN).authorized("/webhook/s3crét")
+
+
+def test_parse_event():
+    payload = {"event": "page_update", "related_item": {"id": 4, "name": "A"}}
+
+    assert parse_event(payload) == {"type": "page_update", "loggable_id": 4}
+
+
+def test_parse_event_not_an_item():
+    assert parse_event([]) is None
+    assert parse_event({"event": "page_update"}) is None
+    assert parse_event({"event": 1, "related_item": {"id": 4}}) is None
+    assert parse_event({"event": "page_update", "related_item": {"id": "4"}}) is None
+    assert parse_event({"event": "user_create", "related_item": {"id": 4}}) is None
+
+
+def test_content_length():
+    assert content_length(None) == 0
+    assert content_length("0") == 0
+    assert content_length("512") == 512
+
+
+def test_content_length_malformed():
+    for header in ("", "-1", "+1", " 1", "1_0", "1.0", "0x10", "١٢"):
+        assert content_length(header) is None, header
@@ -0,0 +1,103 @@
+from obsidian_to_bookstack.bookstack.artifacts import Book, Chapter, Page, Shelf
+from obsidian_to_bookstack.bookstack.merkle import Diff, local_tree, remote_tree
+from obsidian_to_bookstack.obsidian import Vault
+
+NOTES = ["S1/B1/A.md", "S1/B1/C1/P.md", "S1/B2/X.md", "S2/B3/Y.md"]
+
+
+class Client:
+    def __init__(self, shelves):
+        self.shelves = shelves
+
+
+def vault(tmp_path) -> Vault:
+    for path in NOTES:
+        file = tmp_path / path
+        file.parent.mkdir(parents=True, exist_ok=True)
+        file.write_text(path)
+
+    v = Vault(str(tmp_path))
+    v.scan()
+    return v
+
+
+def remote(paths) -> Client:
+    """Crawled shelves, books, chapters and pages at vault `paths`"""
+    shelves, books, chapters = {}, {}, {}
+
+    for path in paths:
+        parts = path[: -len(".md")].split("/")
+        shelf = shelves.setdefault(parts[0], Shelf(parts[0]))
+
+        if (book := books.get(tuple(parts[:2]))) is None:
+            book = books[tuple(parts[:2])] = Book(parts[1], shelf=shelf)
+            shelf.books.append(book)
+
+        chapter = None
+        if len(parts) == 4:
+            if (chapter := chapters.get(tuple(parts[:3]))) is None:
+                chapter = Chapter(parts[2], shelf=shelf, book=book)
+                chapters[tuple(parts[:3])] = chapter
+                book.chapters.append(chapter)
+
+        page = Page(parts[-1], shelf=shelf, book=book, chapter=chapter)
+        (chapter or book).pages.append(page)
+        if chapter:
+            book.pages.append(page)
+
+    return Client(list(shelves.values()))
+
+
+def diff(tmp_path, paths) -> Diff:
+    return Diff(local_tree(vault(tmp_path), []), remote_tree(remote(paths), []))
+
+
+def test_same_everywhere(tmp_path):
+    d = diff(tmp_path, NOTES)
+
+    assert d.same()
+    assert d.same("S1", "B1", "C1")
+
+
+def test_same_settled_at_the_shelf(tmp_path):
+    d = diff(tmp_path, NOTES[:3] + ["S2/B3/Z.md"])
+
+    assert not d.same()
+    assert d.same("S1")
+    assert d.same("S1", "B1")
+    assert not d.same("S2")
+    assert not d.same("S2", "B3")
+
+
+def test_same_below_a_changed_chapter(tmp_path):
+    d = diff(tmp_path, ["S1/B1/A.md", "S1/B1/C1/Q.md"] + NOTES[2:])
+
+    assert not d.same("S1")
+    assert not d.same("S1", "B1")
+    assert not d.same("S1", "B1", "C1")
+    assert d.same("S1", "B2")
+    assert d.same("S2", "B3")
+
+
+def test_same_page_moved_into_a_chapter(tmp_path):
+    # the same names, one level apart
+    d = diff(tmp_path, ["S1/B1/C1/A.md", "S1/B1/C1/P.md"] + NOTES[2:])
+
+    assert not d.same("S1", "B1")
+    assert not d.same("S1", "B1", "C1")
+
+
+def test_same_missing_subtree(tmp_path):
+    d = diff(tmp_path, NOTES[:3])
+
+    assert not d.same("S2")
+    assert not d.same("S3")
+
+
+def test_pages(tmp_path):
+    d = diff(tmp_path, NOTES)
+
+    assert d.pages() == 4
+    assert d.pages("S1") == 3
+    assert d.pages("S1", "B1", "C1") == 1
+    assert d.pages("S3") == 0
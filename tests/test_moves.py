@@ -0,0 +1,99 @@
+from obsidian_to_bookstack.bookstack.moves import PageLinks, detect_moves
+from obsidian_to_bookstack.obsidian import Vault
+
+INSTANCE = "http://bookstack.test"
+
+
+def linked(tmp_path, notes):
+    """A vault of `notes`, each linked to a page numbered in order"""
+    (tmp_path / "vault").mkdir()
+
+    for path, content in notes.items():
+        file = tmp_path / "vault" / path
+        file.parent.mkdir(parents=True, exist_ok=True)
+        file.write_text(content)
+
+    vault = Vault(str(tmp_path / "vault"))
+    vault.scan()
+    links = PageLinks(INSTANCE, vault.path)
+
+    for id, path in enumerate(notes, 1):
+        links.set(id, path, vault.get(path).hash)
+
+    return vault, links
+
+
+def notes(vault):
+    return [entry.path for entry in vault.notes()]
+
+
+def test_unchanged(tmp_path):
+    vault, links = linked(tmp_path, {"S/B/A.md": "a"})
+
+    assert detect_moves(links, vault, {1: "S/B/A.md"}, notes(vault)) == ([], [])
+
+
+def test_moved_remotely(tmp_path):
+    vault, links = linked(tmp_path, {"S/B/A.md": "a"})
+
+    remote_moves, local_moves = detect_moves(
+        links, vault, {1: "S/Other/A.md"}, notes(vault)
+    )
+
+    assert remote_moves == []
+    assert local_moves == [(1, "S/B/A.md", "S/Other/A.md")]
+
+
+def test_moved_locally(tmp_path):
+    vault, links = linked(tmp_path, {"S/B/A.md": "a"})
+    folder = tmp_path / "vault" / "S" / "B"
+    (folder / "A.md").rename(folder / "C.md")
+    vault.scan()
+
+    remote_moves, local_moves = detect_moves(
+        links, vault, {1: "S/B/A.md"}, notes(vault)
+    )
+
+    assert remote_moves == [(1, "S/B/A.md", "S/B/C.md")]
+    assert local_moves == []
+
+
+def test_moved_locally_ambiguous(tmp_path):
+    vault, links = linked(tmp_path, {"S/B/A.md": "same"})
+    folder = tmp_path / "vault" / "S" / "B"
+    (folder / "A.md").unlink()
+    (folder / "C.md").write_text("same")
+    (folder / "D.md").write_text("same")
+    vault.scan()
+
+    # two notes hold what the page had, neither is taken for it
+    assert detect_moves(links, vault, {1: "S/B/A.md"}, notes(vault)) == ([], [])
+
+
+def test_moved_remotely_onto_a_note(tmp_path):
+    vault, links = linked(tmp_path, {"S/B/A.md": "a", "S/B/C.md": "c"})
+    del links.links[2]
+
+    # the note already at the new path is linked instead of being overwritten
+    assert detect_moves(links, vault, {1: "S/B/C.md"}, ["S/B/A.md"]) == ([], [])
+    assert links.links[1] == ("S/B/C.md", vault.get("S/B/C.md").hash)
+
+
+def test_links_pages_in_sync(tmp_path):
+    vault, links = linked(tmp_path, {})
+    (tmp_path / "vault" / "S" / "B").mkdir(parents=True)
+    (tmp_path / "vault" / "S" / "B" / "A.md").write_text("a")
+    vault.scan()
+
+    detect_moves(links, vault, {7: "S/B/A.md"}, notes(vault))
+
+    assert links.links[7] == ("S/B/A.md", vault.get("S/B/A.md").hash)
+
+
+def test_gone_from_both_sides(tmp_path):
+    vault, links = linked(tmp_path, {"S/B/A.md": "a"})
+    (tmp_path / "vault" / "S" / "B" / "A.md").unlink()
+    vault.scan()
+
+    assert detect_moves(links, vault, {}, notes(vault)) == ([], [])
+    assert 1 not in links.links
@@ -0,0 +1,29 @@
+from obsidian_to_bookstack.bookstack.shards import partition
+
+
+def test_partition_balances():
+    weights = {"A": 10, "B": 6, "C": 5, "D": 4}
+
+    assert partition(weights, 2) == [["A", "D"], ["B", "C"]]
+
+
+def test_partition_every_shelf_once():
+    weights = {f"S{i}": i % 7 for i in range(40)}
+    shards = partition(weights, 3)
+
+    assert len(shards) == 3
+    assert sorted(name for shard in shards for name in shard) == sorted(weights)
+
+
+def test_partition_fewer_shelves_than_jobs():
+    assert partition({"A": 3, "B": 1}, 8) == [["A"], ["B"]]
+    assert partition({}, 4) == []
+
+
+def test_partition_empty_shelves_are_spread():
+    # shelves without notes still cost a little, they aren't all piled on one shard
+    assert partition({"A": 0, "B": 0, "C": 0, "D": 0}, 2) == [["A", "C"], ["B", "D"]]
+
+
+def test_partition_ties_by_name():
+    assert partition({"B": 1, "A": 1}, 1) == [["A", "B"]]
@@ -0,0 +1,64 @@
+import multiprocessing
+import os
+import socket
+import sys
+
+BENCHMARKS = os.path.join(os.path.dirname(os.path.dirname(__file__)), "benchmarks")
+sys.path.insert(0, BENCHMARKS)
+
+from sync_memory import serve, stats, sync, write_vault  # noqa: E402
+
+NOTES = 5000
+CAP = 512 * 2**20
+# peaks of runs which hold the same live set still differ by what the allocator keeps
+SLACK = 2 * 2**20
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_sync(context, data: str) -> dict:
+    results = context.Queue()
+    process = context.Process(target=sync, args=(data, CAP, results))
+    process.start()
+    process.join()
+
+    result = results.get() if not results.empty() else {"ok": False}
+    assert result["ok"] and not process.exitcode, result.get("error", process.exitcode)
+    return result
+
+
+def test_second_sync_no_heavier(tmp_path, monkeypatch):
+    vault = str(tmp_path / "vault")
+    write_vault(vault, NOTES)
+
+    with open(tmp_path / "config.toml", "w") as f:
+        f.write(f'[wiki]\npath = "{vault}"\n[wiki.excluded]\nshelves = []\n')
+
+    port = free_port()
+    monkeypatch.setenv("BOOKSTACK_BASE_URL", f"http://127.0.0.1:{port}")
+    monkeypatch.setenv("BOOKSTACK_TOKEN_ID", "test")
+    monkeypatch.setenv("BOOKSTACK_TOKEN_SECRET", "test")
+    monkeypatch.setenv("MALLOC_ARENA_MAX", "2")
+
+    context = multiprocessing.get_context("spawn")
+    ready = context.Event()
+    server = context.Process(target=serve, args=(port, ready), daemon=True)
+    server.start()
+
+    try:
+        ready.wait()
+        first = run_sync(context, str(tmp_path))
+        created = stats(port)
+
+        second = run_sync(context, str(tmp_path))
+        remote = stats(port)
+    finally:
+        server.terminate()
+
+    assert created["pages"] == NOTES
+    assert remote["writes"] == created["writes"]
+    assert second["peak_rss"] <= first["peak_rss"] + SLACK
@@ -0,0 +1,103 @@
+import pytest
+
+from obsidian_to_bookstack.bookstack.artifacts import Book, Page, Shelf
+from obsidian_to_bookstack.bookstack.bookstack import Bookstack
+from obsidian_to_bookstack.bookstack.constants import ConflictPolicy
+from obsidian_to_bookstack.bookstack.journal import Journal
+from obsidian_to_bookstack.bookstack.moves import PageLinks
+from obsidian_to_bookstack.events import events
+from obsidian_to_bookstack.obsidian import Vault
+
+INSTANCE = "http://bookstack.test"
+BEFORE = "2024-01-01T00:00:00.000000Z"
+AFTER = "2024-02-01T00:00:00.000000Z"
+COPY = "Shelf/Book/Both (remote 2024-02-01 0000).md"
+
+
+class PageCollector:
+    """Records the notes pushed and serves the pages' bodies"""
+
+    def __init__(self, bodies):
+        self.bodies = bodies
+        self.pushed = []
+
+    def update_local_content(self, page, client_page):
+        self.pushed.append(client_page.details["id"])
+
+    def update(self, pages):
+        return {page.details["id"]: self.bodies[page.details["id"]] for page in pages}
+
+
+class Client:
+    def __init__(self, pages):
+        self.pages = pages
+
+
+def bookstack(tmp_path) -> Bookstack:
+    """Notes changed locally, remotely and on both sides since they last matched"""
+    folder = tmp_path / "vault" / "Shelf" / "Book"
+    folder.mkdir(parents=True)
+
+    for name in ("Ours", "Theirs", "Both"):
+        (folder / f"{name}.md").write_text(f"{name} as it was\n")
+
+    b = Bookstack.__new__(Bookstack)
+    b.excluded = []
+    b.vault = Vault(str(tmp_path / "vault"))
+    b.vault.scan()
+    b.page_links = PageLinks(INSTANCE, b.vault.path)
+    b.journal = Journal(INSTANCE, b.vault.path, False)
+
+    shelf = Shelf("Shelf")
+    book = Book("Book", shelf=shelf)
+    pages = []
+
+    for id, name in enumerate(("Ours", "Theirs", "Both"), 1):
+        path = f"Shelf/Book/{name}.md"
+        b.page_links.set(id, path, b.vault.get(path).hash, BEFORE)
+
+        updated_at = BEFORE if name == "Ours" else AFTER
+        details = {"id": id, "name": name, "updated_at": updated_at}
+        pages.append(Page(name, book=book, shelf=shelf, details=details))
+
+    for name in ("Ours", "Both"):
+        (folder / f"{name}.md").write_text(f"{name} changed locally\n")
+        b.vault.update(str(folder / f"{name}.md"))
+
+    b.client = Client(pages)
+    b.page_collector = PageCollector(
+        {id: f"page {id} changed remotely\n".encode() for id in (1, 2, 3)}
+    )
+    return b
+
+
+def read(b: Bookstack, path: str) -> str:
+    with open(b.vault.abspath(path)) as f:
+        return f.read()
+
+
+@pytest.mark.parametrize(
+    "policy, pushed, both",
+    [
+        (ConflictPolicy.LOCAL, [1, 3], "Both changed locally\n"),
+        (ConflictPolicy.REMOTE, [1], "page 3 changed remotely\n"),
+        (ConflictPolicy.SKIP, [1], "Both changed locally\n"),
+        (ConflictPolicy.KEEP_BOTH, [1, 3], "Both changed locally\n"),
+    ],
+)
+def test_update_both(tmp_path, database, policy, pushed, both):
+    b = bookstack(tmp_path)
+
+    with events.phase("test") as phase:
+        b.update_remote(remote=True, local=True, conflicts=policy)
+
+    assert b.page_collector.pushed == pushed
+    assert read(b, "Shelf/Book/Theirs.md") == "page 2 changed remotely\n"
+    assert read(b, "Shelf/Book/Both.md") == both
+
+    if policy == ConflictPolicy.KEEP_BOTH:
+        assert read(b, COPY) == "page 3 changed remotely\n"
+    else:
+        assert b.vault.get(COPY) is None
+
+    assert phase.counts.get("conflict", 0) == (policy == ConflictPolicy.SKIP)